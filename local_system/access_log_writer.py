@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL error classes that fail the same way on every retry: data
+# exceptions, integrity violations, syntax and undefined-column errors
+PERMANENT_SQLSTATE_CLASSES = ('22', '23', '42')
+
+
+def is_permanent_error(error):
+    """
+    True when an insert failure will repeat for the same rows: an HTTP 4xx,
+    bad data or a schema mismatch reported by PostgREST. Network errors,
+    timeouts, 5xx and anything unrecognized are worth retrying as they are.
+    """
+    code = getattr(error, 'code', None)
+    if code is None:
+        code = getattr(error, 'status_code', None)
+    if code is None:
+        return False
+    code = str(code)
+    if code.isdigit() and len(code) == 3:
+        # A bare HTTP status (the response was not a PostgREST error body)
+        return code.startswith('4') and code not in ('408', '429')
+    if code.startswith('PGRST'):
+        # PGRST1xx: malformed request, PGRST2xx: column or table not in the schema
+        return code[5:6] in ('1', '2')
+    # Missing privileges fail every row alike, so splitting the batch cannot help
+    return len(code) == 5 and code[:2] in PERMANENT_SQLSTATE_CLASSES and code != '42501'
+
+
+class AccessLogWriter:
+    """
+    Background writer for access-log rows.
+
+    Rows are appended to an on-disk SQLite spool first, so they survive
+    restarts and network outages, then shipped in multi-row inserts once
+    `batch_size` rows are pending or `flush_interval` seconds have passed.
+    Rows leave the spool only after the insert succeeds.
+
+    Transient failures (see `is_permanent`) keep the whole batch for the
+    next retry. A batch rejected for good is split in halves until the
+    rejected rows are isolated, so the rest still go in; a row rejected
+    `max_attempts` times moves to the `dead_access_logs` table.
+    """
+
+    def __init__(self, insert_batch, spool_path, batch_size=50, flush_interval=2.0, retry_interval=30.0,
+                 max_attempts=3, is_permanent=is_permanent_error):
+        self.insert_batch = insert_batch
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.is_permanent = is_permanent
+
+        self._queue = queue.Queue()
+        self._spool_depth = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'rows_enqueued': 0,
+            'rows_flushed': 0,
+            'flushes': 0,
+            'flush_failures': 0,
+            'rows_rejected': 0,
+            'rows_dead_lettered': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Flushes what it can and stops the writer thread."""
+        self._stop.set()
+        self._flush_requested.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def enqueue(self, row):
+        """Queues one row for writing. Never blocks on the network."""
+        self._queue.put(row)
+        with self._metrics_lock:
+            self._metrics['rows_enqueued'] += 1
+        # Wake the writer so the row reaches the spool right away
+        self._flush_requested.set()
+
+    def flush(self):
+        """Asks the writer to ship pending rows now."""
+        self._flush_requested.set()
+
+    def metrics(self):
+        """Queue depth (in memory and spooled) and flush latency in seconds."""
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        snapshot['queue_depth'] = self._queue.qsize()
+        snapshot['spool_depth'] = self._spool_depth
+        return snapshot
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        conn = sqlite3.connect(self.spool_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_access_logs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [info[1] for info in conn.execute("PRAGMA table_info(pending_access_logs)")]
+        if 'attempts' not in columns:
+            # Spool written before rejected rows were counted
+            conn.execute("ALTER TABLE pending_access_logs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_access_logs ("
+            "id INTEGER PRIMARY KEY, row TEXT NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        self._spool_depth = conn.execute("SELECT COUNT(*) FROM pending_access_logs").fetchone()[0]
+        if self._spool_depth:
+            logger.info("Access log spool: %d rows pending from a previous run.", self._spool_depth)
+
+        next_flush = time.monotonic()
+        healthy = True
+        while True:
+            self._flush_requested.wait(max(0.0, next_flush - time.monotonic()))
+            self._flush_requested.clear()
+
+            self._spool(conn)
+            # A full batch only jumps the timer while inserts are succeeding;
+            # during an outage rows wait for the retry interval.
+            due = (
+                time.monotonic() >= next_flush
+                or (healthy and self._spool_depth >= self.batch_size)
+                or self._stop.is_set()
+            )
+            if self._spool_depth and due:
+                healthy = self._ship(conn)
+                next_flush = time.monotonic() + (self.flush_interval if healthy else self.retry_interval)
+            elif not self._spool_depth:
+                next_flush = time.monotonic() + self.flush_interval
+
+            if self._stop.is_set():
+                break
+
+        conn.close()
+
+    def _spool(self, conn):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return
+        conn.executemany(
+            "INSERT INTO pending_access_logs (row) VALUES (?)",
+            [(json.dumps(row),) for row in rows],
+        )
+        conn.commit()
+        self._spool_depth += len(rows)
+
+    def _ship(self, conn):
+        """
+        Sends spooled rows oldest first. Returns False if an insert failed
+        or a row was rejected, so the next attempt waits for the retry interval.
+        """
+        after = 0
+        rejected = 0
+        while True:
+            pending = conn.execute(
+                "SELECT id, row, attempts FROM pending_access_logs WHERE id > ? ORDER BY id LIMIT ?",
+                (after, self.batch_size),
+            ).fetchall()
+            if not pending:
+                break
+            # Rows rejected in this pass stay behind; move past them
+            after = pending[-1][0]
+            try:
+                rejected += self._send(conn, pending)
+            except Exception as e:
+                logger.warning("Error flushing %d access logs (kept in spool): %s", len(pending), e)
+                with self._metrics_lock:
+                    self._metrics['flush_failures'] += 1
+                return False
+        return not rejected
+
+    def _send(self, conn, pending):
+        """
+        Inserts spooled rows, splitting the batch when it is rejected for good.
+        Returns the number of rows rejected and kept; transient errors propagate.
+        """
+        started = time.perf_counter()
+        try:
+            self.insert_batch([json.loads(row) for _, row, _ in pending])
+        except Exception as e:
+            if not self.is_permanent(e):
+                raise
+            if len(pending) == 1:
+                return self._reject(conn, pending[0], e)
+            middle = len(pending) // 2
+            return self._send(conn, pending[:middle]) + self._send(conn, pending[middle:])
+        latency = time.perf_counter() - started
+        metrics.observe('anpr_access_log_flush_seconds', latency)
+
+        conn.executemany("DELETE FROM pending_access_logs WHERE id = ?", [(row_id,) for row_id, _, _ in pending])
+        conn.commit()
+        self._spool_depth -= len(pending)
+
+        with self._metrics_lock:
+            self._metrics['rows_flushed'] += len(pending)
+            self._metrics['flushes'] += 1
+            self._metrics['last_flush_latency'] = latency
+            self._metrics['max_flush_latency'] = max(self._metrics['max_flush_latency'], latency)
+        return 0
+
+    def _reject(self, conn, entry, error):
+        """Counts a rejection of one row; dead-letters it after `max_attempts`. Returns 1 if kept."""
+        row_id, row, attempts = entry
+        attempts += 1
+        with self._metrics_lock:
+            self._metrics['rows_rejected'] += 1
+        if attempts < self.max_attempts:
+            logger.warning("Access log row %d rejected (attempt %d of %d): %s",
+                           row_id, attempts, self.max_attempts, error)
+            conn.execute("UPDATE pending_access_logs SET attempts = ? WHERE id = ?", (attempts, row_id))
+            conn.commit()
+            return 1
+
+        logger.error("Access log row %d rejected %d times, moved to dead_access_logs: %s", row_id, attempts, error)
+        conn.execute(
+            "INSERT OR REPLACE INTO dead_access_logs (id, row, error, failed_at) VALUES (?, ?, ?, ?)",
+            (row_id, row, str(error), time.time()),
+        )
+        conn.execute("DELETE FROM pending_access_logs WHERE id = ?", (row_id,))
+        conn.commit()
+        self._spool_depth -= 1
+        metrics.inc('anpr_access_log_dead_letters_total')
+        with self._metrics_lock:
+            self._metrics['rows_dead_lettered'] += 1
+        return 0
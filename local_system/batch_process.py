@@ -0,0 +1,295 @@
+"""
+Headless bulk processing of image folders and video files.
+
+Runs the same detect -> OCR -> classify -> access check steps as the GUI
+over every image (or every Nth video frame), spread across a process pool
+with one set of models per worker. One row per detected plate is streamed
+to a CSV or Parquet file as results arrive.
+
+    python batch_process.py captures/ --output results.csv
+    python batch_process.py clips/gate.mp4 --every 5 --workers 2 --output results.parquet
+
+Vehicles are fetched from Supabase once and shared with the workers, so the
+access decisions match the live system. Nothing is written to access_logs
+unless --log-access is given.
+"""
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import time
+
+import cv2
+
+import config
+from telemetry import configure_logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+MAX_GRAB_GAP = 60  # Frames to read through before seeking is cheaper (about one keyframe interval)
+
+FIELDS = [
+    'source', 'frame', 'plate_index', 'x1', 'y1', 'x2', 'y2', 'plate_confidence',
+    'plate_text', 'ocr_confidence', 'color', 'color_confidence', 'make', 'make_confidence',
+    'access_granted', 'message', 'elapsed_ms',
+]
+
+# Models of the current worker process, built once by _init_worker
+_worker = {}
+
+
+def build_work(inputs, every=1, chunk_size=None):
+    """
+    Splits images and video frames into chunks of work. Each chunk is a list
+    of (path, frame_index) pairs; frame_index is None for still images.
+    """
+    chunk_size = chunk_size or config.PLATE_BATCH_SIZE
+    items = []
+    for path in inputs:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            items.extend(
+                (os.path.join(path, name), None) for name in names
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            capture = cv2.VideoCapture(path)
+            frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+            items.extend((path, index) for index in range(0, frame_count, every))
+        else:
+            items.append((path, None))
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def _read_frames(chunk):
+    """Loads a chunk's frames, keeping one capture open per video."""
+    frames = []
+    captures = {}
+    positions = {}  # Index of the next frame each capture will return
+    for path, index in chunk:
+        if index is None:
+            frame = cv2.imread(path)
+        else:
+            capture = captures.get(path)
+            if capture is None:
+                capture = captures[path] = cv2.VideoCapture(path)
+                positions[path] = 0
+            # A chunk's frames are in order, --every apart. Seeking decodes
+            # from the previous keyframe each time, so step over short gaps
+            # with grab() (no colour conversion) and seek only over long ones.
+            gap = index - positions[path]
+            if gap < 0 or gap > MAX_GRAB_GAP:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                for _ in range(gap):
+                    capture.grab()
+            ok, frame = capture.read()
+            positions[path] = index + 1
+            frame = frame if ok else None
+        if frame is None:
+            logger.warning("Could not read %s%s", path, f" frame {index}" if index is not None else "")
+            continue
+        frames.append((path, index, frame))
+    for capture in captures.values():
+        capture.release()
+    return frames
+
+
+def _init_worker(vehicles):
+    from database import load_vehicle_snapshot
+    from recognition.plate_detector import PlateDetector
+    from recognition.ocr_engine import OCREngine
+    from recognition.vehicle_classifier import VehicleClassifier
+
+    configure_logging()
+    load_vehicle_snapshot(vehicles)
+    _worker['detector'] = PlateDetector()
+    _worker['ocr'] = OCREngine()
+    _worker['classifier'] = VehicleClassifier()
+
+
+def process_chunk(chunk):
+    """Runs the full pipeline on one chunk. Returns (chunk size, frames read, result rows)."""
+    from database import check_vehicle_access
+    from recognition.crop_quality import assess_crop
+
+    detector, ocr, classifier = _worker['detector'], _worker['ocr'], _worker['classifier']
+    frames = _read_frames(chunk)
+    if not frames:
+        return len(chunk), 0, []
+
+    started = time.perf_counter()
+    all_boxes = detector.detect_batch([frame for _, _, frame in frames])
+    detect_ms = (time.perf_counter() - started) * 1000 / len(frames)
+
+    rows = []
+    for (path, index, frame), boxes in zip(frames, all_boxes):
+        if not boxes:
+            rows.append({
+                'source': path, 'frame': index, 'plate_index': None,
+                'message': "No plate detected", 'elapsed_ms': round(detect_ms, 1),
+            })
+            continue
+
+        for plate_index, box in enumerate(boxes):
+            started = time.perf_counter()
+            plate_img = detector.crop(frame, box)
+            usable, reason, _ = assess_crop(plate_img)
+            text, ocr_conf = ocr.extract_text_with_confidence(plate_img) if usable else ("", 0.0)
+            vehicle_img = detector.crop(frame, detector.vehicle_box(box, frame.shape))
+            if vehicle_img.size == 0:
+                vehicle_img = frame
+            color, color_conf, make, make_conf = classifier.classify(vehicle_img)
+
+            granted, message = None, "No text read" if usable else f"Unusable crop ({reason})"
+            if text:
+                granted, message, _ = check_vehicle_access(text, color, make)
+
+            x1, y1, x2, y2, plate_conf = box
+            rows.append({
+                'source': path, 'frame': index, 'plate_index': plate_index,
+                'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'plate_confidence': round(plate_conf, 4),
+                'plate_text': text, 'ocr_confidence': round(ocr_conf, 4),
+                'color': color, 'color_confidence': round(color_conf, 4),
+                'make': make, 'make_confidence': round(make_conf, 4),
+                'access_granted': granted, 'message': message,
+                'elapsed_ms': round(detect_ms + (time.perf_counter() - started) * 1000, 1),
+            })
+    return len(chunk), len(frames), rows
+
+
+class CsvSink:
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Writes each batch of rows as a row group. Requires pyarrow."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use a .csv output instead.")
+        self._pa = pa
+        self._schema = pa.schema([
+            ('source', pa.string()), ('frame', pa.int64()), ('plate_index', pa.int64()),
+            ('x1', pa.int64()), ('y1', pa.int64()), ('x2', pa.int64()), ('y2', pa.int64()),
+            ('plate_confidence', pa.float64()), ('plate_text', pa.string()), ('ocr_confidence', pa.float64()),
+            ('color', pa.string()), ('color_confidence', pa.float64()),
+            ('make', pa.string()), ('make_confidence', pa.float64()),
+            ('access_granted', pa.bool_()), ('message', pa.string()), ('elapsed_ms', pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        if rows:
+            columns = {name: [row.get(name) for row in rows] for name in FIELDS}
+            self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(path):
+    if path.lower().endswith('.parquet'):
+        return ParquetSink(path)
+    return CsvSink(path)
+
+
+def run(inputs, output, workers=None, every=1, chunk_size=None, log_access=False):
+    """Processes `inputs` (folders, videos or images) into `output`. Returns the number of frames read."""
+    from database import get_registered_vehicles, log_access_attempt, stop_access_log_writer
+
+    workers = config.BATCH_WORKERS if workers is None else workers
+    chunks = build_work(inputs, every=every, chunk_size=chunk_size)
+    total = sum(len(chunk) for chunk in chunks)
+    if not total:
+        logger.warning("Nothing to process.")
+        return 0
+
+    vehicles = get_registered_vehicles()
+    logger.info("Processing %d frames in %d chunks with %d worker(s); %d registered vehicles.",
+                total, len(chunks), workers or 1, len(vehicles))
+
+    sink = open_sink(output)
+    done = frames_read = plates = 0
+    started = time.monotonic()
+    last_report = 0.0
+    pool = None
+    try:
+        if workers > 1:
+            # Spawned workers don't inherit the parent's TF/torch/CUDA state
+            context = multiprocessing.get_context("spawn")
+            pool = context.Pool(workers, initializer=_init_worker, initargs=(vehicles,))
+            results = pool.imap_unordered(process_chunk, chunks)
+        else:
+            _init_worker(vehicles)
+            results = map(process_chunk, chunks)
+
+        for size, read, rows in results:
+            done += size
+            frames_read += read
+            plates += sum(1 for row in rows if row.get('plate_index') is not None)
+            sink.write(rows)
+            if log_access:
+                # Logged from this process only, so workers never share the spool
+                for row in rows:
+                    if row.get('plate_text'):
+                        log_access_attempt(row['plate_text'], row['color'], row['make'], row['access_granted'])
+
+            now = time.monotonic()
+            if now - last_report >= config.BATCH_PROGRESS_INTERVAL or done == total:
+                last_report = now
+                elapsed = now - started
+                rate = done / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate else 0.0
+                logger.info("  %d/%d frames (%5.1f%%)  %6.1f frames/s  %d plates  ETA %5.0fs",
+                            done, total, 100.0 * done / total, rate, plates, eta)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        sink.close()
+        if log_access:
+            stop_access_log_writer()
+
+    elapsed = time.monotonic() - started
+    logger.info("Done: %d frames, %d plates in %.1fs (%.1f frames/s). Results in %s",
+                frames_read, plates, elapsed, frames_read / max(elapsed, 1e-9), output)
+    return frames_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run plate recognition over image folders or videos without the GUI.")
+    parser.add_argument('inputs', nargs='+', help="Image directories, video files or single images")
+    parser.add_argument('--output', '-o', default="results.csv", help="Output file (.csv or .parquet)")
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help=f"Worker processes, each with its own models (default {config.BATCH_WORKERS})")
+    parser.add_argument('--every', type=int, default=1, help="Process every Nth video frame")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help=f"Frames per work item and detector batch (default {config.PLATE_BATCH_SIZE})")
+    parser.add_argument('--log-access', action='store_true', help="Also write each decision to access_logs")
+    args = parser.parse_args()
+    configure_logging(fmt="%(message)s")
+
+    run(args.inputs, args.output, workers=args.workers, every=max(1, args.every),
+        chunk_size=args.chunk_size, log_access=args.log_access)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Reproducible latency/throughput benchmark for the recognition and matching stages.
+
+Plates are synthetic: Malaysian-style text rendered onto varied backgrounds
+with blur, noise and inverted (dark-on-light) variants, and registered fleets
+of random plates. Everything is seeded, so two runs on the same machine time
+the same work.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --skip-models --fleet-sizes 1000,10000,100000,1000000
+    python benchmark.py --output new.json --compare bench.json
+
+Each stage reports p50/p95/p99 latency and throughput. With --compare, stages
+whose p50 grew by more than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import config
+from plate_matching import VectorPlateScorer, calculate_similarity
+from telemetry import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# OCR confusions used to make near-miss probes
+CONFUSIONS = {'0': 'O', 'O': '0', '1': 'I', 'I': '1', '5': 'S', 'S': '5', '8': 'B', 'B': '8', '2': 'Z', 'Z': '2'}
+# Malaysian prefixes skip I and O
+PREFIX_LETTERS = [c for c in string.ascii_uppercase if c not in 'IO']
+COLORS = ['Black', 'White', 'Silver', 'Red', 'Blue', 'Grey']
+PARITY_READS = 200  # Reads checked pair by pair against the reference scorer
+MAKES = ['Perodua Myvi', 'Proton Saga', 'Honda City', 'Toyota Vios', 'Perodua Axia', 'Proton X50']
+
+
+class SyntheticPlates:
+    """Seeded generator of plate strings and rendered plate/frame images."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+
+    def plate_text(self):
+        prefix = "".join(self.rng.choice(PREFIX_LETTERS) for _ in range(self.rng.randint(1, 3)))
+        number = str(self.rng.randint(1, 9999))
+        suffix = self.rng.choice(PREFIX_LETTERS) if self.rng.random() < 0.2 else ""
+        return f"{prefix}{number}{suffix}"
+
+    def render_plate(self, text, blur=0, noise=0.0, inverted=False):
+        """Plate crop: white text on black (regular plates), or black on white when inverted."""
+        scale = self.rng.uniform(1.2, 1.8)
+        (text_w, text_h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 3)
+        pad_x, pad_y = int(text_h * 0.6), int(text_h * 0.5)
+        background = (255, 255, 255) if inverted else (15, 15, 15)
+        foreground = (10, 10, 10) if inverted else (245, 245, 245)
+
+        plate = np.full((text_h + baseline + 2 * pad_y, text_w + 2 * pad_x, 3), background, dtype=np.uint8)
+        cv2.putText(plate, text, (pad_x, pad_y + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale, foreground, 3, cv2.LINE_AA)
+        cv2.rectangle(plate, (1, 1), (plate.shape[1] - 2, plate.shape[0] - 2), foreground, 2)
+        return self._degrade(plate, blur, noise)
+
+    def render_frame(self, text, size=(720, 1280), **degrade):
+        """A frame with the plate placed low on a random car-coloured body over a gradient background."""
+        height, width = size
+        top, bottom = self.np_rng.integers(40, 220, size=(2, 3))
+        ramp = np.linspace(0.0, 1.0, height)[:, None, None]
+        frame = (top * (1 - ramp) + bottom * ramp).astype(np.uint8).repeat(width, axis=1)
+
+        body_w, body_h = self.rng.randint(width // 3, width // 2), self.rng.randint(height // 3, height // 2)
+        bx = self.rng.randint(0, width - body_w)
+        by = self.rng.randint(height // 3, height - body_h)
+        body_color = tuple(int(c) for c in self.np_rng.integers(0, 256, size=3))
+        cv2.rectangle(frame, (bx, by), (bx + body_w, by + body_h), body_color, -1)
+
+        plate = self.render_plate(text, **degrade)
+        plate_h, plate_w = plate.shape[:2]
+        if plate_w > body_w:
+            plate = cv2.resize(plate, (body_w - 10, int(plate_h * (body_w - 10) / plate_w)))
+            plate_h, plate_w = plate.shape[:2]
+        px = bx + (body_w - plate_w) // 2
+        py = min(height - plate_h, by + int(body_h * 0.7))
+        frame[py:py + plate_h, px:px + plate_w] = plate
+        return frame
+
+    def samples(self, count):
+        """(text, degradation) pairs cycling through clean, blurred, noisy and inverted plates."""
+        kinds = [{}, {'blur': 5}, {'noise': 18.0}, {'inverted': True}, {'blur': 3, 'noise': 10.0}]
+        return [(self.plate_text(), kinds[i % len(kinds)]) for i in range(count)]
+
+    def fleet(self, size):
+        """Registered-vehicle rows with unique plates, shaped like the `vehicles` table."""
+        plates = set()
+        while len(plates) < size:
+            plates.add(self.plate_text())
+        return [
+            {
+                'id': i + 1,
+                'plate_number': plate,
+                'owner_name': f"Owner {i + 1}",
+                'make_model': self.rng.choice(MAKES),
+                'color': self.rng.choice(COLORS),
+                'created_at': f"2024-01-01T00:00:{i % 60:02d}",
+            }
+            for i, plate in enumerate(sorted(plates))
+        ]
+
+    def confuse(self, plate):
+        """Swaps one character for a common OCR confusion, if the plate has one."""
+        positions = [i for i, c in enumerate(plate) if c in CONFUSIONS]
+        if not positions:
+            return plate
+        i = self.rng.choice(positions)
+        return plate[:i] + CONFUSIONS[plate[i]] + plate[i + 1:]
+
+    def _degrade(self, img, blur, noise):
+        if blur:
+            img = cv2.GaussianBlur(img, (blur | 1, blur | 1), 0)
+        if noise:
+            grain = self.np_rng.normal(0, noise, img.shape)
+            img = np.clip(img.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+        return img
+
+
+def measure(fn, inputs, warmup=1):
+    """Calls fn on each input and returns the per-call latencies in seconds."""
+    for item in inputs[:warmup]:
+        fn(item)
+    latencies = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summarize(latencies):
+    values = np.array(latencies) * 1000.0
+    total = float(np.sum(latencies))
+    return {
+        'n': len(latencies),
+        'mean_ms': round(float(values.mean()), 4),
+        'p50_ms': round(float(np.percentile(values, 50)), 4),
+        'p95_ms': round(float(np.percentile(values, 95)), 4),
+        'p99_ms': round(float(np.percentile(values, 99)), 4),
+        'per_second': round(len(latencies) / total, 2) if total else None,
+    }
+
+
+def bench_matching(gen, fleet_sizes, probes):
+    """Similarity, OCR variants and full access checks against fleets of each size."""
+    import database
+
+    stages = {}
+    pairs = [(gen.plate_text(), gen.plate_text()) for _ in range(probes)]
+    stages['calculate_similarity'] = summarize(measure(lambda p: calculate_similarity(*p), pairs))
+    stages['get_ocr_variants'] = summarize(measure(database.get_ocr_variants, [a for a, _ in pairs]))
+
+    for size in fleet_sizes:
+        logger.info("Fleet of %d vehicles...", size)
+        fleet = gen.fleet(size)
+        started = time.perf_counter()
+        database.load_vehicle_snapshot(fleet)
+        stages[f'index_load[{size}]'] = {'n': 1, 'seconds': round(time.perf_counter() - started, 4)}
+
+        # Half exact hits, a third OCR near-misses, the rest unregistered
+        reads = []
+        for i in range(probes):
+            row = gen.rng.choice(fleet)
+            kind = i % 6
+            if kind < 3:
+                reads.append((row['plate_number'], row['color'], row['make_model']))
+            elif kind < 5:
+                reads.append((gen.confuse(row['plate_number']), row['color'], row['make_model']))
+            else:
+                reads.append((gen.plate_text() + "X", "Black", "Unknown"))
+        stages[f'check_vehicle_access[{size}]'] = summarize(
+            measure(lambda r: database.check_vehicle_access(*r), reads)
+        )
+
+        scorer = VectorPlateScorer(config.FUZZY_MATCH_THRESHOLD)
+        for row in fleet:
+            scorer.add(row['id'], row['plate_number'])
+        stages[f'vector_top_k[{size}]'] = summarize(measure(lambda r: scorer.top_k(r[0]), reads))
+        if size == min(fleet_sizes):
+            stages[f'vector_parity[{size}]'] = check_scorer_parity(scorer, fleet, [r[0] for r in reads[:PARITY_READS]])
+    return stages
+
+
+def check_scorer_parity(scorer, fleet, reads):
+    """Compares every vectorized score with `calculate_similarity`, the reference."""
+    mismatches = 0
+    for read in reads:
+        scores = scorer.scores(read)
+        for row, vehicle in enumerate(fleet):
+            if scores[row] != calculate_similarity(read, vehicle['plate_number']):
+                mismatches += 1
+    if mismatches:
+        logger.error("Vectorized scorer disagrees with calculate_similarity on %d pairs", mismatches)
+    return {'n': len(reads) * len(fleet), 'mismatches': mismatches}
+
+
+def bench_models(gen, count):
+    """Detector, each OCR preprocessor, full OCR and the classifiers on synthetic images."""
+    stages = {}
+    samples = gen.samples(count)
+    frames = [gen.render_frame(text, **degrade) for text, degrade in samples]
+    crops = [gen.render_plate(text, **degrade) for text, degrade in samples]
+
+    try:
+        from recognition.plate_detector import PlateDetector
+        detector = PlateDetector()
+        stages['detect_plate'] = summarize(measure(detector.detect_plate, frames))
+    except Exception as e:
+        logger.warning("Skipping plate detector: %s", e)
+
+    try:
+        from recognition.ocr_engine import OCREngine
+        ocr = OCREngine()
+        # Time full reads; the read cache is measured separately below
+        cache, ocr.cache = ocr.cache, None
+        for name, preprocess in ocr.preprocessing_methods:
+            stages[f'preprocess[{name}]'] = summarize(measure(preprocess, crops))
+        reads = []
+        stages['extract_text'] = summarize(
+            measure(lambda c: reads.append(ocr.extract_text_with_confidence(c)), crops)
+        )
+        # First pass of `measure` is warmup
+        correct = sum(read == text for (read, _), (text, _) in zip(reads[1:], samples))
+        stages['extract_text']['accuracy'] = round(correct / len(samples), 4)
+
+        if cache is not None:
+            # Seed with the reads above, then read every crop again; accuracy
+            # drops if different plates hash close enough to share a result
+            for crop, result in zip(crops, reads[1:]):
+                cache.store(cache.lookup(crop)[0], result)
+            ocr.cache = cache
+            texts = []
+            stages['extract_text[cached]'] = summarize(measure(lambda c: texts.append(ocr.extract_text(c)), crops))
+            correct = sum(read == text for read, (text, _) in zip(texts[1:], samples))
+            stages['extract_text[cached]']['accuracy'] = round(correct / len(samples), 4)
+    except Exception as e:
+        logger.warning("Skipping OCR: %s", e)
+
+    try:
+        from recognition.vehicle_classifier import VehicleClassifier
+        classifier = VehicleClassifier()
+        classifier.cache = None
+        stages['predict_color'] = summarize(measure(classifier.predict_color, frames))
+        stages['predict_make'] = summarize(measure(classifier.predict_make, frames))
+        stages['classify'] = summarize(measure(classifier.classify, frames))
+    except Exception as e:
+        logger.warning("Skipping vehicle classifier: %s", e)
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(result):
+    logger.info("\nBenchmark @ %s (seed %s):", result['meta']['commit'], result['meta']['seed'])
+    for name, s in result['stages'].items():
+        if 'p50_ms' in s:
+            logger.info(f"  {name:<32} p50 {s['p50_ms']:9.3f} ms  p95 {s['p95_ms']:9.3f}  "
+                        f"p99 {s['p99_ms']:9.3f}  {s['per_second'] or 0:10.1f}/s")
+        elif 'mismatches' in s:
+            logger.info(f"  {name:<32} {s['mismatches']} mismatches in {s['n']} pairs")
+        else:
+            logger.info(f"  {name:<32} {s['seconds']:9.3f} s")
+
+
+def compare(result, baseline, tolerance):
+    """Prints p50 changes against a baseline run. Returns the names of regressed stages."""
+    logger.info("\nCompared with %s (tolerance %.0f%%):", baseline['meta'].get('commit'), tolerance * 100)
+    regressed = []
+    for name, s in result['stages'].items():
+        old = baseline['stages'].get(name)
+        key = 'p50_ms' if 'p50_ms' in s else 'seconds'
+        if not old or not old.get(key) or key not in s:
+            continue
+        change = s[key] / old[key] - 1.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        logger.info(f"  {name:<32} {old[key]:9.3f} -> {s[key]:9.3f}  {change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recognition and matching stages on synthetic data.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--images', type=int, default=50, help="Synthetic images per model stage")
+    parser.add_argument('--probes', type=int, default=2000, help="Reads per matching stage")
+    parser.add_argument('--fleet-sizes', default="1000,10000,100000",
+                        help="Comma-separated registered fleet sizes (up to 1000000)")
+    parser.add_argument('--skip-models', action='store_true', help="Only benchmark matching")
+    parser.add_argument('--output', '-o', help="Write results as JSON")
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="Compare against an earlier --output")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+    configure_logging(fmt="%(message)s")
+
+    gen = SyntheticPlates(args.seed)
+    fleet_sizes = [int(size) for size in args.fleet_sizes.split(",") if size]
+
+    stages = {}
+    if not args.skip_models:
+        stages.update(bench_models(gen, args.images))
+    stages.update(bench_matching(gen, fleet_sizes, args.probes))
+
+    result = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'backends': {
+                'plate_detector': config.PLATE_DETECTOR_BACKEND,
+                'ocr': config.OCR_BACKEND,
+                'classifier': config.CLASSIFIER_BACKEND,
+            },
+            'ocr_mode': config.OCR_MODE,
+        },
+        'stages': stages,
+    }
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        logger.info("\nWrote %s", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,19 +10,129 @@ PROJECT_ROOT = os.path.dirname(BASE_DIR)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Vehicle sync
+VEHICLE_REALTIME_SYNC = True  # Apply `vehicles` change events from supabase_realtime
+VEHICLE_CATCHUP_INTERVAL = 300  # Seconds between created_at watermark catch-ups (0 disables)
+VEHICLE_MIRROR_PATH = os.path.join(BASE_DIR, "data", "vehicles.db")  # Local copy used at startup and offline
+
+# Access logging
+ACCESS_LOG_SPOOL_PATH = os.path.join(BASE_DIR, "data", "access_log_spool.db")
+ACCESS_LOG_BATCH_SIZE = 50  # Rows per multi-row insert
+ACCESS_LOG_FLUSH_INTERVAL = 2.0  # Seconds before a partial batch is sent
+ACCESS_LOG_RETRY_INTERVAL = 30.0  # Seconds to wait after a failed insert
+ACCESS_LOG_MAX_ATTEMPTS = 3  # Rejections (4xx, bad data) before a row moves to the dead-letter table
+
+# Debug capture (plate crops and preprocessed OCR variants)
+DEBUG_CAPTURE_ENABLED = os.getenv("DEBUG_CAPTURE", "0") == "1"
+DEBUG_CAPTURE_DIR = os.path.join(BASE_DIR, "data", "debug_capture")
+DEBUG_CAPTURE_SAMPLE_RATE = 1.0  # Fraction of OCR events captured when enabled
+DEBUG_CAPTURE_MAX_EVENTS = 200  # Oldest event folders are deleted beyond this
+
+# Logging and metrics
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG adds per-read OCR, classifier and match details
+METRICS_ENABLED = True  # Stage latency histograms and event counters (no-ops when off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve Prometheus text on 127.0.0.1:<port>/metrics (0 = off)
+METRICS_FILE = os.getenv("METRICS_FILE") or None  # Also rewrite this file with the same text
+METRICS_FILE_INTERVAL = 15  # Seconds between metrics file writes
+
 # Camera
 CAMERA_INDEX = 0  # Default camera
 FRAME_WIDTH = 1280
 FRAME_HEIGHT = 720
+UI_PREVIEW_FPS = 10  # Live preview refresh cap; Tk cannot keep up with every camera frame
+UI_PREVIEW_SIZE = (480, 400)  # Preview is downscaled to fit this (width, height)
+
+# Lanes served by gate_server.py from one process with shared models. Each
+# lane needs a name and a source (camera index, video file or image dir);
+# "slo_ms" overrides the capture-to-decision latency target for that lane.
+GATE_LANES = [
+    {'name': 'entry', 'source': CAMERA_INDEX},
+]
+GATE_LANE_SLO_MS = 1500  # Default per-lane latency target (frame captured -> gate decision)
+GATE_CLASSIFY_BATCH = 4  # Vehicle crops per classifier call across lanes
+
+# Streaming
+STREAM_QUEUE_SIZE = 4  # Frame and plate-crop queue bound; the oldest item is dropped when full
+STREAM_SOURCE_FPS = 10  # Pace for image directories and videos without a frame rate
+STREAM_DECISION_COOLDOWN = 10.0  # Seconds before the same plate is decided again
+STREAM_STATS_INTERVAL = 5  # Seconds between stage stats reports in headless mode
+FRAME_RING_SLOTS = 8  # Shared-memory frame slots for --shared-capture (SharedFrameSource)
+FRAME_RING_MAX_SHAPE = (1080, 1920, 3)  # Largest frame a slot holds; bigger frames are downscaled
+
+# Plate tracking (streaming)
+TRACK_IOU_THRESHOLD = 0.3  # Minimum box overlap to continue a track
+TRACK_MAX_MISSED = 15  # Frames a track may go unseen before it is closed
+TRACK_REOCR_GAIN = 1.25  # Re-read when the plate box grows by this factor
+TRACK_REOCR_INTERVAL = 10  # Re-read an undecided track every N frames
+TRACK_MIN_READINGS = 3  # Readings fused by confidence vote before deciding
+TRACK_DECIDE_CONFIDENCE = 0.8  # A single reading this confident decides immediately
 
 # Recognition
 PLATE_DETECTION_MODEL = os.path.join(PROJECT_ROOT, "yolov11-license-plate-detection", "license-plate-finetune-v1n.pt")
 PLATE_CONFIDENCE = 0.3  # Lowered for better detection
+# Haar fallback when YOLO finds no plate: "always", "never", or "uncertain"
+# (only if YOLO saw a candidate scoring at least PLATE_EMPTY_SCORE)
+PLATE_FALLBACK_MODE = "always"
+PLATE_EMPTY_SCORE = 0.05
+HAAR_MAX_WIDTH = 640  # Search region is downscaled towards this width...
+HAAR_MIN_PLATE_WIDTH = 120  # ...but not so far that plates this wide (full-res px) are lost; raise it for speed
+HAAR_SCALE_FACTOR = 1.1
+HAAR_MIN_NEIGHBORS = 3
+HAAR_SEARCH_REGION = (0.0, 0.3, 1.0, 1.0)  # Fractional x1, y1, x2, y2 of the frame (plates sit low)
 MATCH_THRESHOLD = 0.5
+FUZZY_MATCH_THRESHOLD = 0.75  # Minimum OCR-aware similarity for a fuzzy plate match
+# Fuzzy matcher: "segments" looks up only plates sharing an exact segment with
+# the read, "vector" scores the whole fleet at once with NumPy (same scores)
+FUZZY_MATCH_BACKEND = "segments"
+# OCR_MODE: "cascade" stops at the first confident reading, "exhaustive" runs
+# every preprocessor, "batched" reads all preprocessed variants as single
+# lines without text detection: one forward pass with OCR_BACKEND="onnx",
+# a per-variant loop inside EasyOCR otherwise
+OCR_MODE = "exhaustive"  # The original behaviour; "cascade" trades some accuracy for speed
+OCR_BATCH_MIN_ASPECT = 2.5  # Narrower crops are likely two-row plates and take the sequential path
+OCR_CASCADE_CONFIDENCE = 0.7  # Confidence a valid plate reading needs to end the cascade
+# Plate crop quality gate: crops failing any check skip OCR, and streaming
+# waits for a better frame of the same vehicle
+CROP_QUALITY_ENABLED = True
+CROP_MIN_HEIGHT = 24  # Pixels
+CROP_MIN_WIDTH = 60
+CROP_ASPECT_RANGE = (1.5, 6.0)  # Width / height; the Haar path uses 2-6, two-row plates sit near 1.6
+CROP_MIN_SHARPNESS = 100.0  # Variance of the Laplacian with the crop scaled to 48 px high
+CROP_MIN_CONTRAST = 20.0  # Standard deviation of grey levels
+CROP_BRIGHTNESS_RANGE = (20, 235)  # Mean grey level outside this is under/overexposed
+CROP_MAX_DEFERRALS = 5  # Unusable crops of one vehicle skipped before its best crop is read anyway
+# Read cache: a crop whose perceptual hash (dHash) is within *_CACHE_MAX_DISTANCE
+# bits of one read in the last READ_CACHE_TTL seconds reuses that result
+OCR_CACHE_ENABLED = True
+OCR_CACHE_MAX_DISTANCE = 12  # Of 1152 bits (48x12 grid over the plate); different plates differ by 40+
+CLASSIFIER_CACHE_ENABLED = False
+CLASSIFIER_CACHE_MAX_DISTANCE = 10  # Of 256 bits (16x8 grid over the vehicle)
+OCR_CACHE_MIN_CONFIDENCE = 0.5  # Only valid plate reads at least this confident are cached
+READ_CACHE_SIZE = 256  # Entries per cache, least recently used dropped first
+READ_CACHE_TTL = 30.0  # Seconds a cached result stays valid
 PLATE_PATTERNS = [
     r'^[A-Z]{1,3}\d{1,4}[A-Z]{0,2}$', # General approximation, refined in regex logic
 ]
 
+# Vehicle region used for color/make classification, estimated from the plate box
+VEHICLE_BOX_WIDTH_RATIO = 4.0  # Vehicle width in plate widths
+VEHICLE_BOX_HEIGHT_RATIO = 3.0  # Vehicle height in plate widths
+VEHICLE_BOX_PLATE_POSITION = 0.75  # Plate centre as a fraction of vehicle height from the top
+
+# Inference backends: "torch"/"easyocr"/"keras" run the original models,
+# "onnx" runs models exported by export_onnx.py on ONNX Runtime (CPU)
+PLATE_DETECTOR_BACKEND = os.getenv("PLATE_DETECTOR_BACKEND", "torch")
+OCR_BACKEND = os.getenv("OCR_BACKEND", "easyocr")
+CLASSIFIER_BACKEND = os.getenv("CLASSIFIER_BACKEND", "keras")
+OCR_GPU = True  # EasyOCR falls back to CPU when no GPU is present
+PLATE_IMGSZ = 640  # YOLO input size (export and inference)
+PLATE_BATCH_SIZE = 8  # Frames per YOLO call in detect_batch / detect_directory
+BATCH_WORKERS = 2  # batch_process.py worker processes; each loads its own models
+BATCH_PROGRESS_INTERVAL = 5  # Seconds between batch progress lines
+ONNX_MODEL_DIR = os.path.join(PROJECT_ROOT, "onnx_models")
+ONNX_USE_INT8 = os.getenv("ONNX_USE_INT8", "0") == "1"  # Use the dynamically quantized models
+ONNX_THREADS = 0  # Intra-op threads for ONNX Runtime (0 = library default)
+
 # Paths
 MAKE_MODEL_PATH = os.path.join(PROJECT_ROOT, "car-model-recog", "keras_model.h5")
 COLOR_MODEL_PATH = os.path.join(PROJECT_ROOT, "converted_keras (1)", "keras_model.h5")
@@ -1,113 +1,241 @@
 from supabase import create_client, Client
 import config
+import asyncio
+import logging
+import threading
+import time
 from datetime import datetime
+from vehicle_index import VehicleIndex, normalize_plate
+from plate_matching import calculate_similarity  # Re-exported; it lives with the other matching code
+from access_log_writer import AccessLogWriter
+from vehicle_mirror import VehicleMirror
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
 
 
 try:
     supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
-    print("Supabase client initialized.")
+    logger.info("Supabase client initialized.")
 except Exception as e:
-    print(f"Error connecting to Supabase: {e}")
+    logger.error("Error connecting to Supabase: %s", e)
     supabase = None
 
-# Cache for registered vehicles to reduce API calls
-_vehicle_cache = []
+# Resident index of registered vehicles, kept current by realtime events.
+# Every change is written to the on-disk mirror too, so restarts and
+# outages start from the last known fleet.
+_vehicle_index = VehicleIndex()
+_vehicle_mirror = VehicleMirror(config.VEHICLE_MIRROR_PATH)
+_sync_started = False
+# Serializes change events with full reloads so the mirror and the index
+# always receive them in the same order
+_apply_lock = threading.Lock()
+
+
+def _insert_access_logs(rows):
+    if not supabase:
+        raise RuntimeError("Supabase client not available")
+    supabase.table('access_logs').insert(rows).execute()
+
+
+_access_log_writer = AccessLogWriter(
+    _insert_access_logs,
+    config.ACCESS_LOG_SPOOL_PATH,
+    batch_size=config.ACCESS_LOG_BATCH_SIZE,
+    flush_interval=config.ACCESS_LOG_FLUSH_INTERVAL,
+    retry_interval=config.ACCESS_LOG_RETRY_INTERVAL,
+    max_attempts=config.ACCESS_LOG_MAX_ATTEMPTS,
+)
 
 
-def log_access_attempt(plate_number, detected_color, detected_model, plate_matched, color_matched=True):
+def log_access_attempt(plate_number, detected_color, detected_model, plate_matched, color_matched=True,
+                       debug_event_id=None):
     """
-    Log an access attempt to the access_logs table in Supabase.
+    Queue an access attempt for the access_logs table in Supabase.
+    Rows are spooled to disk and written in batches by a background thread.
+    `debug_event_id` links the row to its saved debug images, if captured.
     """
-    if not supabase:
-        print("Supabase client not available. Cannot log access.")
-        return False
+    data = {
+        'timestamp': datetime.now().isoformat(),
+        'plate_number': plate_number,
+        'detected_color': detected_color,
+        'detected_model': detected_model,
+        'plate_matched': plate_matched,
+        'color_matched': color_matched,
+    }
+    if debug_event_id:
+        data['debug_event_id'] = debug_event_id
     
-    try:
-        data = {
-            'timestamp': datetime.now().isoformat(),
-            'plate_number': plate_number,
-            'detected_color': detected_color,
-            'detected_model': detected_model,
-            'plate_matched': plate_matched,
-            'color_matched': color_matched,
-        }
-        
-        response = supabase.table('access_logs').insert(data).execute()
-        print(f"Access logged: {plate_number} (matched: {plate_matched})")
-        return True
-    except Exception as e:
-        print(f"Error logging access: {e}")
-        return False
+    _access_log_writer.start()
+    _access_log_writer.enqueue(data)
+    logger.info("Access queued: %s (matched: %s)", plate_number, plate_matched)
+    return True
+
+
+def get_access_log_metrics():
+    """Queue depth and flush latency of the background access-log writer."""
+    return _access_log_writer.metrics()
+
+
+def stop_access_log_writer():
+    """Ships pending access logs (best effort) and stops the writer thread."""
+    _access_log_writer.stop()
 
 def get_registered_vehicles():
-    """Fetches all registered vehicles from Supabase and updates cache."""
-    global _vehicle_cache
+    """
+    Fetches all registered vehicles from Supabase and reloads the local index
+    and mirror. Realtime changes applied while the fetch runs are kept.
+    Offline, the index is loaded from the mirror instead.
+    """
     if not supabase:
-        print("Supabase client not available.")
-        return []
+        logger.warning("Supabase client not available.")
+    else:
+        try:
+            since = _vehicle_index.sequence
+            response = supabase.table('vehicles').select("*").execute()
+            with _apply_lock:
+                _vehicle_index.load(response.data, since=since)
+                vehicles = _vehicle_index.vehicles()
+                _mirror_write(_vehicle_mirror.replace_all, vehicles)
+            return vehicles
+        except Exception as e:
+            logger.error("Error fetching vehicles: %s", e)
     
+    if not _vehicle_index.loaded:
+        load_vehicles_from_mirror()
+    return _vehicle_index.vehicles()
+
+
+def load_vehicles_from_mirror():
+    """Loads the index from the on-disk mirror. Returns the rows (empty on first run)."""
     try:
-        response = supabase.table('vehicles').select("*").execute()
-        _vehicle_cache = response.data
-        return _vehicle_cache
+        vehicles = _vehicle_mirror.load()
     except Exception as e:
-        print(f"Error fetching vehicles: {e}")
+        logger.error("Error reading vehicle mirror: %s", e)
         return []
+    _vehicle_index.load(vehicles)
+    logger.info("Loaded %d vehicles from the local mirror.", len(vehicles))
+    return vehicles
+
 
+def _mirror_write(method, rows):
+    # A failed disk write must not block decisions; the next full refresh repairs it
+    try:
+        method(rows)
+    except Exception as e:
+        logger.warning("Error updating vehicle mirror: %s", e)
 
-def calculate_similarity(s1, s2):
+
+def catch_up_vehicles():
     """
-    Calculate similarity ratio between two strings.
-    OCR-aware: considers commonly confused characters as matches.
-    Returns a value between 0 and 1 (1 = exact match).
+    Pulls vehicles created after the newest `created_at` already indexed.
+    Covers inserts missed while the realtime channel was disconnected.
     """
-    if not s1 or not s2:
-        return 0.0
-    
-    s1, s2 = s1.upper(), s2.upper()
-    
-    if s1 == s2:
-        return 1.0
+    if not supabase:
+        return 0
+    if _vehicle_index.watermark is None:
+        return len(get_registered_vehicles())
     
-    # OCR-similar character groups (characters that look similar)
-    ocr_groups = [
-        {'O', '0', 'Q', 'D'},
-        {'I', '1', 'L', '|'},
-        {'S', '5'},
-        {'G', '6'},
-        {'B', '8'},
-        {'Z', '2'},
-        {'M', 'W'},
-        {'T', '7'},
-        {'A', '4'},
-        {'E', '3'},
-    ]
+    try:
+        response = (
+            supabase.table('vehicles')
+            .select("*")
+            .gt('created_at', _vehicle_index.watermark)
+            .execute()
+        )
+        with _apply_lock:
+            for row in response.data:
+                _mirror_write(_vehicle_mirror.upsert, row)
+                _vehicle_index.upsert(row)
+        if response.data:
+            logger.info("Vehicle catch-up: %d new registrations.", len(response.data))
+        return len(response.data)
+    except Exception as e:
+        logger.warning("Error during vehicle catch-up: %s", e)
+        return 0
+
+
+def _on_vehicle_change(payload):
+    """Applies one postgres_changes event on `vehicles` to the local index."""
+    data = payload.get('data', payload)
+    event = data.get('type') or data.get('eventType')
+    record = data.get('record') or data.get('new') or {}
+    old_record = data.get('old_record') or data.get('old') or {}
     
-    def chars_similar(c1, c2):
-        """Check if two characters are OCR-similar."""
-        if c1 == c2:
-            return True
-        for group in ocr_groups:
-            if c1 in group and c2 in group:
-                return True
-        return False
+    with _apply_lock:
+        if event in ('INSERT', 'UPDATE') and record:
+            _mirror_write(_vehicle_mirror.upsert, record)
+            _vehicle_index.upsert(record)
+        elif event == 'DELETE' and old_record:
+            _mirror_write(_vehicle_mirror.remove, old_record)
+            _vehicle_index.remove(old_record)
+    logger.info("Vehicle %s: %s", event, record.get('plate_number') or old_record.get('id'))
+
+
+async def _listen_vehicle_changes():
+    # Realtime is only implemented on the async client
+    from supabase import acreate_client
     
-    # Make strings same length for comparison
-    max_len = max(len(s1), len(s2))
-    min_len = min(len(s1), len(s2))
+    client = await acreate_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+    channel = client.channel('gate-vehicles')
+    channel.on_postgres_changes(
+        '*', schema='public', table='vehicles', callback=_on_vehicle_change
+    )
+    await channel.subscribe()
+    logger.info("Subscribed to realtime vehicle changes.")
     
-    # Pad shorter string
-    s1_padded = s1.ljust(max_len)
-    s2_padded = s2.ljust(max_len)
+    while True:
+        await asyncio.sleep(3600)
+
+
+def _run_realtime_listener():
+    try:
+        asyncio.run(_listen_vehicle_changes())
+    except Exception as e:
+        logger.warning("Realtime vehicle sync stopped: %s", e)
+
+
+def _run_catch_up_loop():
+    while True:
+        time.sleep(config.VEHICLE_CATCHUP_INTERVAL)
+        catch_up_vehicles()
+
+
+def start_vehicle_sync():
+    """
+    Loads the vehicle index once and starts background threads that keep
+    it current (realtime change events plus a periodic watermark catch-up).
+    The index comes from the local mirror straight away when it has rows;
+    the full refresh from Supabase then runs in the background.
+    Safe to call more than once.
+    """
+    global _sync_started
+    if _sync_started:
+        return _vehicle_index.vehicles()
+    _sync_started = True
     
-    # Count OCR-similar matches
-    matches = sum(chars_similar(c1, c2) for c1, c2 in zip(s1_padded, s2_padded))
+    vehicles = load_vehicles_from_mirror()
+    if vehicles:
+        threading.Thread(target=get_registered_vehicles, name="vehicle-refresh", daemon=True).start()
+    else:
+        vehicles = get_registered_vehicles()
     
-    # Penalize length difference slightly
-    len_penalty = (max_len - min_len) * 0.2
+    if supabase and config.VEHICLE_REALTIME_SYNC:
+        threading.Thread(target=_run_realtime_listener, name="vehicle-realtime", daemon=True).start()
+    if supabase and config.VEHICLE_CATCHUP_INTERVAL:
+        threading.Thread(target=_run_catch_up_loop, name="vehicle-catchup", daemon=True).start()
     
-    similarity = (matches - len_penalty) / max_len
-    return max(0, similarity)
+    return vehicles
+
+
+def load_vehicle_snapshot(vehicles):
+    """
+    Loads the index from rows fetched elsewhere, without starting sync.
+    For offline runs such as batch worker processes.
+    """
+    global _sync_started
+    _sync_started = True
+    _vehicle_index.load(vehicles)
 
 
 def get_ocr_variants(plate_text):
@@ -153,6 +281,27 @@ def get_ocr_variants(plate_text):
     return list(set(variants))
 
 
+def resolve_plate_candidates(plate_text_clean, candidates):
+    """
+    Picks one vehicle when several registered plates share the read's
+    canonical form: the literal plate first, then one reachable through
+    `get_ocr_variants`, then the earliest registered.
+    """
+    if len(candidates) == 1:
+        return candidates[0]
+    
+    for v in candidates:
+        if normalize_plate(v.get('plate_number', '')) == plate_text_clean:
+            return v
+    
+    plate_variants = set(get_ocr_variants(plate_text_clean))
+    for v in candidates:
+        if normalize_plate(v.get('plate_number', '')) in plate_variants:
+            return v
+    
+    return candidates[0]
+
+
 def check_vehicle_access(plate_text, detected_color, detected_make):
     """
     Checks if the detected vehicle allows access.
@@ -160,52 +309,44 @@ def check_vehicle_access(plate_text, detected_color, detected_make):
     
     Returns: (access_granted, message, color_warning)
     """
-    global _vehicle_cache
-    
-    # Always refresh from Supabase to get latest registrations
-    get_registered_vehicles()
+    with metrics.span("match"):
+        result = _check_vehicle_access(plate_text, detected_color, detected_make)
+    metrics.inc('anpr_access_decisions_total', result="granted" if result[0] else "denied")
+    return result
+
+
+def _check_vehicle_access(plate_text, detected_color, detected_make):
+    # Decisions read the resident index only; the first call loads it
+    if not _vehicle_index.loaded:
+        start_vehicle_sync()
         
     plate_text_clean = plate_text.replace(" ", "").replace("\n", "").replace("\r", "").upper()
     
     found_vehicle = None
     best_match_score = 0
     
-    # Generate OCR variants to try
-    plate_variants = get_ocr_variants(plate_text_clean)
-    
     # 1. Find by Plate (exact match first)
-    for v in _vehicle_cache:
-        reg_plate = v.get('plate_number', '').replace(" ", "").upper()
-        
-        # Try exact match with all variants
-        for variant in plate_variants:
-            if reg_plate == variant:
-                found_vehicle = v
-                best_match_score = 1.0
-                print(f"DEBUG: Exact match found: {variant} == {reg_plate}")
-                break
-        
-        if found_vehicle:
-            break
+    # Every OCR variant shares the read's canonical form, so one lookup finds
+    # all exact-or-variant candidates.
+    candidates = _vehicle_index.canonical_candidates(plate_text_clean)
+    if candidates:
+        found_vehicle = resolve_plate_candidates(plate_text_clean, candidates)
+        best_match_score = 1.0
+        metrics.inc('anpr_plate_matches_total', kind="exact")
+        logger.debug("Exact match found: %s == %s", plate_text_clean, found_vehicle.get('plate_number'))
     
-    # 2. If no exact match, try fuzzy matching
+    # 2. If no exact match, try fuzzy matching (indexed, same scores as calculate_similarity)
     if not found_vehicle:
-        for v in _vehicle_cache:
-            reg_plate = v.get('plate_number', '').replace(" ", "").upper()
-            
-            # Calculate similarity
-            similarity = calculate_similarity(plate_text_clean, reg_plate)
-            
-            # Accept if similarity is above threshold (e.g., 80%)
-            if similarity > 0.75 and similarity > best_match_score:
-                found_vehicle = v
-                best_match_score = similarity
-                print(f"DEBUG: Fuzzy match: {plate_text_clean} ~ {reg_plate} (similarity: {similarity:.2f})")
+        found_vehicle, best_match_score = _vehicle_index.fuzzy_match(plate_text_clean)
+        if found_vehicle:
+            metrics.inc('anpr_plate_matches_total', kind="fuzzy")
+            logger.debug("Fuzzy match: %s ~ %s (similarity: %.2f)", plate_text_clean, found_vehicle.get('plate_number'), best_match_score)
             
     if not found_vehicle:
+        metrics.inc('anpr_plate_matches_total', kind="none")
         return False, "Vehicle Not Registered", False
     
-    print(f"DEBUG: Matched plate {plate_text_clean} to registered {found_vehicle.get('plate_number')} (score: {best_match_score:.2f})")
+    logger.debug("Matched plate %s to registered %s (score: %.2f)", plate_text_clean, found_vehicle.get('plate_number'), best_match_score)
         
     # 3. Check Attributes (Color & Make)
     reg_color = found_vehicle.get('color', '').lower()
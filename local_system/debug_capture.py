@@ -0,0 +1,94 @@
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import uuid
+
+import cv2
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class DebugCapture:
+    """
+    Saves intermediate images (plate crops, preprocessed variants) for
+    offline inspection without slowing down recognition.
+
+    Off by default. When enabled, a sampled fraction of events get an ID and
+    their images are encoded and written by a background thread into
+    `<directory>/<event_id>/`. Only the newest `max_events` event folders
+    are kept, and images are dropped rather than queued when the writer
+    falls behind.
+    """
+
+    def __init__(self, directory, enabled=False, sample_rate=1.0, max_events=200, queue_size=64):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def new_event(self):
+        """
+        Returns a new event ID if this event is sampled for capture, else None.
+        IDs sort by creation time.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+    def add(self, event_id, name, image):
+        """Queues `image` to be saved as `<event_id>/<name>.jpg`. No-op without an event."""
+        if event_id is None or image is None or image.size == 0:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((event_id, name, image))
+        except queue.Full:
+            self.dropped += 1
+
+    def event_path(self, event_id):
+        return os.path.join(self.directory, event_id)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="debug-capture", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            event_id, name, image = self._queue.get()
+            try:
+                event_dir = self.event_path(event_id)
+                if not os.path.isdir(event_dir):
+                    os.makedirs(event_dir, exist_ok=True)
+                    self._prune()
+                ok, encoded = cv2.imencode(".jpg", image)
+                if ok:
+                    with open(os.path.join(event_dir, f"{name}.jpg"), "wb") as f:
+                        f.write(encoded.tobytes())
+            except Exception as e:
+                logger.warning("Debug capture error (%s/%s): %s", event_id, name, e)
+
+    def _prune(self):
+        events = sorted(os.listdir(self.directory))
+        for old_event in events[:max(0, len(events) - self.max_events)]:
+            shutil.rmtree(os.path.join(self.directory, old_event), ignore_errors=True)
+
+
+debug_capture = DebugCapture(
+    config.DEBUG_CAPTURE_DIR,
+    enabled=config.DEBUG_CAPTURE_ENABLED,
+    sample_rate=config.DEBUG_CAPTURE_SAMPLE_RATE,
+    max_events=config.DEBUG_CAPTURE_MAX_EVENTS,
+)
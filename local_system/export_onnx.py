@@ -0,0 +1,279 @@
+"""
+Export the plate detector, the EasyOCR recognizer and the vehicle classifiers
+to ONNX for CPU inference, optionally with INT8 dynamic quantization, and
+check the exported models against the originals.
+
+    python export_onnx.py                    # export all three
+    python export_onnx.py --int8             # also write *.int8.onnx
+    python export_onnx.py --parity samples/  # compare backends on real images
+    python -m pytest tests/test_onnx_parity.py  # same check, fails on divergence
+
+Set PLATE_DETECTOR_BACKEND / OCR_BACKEND / CLASSIFIER_BACKEND to "onnx"
+(and ONNX_USE_INT8=1 for the quantized files) to use them.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+import config
+from recognition import onnx_backend
+from recognition.plate_tracker import box_iou
+from telemetry import configure_logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def export_plate_detector():
+    from ultralytics import YOLO
+
+    logger.info("Exporting plate detector from %s...", config.PLATE_DETECTION_MODEL)
+    exported = YOLO(config.PLATE_DETECTION_MODEL).export(
+        format="onnx", imgsz=config.PLATE_IMGSZ, dynamic=False, simplify=True
+    )
+    target = onnx_backend.model_path(onnx_backend.PLATE_MODEL, int8=False)
+    shutil.move(exported, target)
+    return target
+
+
+def export_ocr_recognizer():
+    import easyocr
+    import torch
+
+    logger.info("Exporting EasyOCR recognizer...")
+    reader = easyocr.Reader(['en'], gpu=False)
+
+    class Recognizer(torch.nn.Module):
+        # The recognizer's `text` argument is unused at inference time
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    model = Recognizer(reader.recognizer).eval()
+    dummy = torch.zeros(1, 1, onnx_backend.OnnxTextRecognizer.IMG_HEIGHT, 256)
+    target = onnx_backend.model_path(onnx_backend.OCR_MODEL, int8=False)
+    torch.onnx.export(
+        model, dummy, target,
+        input_names=["image"], output_names=["logits"],
+        dynamic_axes={"image": {0: "batch", 3: "width"}, "logits": {0: "batch", 1: "steps"}},
+        opset_version=17,
+    )
+
+    ignore_char = set(reader.character) - set(reader.lang_char)
+    meta = {
+        'character': reader.character,
+        'ignore_idx': sorted(reader.character.index(c) + 1 for c in ignore_char),
+    }
+    with open(os.path.splitext(target)[0] + ".json", "w") as f:
+        json.dump(meta, f)
+    return target
+
+
+def export_vehicle_classifier():
+    import tensorflow as tf
+    import tf2onnx
+    from recognition.vehicle_classifier import VehicleClassifier
+
+    logger.info("Exporting vehicle classifiers...")
+    classifier = VehicleClassifier(backend="keras")
+    if classifier.fused_model is None:
+        raise RuntimeError("Color and make models could not be fused for export")
+
+    target = onnx_backend.model_path(onnx_backend.CLASSIFIER_MODEL, int8=False)
+    spec = (tf.TensorSpec(classifier.color_model.input_shape, tf.float32, name="image"),)
+    tf2onnx.convert.from_keras(classifier.fused_model, input_signature=spec, opset=13, output_path=target)
+    return target
+
+
+def quantize(source):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    target = source.replace(".onnx", ".int8.onnx")
+    logger.info("Quantizing %s -> %s", source, target)
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    return target
+
+
+# Largest disagreement accepted between the original and the ONNX models,
+# per image; INT8 models get the looser probability bounds
+PARITY_MIN_BOX_IOU = 0.9
+PARITY_MAX_CER = 0.15  # OCR character error rate, about one character of a 7-character plate
+PARITY_MAX_OCR_CONF_DIFF = 0.05
+PARITY_MAX_OCR_CONF_DIFF_INT8 = 0.15
+PARITY_MAX_PROB_DIFF = 1e-3
+PARITY_MAX_PROB_DIFF_INT8 = 0.05
+
+
+def character_error_rate(reference, text):
+    """Levenshtein distance from `reference` to `text`, per reference character."""
+    previous = list(range(len(text) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, char in enumerate(text, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_char != char)))
+        previous = current
+    return previous[-1] / float(max(1, len(reference)))
+
+
+def recognize_crop(reader, plate_img):
+    """
+    (text, confidence) of a plate crop read as one text box by the
+    recognizer alone, with EasyOCR's low-confidence contrast retry off, so
+    both backends run the same network on the same input.
+    """
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    results = reader.recognize(gray, horizontal_list=[[0, width, 0, height]], free_list=[],
+                               detail=1, contrast_ths=0.0)
+    if not results:
+        return "", 0.0
+    _, text, confidence = results[0]
+    return text, float(confidence)
+
+
+def load_parity_models(int8=False):
+    """((reference, onnx) detectors, OCR engines, classifiers) with the read caches off."""
+    from recognition.plate_detector import PlateDetector
+    from recognition.ocr_engine import OCREngine
+    from recognition.vehicle_classifier import VehicleClassifier
+
+    config.ONNX_USE_INT8 = int8
+    detectors = PlateDetector(backend="torch"), PlateDetector(backend="onnx")
+    ocr = OCREngine(backend="easyocr"), OCREngine(backend="onnx")
+    classifiers = VehicleClassifier(backend="keras"), VehicleClassifier(backend="onnx")
+    for model in ocr + classifiers:
+        model.cache = None
+    return detectors, ocr, classifiers
+
+
+def compare_backends(frame, detectors, ocr, classifiers):
+    """
+    Runs both backends on one frame. Returns a dict with the top plate box
+    IoU (1.0 when neither finds a plate), both recognizers' (text,
+    confidence) on the same reference crop, and whether the classifier
+    labels agree and by how much their probabilities differ at most.
+    """
+    ref_boxes, onnx_boxes = (d.detect_boxes(frame) for d in detectors)
+    if ref_boxes and onnx_boxes:
+        iou = box_iou(ref_boxes[0], onnx_boxes[0])
+    else:
+        iou = 0.0 if ref_boxes or onnx_boxes else 1.0
+
+    reads = None
+    vehicle_img = frame
+    if ref_boxes:
+        plate_img = detectors[0].crop(frame, ref_boxes[0])
+        reads = tuple(recognize_crop(engine.reader, plate_img) for engine in ocr)
+        vehicle_img = detectors[0].crop(frame, detectors[0].vehicle_box(ref_boxes[0], frame.shape))
+
+    processed = classifiers[0].preprocess(vehicle_img)
+    ref = [p.numpy() for p in classifiers[0]._fused(processed)]
+    got = classifiers[1]._onnx.predict(processed)
+    return {
+        'iou': iou,
+        'reads': reads,
+        'labels_same': all(np.argmax(r) == np.argmax(g) for r, g in zip(ref, got)),
+        'prob_diff': max(float(np.abs(r - g).max()) for r, g in zip(ref, got)),
+    }
+
+
+def parity_failures(result, int8=False):
+    """Reasons one compare_backends() result is outside the parity tolerances."""
+    max_prob_diff = PARITY_MAX_PROB_DIFF_INT8 if int8 else PARITY_MAX_PROB_DIFF
+    max_conf_diff = PARITY_MAX_OCR_CONF_DIFF_INT8 if int8 else PARITY_MAX_OCR_CONF_DIFF
+    failures = []
+    if result['iou'] < PARITY_MIN_BOX_IOU:
+        failures.append(f"plate box IoU {result['iou']:.3f} < {PARITY_MIN_BOX_IOU}")
+    if result['reads']:
+        (ref_text, ref_conf), (text, conf) = result['reads']
+        cer = character_error_rate(ref_text, text)
+        if cer > PARITY_MAX_CER:
+            failures.append(f"OCR read {ref_text!r} vs {text!r} (CER {cer:.2f} > {PARITY_MAX_CER})")
+        if abs(ref_conf - conf) > max_conf_diff:
+            failures.append(f"OCR confidence {ref_conf:.3f} vs {conf:.3f} (diff > {max_conf_diff})")
+    if not result['labels_same']:
+        failures.append("classifier labels differ")
+    if result['prob_diff'] > max_prob_diff:
+        failures.append(f"classifier prob diff {result['prob_diff']:.4f} > {max_prob_diff}")
+    return failures
+
+
+def check_parity(image_dir, int8=False):
+    """
+    Runs the original and ONNX backends on every image in `image_dir`,
+    reports plate box overlap, OCR agreement and classifier agreement, and
+    returns the number of images outside the parity tolerances.
+    """
+    models = load_parity_models(int8)
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    results, failed = [], 0
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        result = compare_backends(frame, *models)
+        results.append(result)
+        if result['reads']:
+            (ref_text, _), (text, _) = result['reads']
+            logger.info("%s: OCR %r vs %r", os.path.basename(path), ref_text, text)
+        failures = parity_failures(result, int8)
+        if failures:
+            failed += 1
+            logger.warning("%s: %s", os.path.basename(path), "; ".join(failures))
+
+    if not results:
+        logger.warning("No images found.")
+        return 0
+    ious = [r['iou'] for r in results]
+    reads = [(ref[0], got[0]) for ref, got in (r['reads'] for r in results if r['reads'])]
+    logger.info("\nParity over %d images (%s):", len(results), 'INT8' if int8 else 'FP32')
+    logger.info("  plate box IoU       mean %.3f  min %.3f", np.mean(ious), np.min(ious))
+    logger.info("  OCR text identical  %d/%d (same crop, recognizer only)", sum(a == b for a, b in reads), len(reads))
+    logger.info("  classifier labels   %d/%d identical, max prob diff %.4f",
+                sum(r['labels_same'] for r in results), len(results), max(r['prob_diff'] for r in results))
+    logger.info("  outside tolerance   %d/%d", failed, len(results))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export models to ONNX and check parity.")
+    parser.add_argument('--only', choices=['plate', 'ocr', 'classifier'], help="Export a single model")
+    parser.add_argument('--int8', action='store_true', help="Also write INT8 dynamically quantized models")
+    parser.add_argument('--parity', metavar='IMAGE_DIR', help="Skip export; compare backends on these images")
+    args = parser.parse_args()
+    configure_logging(fmt="%(message)s")
+
+    if args.parity:
+        if check_parity(args.parity, int8=args.int8):
+            raise SystemExit(1)
+        return
+
+    os.makedirs(config.ONNX_MODEL_DIR, exist_ok=True)
+    exporters = {
+        'plate': export_plate_detector,
+        'ocr': export_ocr_recognizer,
+        'classifier': export_vehicle_classifier,
+    }
+    for name, export in exporters.items():
+        if args.only and args.only != name:
+            continue
+        path = export()
+        logger.info("Wrote %s", path)
+        if args.int8:
+            logger.info("Wrote %s", quantize(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Shared-memory frame ring for handing frames between processes without copies.
+
+A fixed number of full-resolution frame slots are preallocated in one
+`multiprocessing.shared_memory` block. The capture process writes each frame
+into a free slot once and passes only a small `(slot, seq)` reference to
+other processes; readers (detector, OCR or classifier workers) attach to the
+same block and get a numpy view of the slot. Each slot carries a reference
+count and is reused only after every holder has released it. The ring has
+exactly one writer, since the write sequence lives in its process.
+
+    ring = FrameRing.create(slots=8, shape=(1080, 1920, 3))
+    writer = FrameRing.attach(ring.spec(), writer=True)  # in the capture process
+    ref = writer.write(frame, refs=2)                     # two readers will hold it
+    view = reader.view(ref)                               # in a worker: FrameRing.attach(spec)
+    reader.release(ref)
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Per-slot header fields (int64): reference count, write sequence, frame shape
+_REFS, _SEQ, _HEIGHT, _WIDTH, _CHANNELS = range(5)
+_HEADER_FIELDS = 5
+
+
+class FrameRing:
+    """
+    Preallocated frame slots in shared memory with per-slot reference counts.
+
+    Create it once in the owning process with `create()`, pass `spec()` to
+    other processes as a Process argument (the lock cannot travel through a
+    queue) and `attach()` there; the capture process attaches with
+    `writer=True`. References are
+    plain `(slot, seq)` tuples; `seq` changes on every write, so a stale
+    reference is detected instead of silently reading a newer frame. The
+    sequence counter lives in the writer, which is why there is only one.
+    """
+
+    def __init__(self, shm, slots, shape, lock, writer_pid, owner, writer=False):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self._shm = shm
+        self._lock = lock
+        self._writer_pid = writer_pid
+        self._owner = owner
+        self._writer = writer
+        self._next_slot = 0
+        self._seq = 0
+        self.writes = 0
+        self.dropped = 0
+
+        header_bytes = slots * _HEADER_FIELDS * 8
+        self._header = np.ndarray((slots, _HEADER_FIELDS), dtype=np.int64, buffer=shm.buf)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=header_bytes)
+
+    @classmethod
+    def create(cls, slots=None, shape=None, ctx=None):
+        """Allocates a new ring of `slots` frames of at most `shape` (h, w, c) uint8 pixels."""
+        slots = slots or config.FRAME_RING_SLOTS
+        shape = tuple(shape or config.FRAME_RING_MAX_SHAPE)
+        ctx = ctx or multiprocessing.get_context("spawn")
+        size = slots * _HEADER_FIELDS * 8 + slots * int(np.prod(shape))
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(shm, slots, shape, ctx.Lock(), ctx.Value('q', 0, lock=False), owner=True)
+        ring._header[:] = 0
+        logger.info("Frame ring %s: %d slots of %s (%.1f MB)", shm.name, slots, shape, size / 1e6)
+        return ring
+
+    @classmethod
+    def attach(cls, spec, writer=False):
+        """
+        Opens a ring created in another process from its `spec()`. With
+        `writer=True` this process becomes the ring's only writer;
+        RuntimeError if another process already is.
+        """
+        writer_pid = spec['writer_pid']
+        if writer:
+            with spec['lock']:
+                if writer_pid.value not in (0, os.getpid()):
+                    raise RuntimeError(f"Frame ring {spec['name']} already has a writer (pid {writer_pid.value})")
+                writer_pid.value = os.getpid()
+        # Spawned children share the creator's resource tracker, so attaching
+        # here does not unlink the block when this process exits
+        shm = shared_memory.SharedMemory(name=spec['name'])
+        return cls(shm, spec['slots'], spec['shape'], spec['lock'], writer_pid, owner=False, writer=writer)
+
+    def spec(self):
+        """What another process needs to `attach()` to this ring."""
+        return {
+            'name': self._shm.name, 'slots': self.slots, 'shape': self.shape,
+            'lock': self._lock, 'writer_pid': self._writer_pid,
+        }
+
+    def write(self, frame, refs=1):
+        """
+        Copies `frame` into a free slot held by `refs` readers and returns its
+        reference, or None (and counts a drop) when every slot is still held.
+        """
+        if not self._writer:
+            raise RuntimeError("Only the process attached with writer=True may write to the frame ring")
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        if height > self.shape[0] or width > self.shape[1] or channels > self.shape[2]:
+            raise ValueError(f"Frame {frame.shape} does not fit ring slots of {self.shape}")
+
+        with self._lock:
+            slot = self._claim_slot()
+            if slot is None:
+                self.dropped += 1
+                return None
+            self._seq += 1
+            # Hold the slot while copying so no reader can see a half-written frame
+            self._header[slot] = (refs, -1, height, width, channels)
+
+        self._frames[slot, :height, :width, :channels] = frame.reshape(height, width, channels)
+        with self._lock:
+            self._header[slot, _SEQ] = self._seq
+        self.writes += 1
+        return slot, self._seq
+
+    def view(self, ref):
+        """Read-only numpy view of a referenced frame (no copy)."""
+        slot, seq = ref
+        with self._lock:
+            refs, current, height, width, channels = (int(v) for v in self._header[slot])
+        if current != seq or refs <= 0:
+            raise LookupError(f"Frame slot {slot} no longer holds frame {seq}")
+        frame = self._frames[slot, :height, :width, :channels]
+        if channels == 1:
+            frame = frame[:, :, 0]
+        frame.flags.writeable = False
+        return frame
+
+    def retain(self, ref, count=1):
+        """Adds `count` holders to a referenced frame, e.g. before fanning it out."""
+        slot, seq = ref
+        with self._lock:
+            if self._header[slot, _SEQ] != seq or self._header[slot, _REFS] <= 0:
+                raise LookupError(f"Frame slot {slot} no longer holds frame {seq}")
+            self._header[slot, _REFS] += count
+
+    def release(self, ref):
+        """Drops one holder; the slot is free for reuse when none are left."""
+        slot, seq = ref
+        with self._lock:
+            if self._header[slot, _SEQ] == seq and self._header[slot, _REFS] > 0:
+                self._header[slot, _REFS] -= 1
+
+    def in_use(self):
+        """Number of slots currently held by at least one reader."""
+        with self._lock:
+            return int(np.count_nonzero(self._header[:, _REFS]))
+
+    def close(self):
+        # Views into the block must be dropped before the mapping can close
+        self._header = None
+        self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with the process
+            logger.debug("Frame ring %s closed with views still alive", self._shm.name)
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _claim_slot(self):
+        # Round-robin from the last write so slots age evenly; caller holds the lock
+        for i in range(self.slots):
+            slot = (self._next_slot + i) % self.slots
+            if self._header[slot, _REFS] == 0:
+                self._next_slot = (slot + 1) % self.slots
+                return slot
+        return None
+
+
+def _capture_main(spec, source, fps, refs_out, stop):
+    """Capture process: reads `source` into the ring and queues frame references."""
+    import cv2
+    from stream_pipeline import FrameSource
+    from telemetry import configure_logging
+
+    configure_logging()
+    ring = FrameRing.attach(spec, writer=True)
+    frame_source = FrameSource(source, fps=fps)
+    max_height, max_width = ring.shape[:2]
+    try:
+        while not stop.is_set():
+            frame = frame_source.read()
+            if frame is None:
+                break
+            height, width = frame.shape[:2]
+            if height > max_height or width > max_width:
+                scale = min(max_height / height, max_width / width)
+                frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+            ref = ring.write(frame)
+            if ref is None:
+                # Every slot is still held downstream; skip this frame like a full queue would
+                continue
+            while True:
+                try:
+                    refs_out.put_nowait(ref)
+                    break
+                except queue.Full:
+                    # Consumer is behind: drop the oldest queued frame, not the newest
+                    try:
+                        ring.release(refs_out.get_nowait())
+                    except queue.Empty:
+                        pass
+    finally:
+        frame_source.release()
+        refs_out.put(None)
+        ring.close()
+
+
+class SharedFrameSource:
+    """
+    FrameSource that captures in a separate process through a FrameRing.
+
+    Decoding and camera I/O run off the inference process's GIL, and frames
+    arrive as views into shared memory instead of pickled arrays. Each frame
+    returned by `read()` is held until `done(frame)` is called, so consumers
+    must copy anything they keep beyond that.
+    """
+
+    zero_copy = True
+
+    def __init__(self, source, fps=None, slots=None, shape=None, queue_size=None):
+        ctx = multiprocessing.get_context("spawn")
+        self.source = source
+        self.fps = fps
+        self.live = isinstance(source, int) or (isinstance(source, str) and source.isdigit())
+        self.ring = FrameRing.create(slots, shape, ctx=ctx)
+        # Fewer queued references than slots, so a free slot is usually waiting
+        queue_size = queue_size or max(1, self.ring.slots // 2)
+        self._refs = ctx.Queue(queue_size)
+        self._stop = ctx.Event()
+        self._held = {}
+        self._exhausted = False
+        self._process = ctx.Process(
+            target=_capture_main, args=(self.ring.spec(), source, fps, self._refs, self._stop),
+            name="frame-capture", daemon=True,
+        )
+        self._process.start()
+
+    def read(self, timeout=5.0):
+        """Returns a read-only view of the next frame, or None when the source is exhausted."""
+        while not self._exhausted:
+            try:
+                ref = self._refs.get(timeout=timeout)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    break
+                continue
+            if ref is None:
+                break
+            frame = self.ring.view(ref)
+            self._held[id(frame)] = ref
+            return frame
+        self._exhausted = True
+        return None
+
+    def done(self, frame):
+        """Releases a frame returned by `read()` back to the capture process."""
+        ref = self._held.pop(id(frame), None)
+        if ref is not None:
+            self.ring.release(ref)
+
+    def release(self):
+        self._stop.set()
+        # Unblock a capture process waiting on a full queue
+        deadline = time.monotonic() + 2.0
+        while self._process.is_alive() and time.monotonic() < deadline:
+            try:
+                self._refs.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join(1.0)
+        self._held.clear()
+        self.ring.close()
@@ -0,0 +1,476 @@
+"""
+Headless gate service for several lanes (cameras/gates) in one process.
+
+Each model is loaded once and shared by every lane. A capture thread per
+lane keeps only that lane's newest frame; the detector takes at most one
+frame from each lane per batch, rotating which lanes go first, so a busy
+lane cannot crowd out the others. Plate reads and vehicle classification
+are queued per lane and served earliest-deadline-first, where a job's
+deadline is its frame's capture time plus the lane's latency target
+(GATE_LANE_SLO_MS or the lane's "slo_ms"). Capture-to-decision latency
+and target misses are reported per lane.
+
+    python gate_server.py                      # lanes from config.GATE_LANES
+    python gate_server.py --lane entry=0 --lane exit=clips/exit.mp4
+"""
+import argparse
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+import config
+from database import check_vehicle_access, log_access_attempt, start_vehicle_sync, stop_access_log_writer
+from frame_ring import SharedFrameSource
+from recognition.crop_quality import assess_crop
+from recognition.plate_tracker import PlateTracker
+from stream_pipeline import FrameSource, StageStats
+from telemetry import configure_logging, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Lane:
+    """One camera/gate: its frame source, plate tracker and decision state."""
+
+    def __init__(self, name, source, slo_ms=None, fps=None, shared_capture=False):
+        self.name = name
+        self.slo = (slo_ms or config.GATE_LANE_SLO_MS) / 1000.0
+        if shared_capture:
+            self.source = SharedFrameSource(source, fps=fps)
+        else:
+            self.source = FrameSource(source, fps=fps)
+        self.tracker = PlateTracker(
+            iou_threshold=config.TRACK_IOU_THRESHOLD,
+            max_missed=config.TRACK_MAX_MISSED,
+            reocr_gain=config.TRACK_REOCR_GAIN,
+            reocr_interval=config.TRACK_REOCR_INTERVAL,
+            min_readings=config.TRACK_MIN_READINGS,
+            decide_confidence=config.TRACK_DECIDE_CONFIDENCE,
+            max_deferrals=config.CROP_MAX_DEFERRALS,
+        )
+        self.recent_plates = {}
+        self.exhausted = False
+        self.frames = 0
+        self.skipped = 0
+        self.decisions = 0
+        self.slo_misses = 0
+        self.latencies = collections.deque(maxlen=500)
+        self._latest = None
+        self._lock = threading.Lock()
+
+    @property
+    def borrowed_frames(self):
+        # Shared-memory frames go back to the ring once detection is done
+        return getattr(self.source, 'zero_copy', False)
+
+    def offer(self, frame, captured_at):
+        """Makes `frame` the lane's next frame, releasing one never detected."""
+        with self._lock:
+            replaced, self._latest = self._latest, (frame, captured_at)
+            self.frames += 1
+        if replaced is not None:
+            self.skipped += 1
+            metrics.inc('anpr_lane_frames_skipped_total', lane=self.name)
+            self.done(replaced[0])
+
+    def take(self):
+        """The newest undetected (frame, captured_at), or None."""
+        with self._lock:
+            latest, self._latest = self._latest, None
+            return latest
+
+    @property
+    def pending(self):
+        return self._latest is not None
+
+    def done(self, frame):
+        done = getattr(self.source, 'done', None)
+        if done:
+            done(frame)
+
+    def recently_decided(self, plate_text):
+        # Unread plates are different vehicles, so they are never merged
+        if not plate_text:
+            return False
+        decided_at = self.recent_plates.get(plate_text)
+        return decided_at is not None and time.monotonic() - decided_at < config.STREAM_DECISION_COOLDOWN
+
+    def remember_decision(self, plate_text):
+        if not plate_text:
+            return
+        now = time.monotonic()
+        # Oldest decisions sit first; forget those past the cooldown so the map stays small
+        for plate, decided_at in list(self.recent_plates.items()):
+            if now - decided_at < config.STREAM_DECISION_COOLDOWN:
+                break
+            del self.recent_plates[plate]
+        self.recent_plates.pop(plate_text, None)
+        self.recent_plates[plate_text] = now
+
+    def record_decision(self, latency):
+        self.decisions += 1
+        self.latencies.append(latency)
+        metrics.observe('anpr_lane_decision_seconds', latency, lane=self.name)
+        if latency > self.slo:
+            self.slo_misses += 1
+            metrics.inc('anpr_lane_slo_misses_total', lane=self.name)
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'decisions': self.decisions,
+            'slo_misses': self.slo_misses,
+            'p95_latency': p95,
+            'slo': self.slo,
+        }
+
+
+class LaneQueue:
+    """
+    Per-lane FIFOs served earliest-deadline-first across lanes.
+
+    Only each lane's oldest job competes, so one lane's backlog waits its
+    turn behind the others' jobs rather than in front of them. A full lane
+    drops its own oldest job; with `maxsize=None` nothing is dropped.
+    Jobs taken by `get_batch()` count as unfinished until `task_done()`.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lanes = collections.defaultdict(collections.deque)
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.unfinished = 0
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(jobs) for jobs in self._lanes.values())
+
+    def pending(self):
+        """Jobs queued or taken but not yet marked done."""
+        with self._cond:
+            return sum(len(jobs) for jobs in self._lanes.values()) + self.unfinished
+
+    def task_done(self, count=1):
+        with self._cond:
+            self.unfinished -= count
+
+    def put(self, lane, deadline, item):
+        with self._cond:
+            jobs = self._lanes[lane.name]
+            if self.maxsize is not None and len(jobs) >= self.maxsize:
+                jobs.popleft()
+                self.dropped += 1
+            jobs.append((deadline, lane, item))
+            self._cond.notify()
+
+    def get_batch(self, max_items=1, timeout=None):
+        """Up to `max_items` (lane, item) pairs, most urgent first; [] on timeout."""
+        with self._cond:
+            if not any(self._lanes.values()):
+                self._cond.wait(timeout)
+            batch = []
+            while len(batch) < max_items:
+                heads = [(jobs[0][0], name) for name, jobs in self._lanes.items() if jobs]
+                if not heads:
+                    break
+                _, name = min(heads)
+                _, lane, item = self._lanes[name].popleft()
+                batch.append((lane, item))
+            self.unfinished += len(batch)
+            return batch
+
+
+class GateServer:
+    """Serves every lane from one plate detector, OCR engine and classifier."""
+
+    STAGES = ('detect', 'ocr', 'classify')
+
+    def __init__(self, lanes, plate_detector, ocr_engine, vehicle_classifier, batch_size=None, queue_size=None):
+        self.lanes = list(lanes)
+        self.plate_detector = plate_detector
+        self.ocr_engine = ocr_engine
+        self.vehicle_classifier = vehicle_classifier
+        self.batch_size = batch_size or config.PLATE_BATCH_SIZE
+
+        queue_size = queue_size or config.STREAM_QUEUE_SIZE
+        # Plate crops go stale and may be dropped; classify jobs are one per vehicle
+        self.queues = {'ocr': LaneQueue(queue_size), 'classify': LaneQueue(None)}
+        self.stats = {stage: StageStats(stage) for stage in self.STAGES}
+        self._frame_ready = threading.Event()
+        self._stop = threading.Event()
+        self._next_lane = 0
+        self._detecting = False
+        self._capture_threads = []
+        self._threads = []
+
+    @property
+    def running(self):
+        if self._stop.is_set() or not self._threads:
+            return False
+        return (
+            any(t.is_alive() for t in self._capture_threads)
+            or any(lane.pending for lane in self.lanes)
+            or any(q.pending() for q in self.queues.values())
+            or self._detecting
+        )
+
+    def start(self):
+        self._stop.clear()
+        self._capture_threads = [
+            threading.Thread(target=self._capture_loop, args=(lane,), name=f"gate-capture-{lane.name}", daemon=True)
+            for lane in self.lanes
+        ]
+        workers = {'detect': self._detect_loop, 'ocr': self._ocr_loop, 'classify': self._classify_loop}
+        self._threads = [
+            threading.Thread(target=workers[stage], name=f"gate-{stage}", daemon=True) for stage in self.STAGES
+        ]
+        for t in self._capture_threads + self._threads:
+            t.start()
+        logger.info("Gate server running %d lane(s): %s", len(self.lanes), ", ".join(l.name for l in self.lanes))
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for t in self._capture_threads + self._threads:
+            t.join(timeout)
+        for lane in self.lanes:
+            lane.source.release()
+
+    def wait(self):
+        """Blocks until every lane's source is exhausted and all work has drained."""
+        while self.running:
+            time.sleep(0.05)
+        self.stop()
+
+    def lane_stats(self):
+        return {lane.name: lane.snapshot() for lane in self.lanes}
+
+    def stage_stats(self):
+        report = {}
+        for stage in self.STAGES:
+            report[stage] = self.stats[stage].snapshot()
+            q = self.queues.get(stage)
+            report[stage]['queue_depth'] = len(q) if q is not None else 0
+            report[stage]['dropped'] = q.dropped if q is not None else 0
+        return report
+
+    def _capture_loop(self, lane):
+        while not self._stop.is_set():
+            frame = lane.source.read()
+            if frame is None:
+                logger.info("Lane %s: source exhausted.", lane.name)
+                lane.exhausted = True
+                break
+            lane.offer(frame, time.monotonic())
+            self._frame_ready.set()
+
+    def _next_frames(self):
+        """At most one newest frame per lane, starting one lane later each batch."""
+        batch = []
+        count = len(self.lanes)
+        for i in range(count):
+            if len(batch) >= self.batch_size:
+                break
+            lane = self.lanes[(self._next_lane + i) % count]
+            latest = lane.take()
+            if latest is not None:
+                batch.append((lane,) + latest)
+        self._next_lane = (self._next_lane + 1) % count
+        return batch
+
+    def _detect_loop(self):
+        while not self._stop.is_set():
+            self._frame_ready.clear()
+            self._detecting = True
+            batch = self._next_frames()
+            if not batch:
+                self._detecting = False
+                self._frame_ready.wait(0.05)
+                continue
+            started = time.perf_counter()
+            try:
+                boxes_per_frame = self.plate_detector.detect_batch([frame for _, frame, _ in batch])
+                for (lane, frame, captured_at), boxes in zip(batch, boxes_per_frame):
+                    self._track(lane, frame, captured_at, boxes)
+            except Exception as e:
+                logger.exception("Gate detect error: %s", e)
+            finally:
+                for lane, frame, _ in batch:
+                    lane.done(frame)
+                self._detecting = False
+            self.stats['detect'].record(time.perf_counter() - started)
+
+    def _track(self, lane, frame, captured_at, boxes):
+        to_ocr, finished = lane.tracker.update(boxes, frame)
+        if lane.borrowed_frames:
+            frame = lane.tracker.keep_frame(frame, np.copy)
+        deadline = captured_at + lane.slo
+        for track in to_ocr:
+            plate_img = self.plate_detector.crop(frame, track.box)
+            if not plate_img.size:
+                lane.tracker.defer_ocr(track.track_id)
+                continue
+            usable, reason, _ = assess_crop(plate_img)
+            if not usable:
+                if lane.tracker.defer_ocr(track.track_id):
+                    # Wait for a better frame of this vehicle
+                    logger.debug("Lane %s track %d: crop unusable (%s)", lane.name, track.track_id, reason)
+                    continue
+                # No better frame came; read the largest crop seen rather than lose the vehicle
+                logger.debug("Lane %s track %d: no usable crop after %d tries, reading the best one",
+                             lane.name, track.track_id, track.deferrals)
+                plate_img = self.plate_detector.crop(track.best_frame, track.best_box)
+            if lane.borrowed_frames:
+                plate_img = plate_img.copy()
+            self.queues['ocr'].put(lane, deadline, (track.track_id, plate_img, track.rereading, captured_at))
+        # Vehicles that left before enough readings are decided on what we have,
+        # an empty plate when none of their crops was usable
+        for track in finished:
+            self.queues['classify'].put(
+                lane, deadline, (track.best_frame, track.best_box, track.fused_text(), captured_at)
+            )
+
+    def _ocr_loop(self):
+        while not self._stop.is_set():
+            batch = self.queues['ocr'].get_batch(1, timeout=0.1)
+            if not batch:
+                continue
+            lane, (track_id, plate_img, rereading, captured_at) = batch[0]
+            started = time.perf_counter()
+            try:
+                # A cached result for a re-read would only repeat an earlier vote
+                plate_text, confidence = self.ocr_engine.extract_text_with_confidence(
+                    plate_img, use_cache=not rereading
+                )
+                # No operator in the loop: unreadable plates wait for a better frame
+                if not plate_text or not self.ocr_engine.validate_plate(plate_text):
+                    plate_text = ""
+                track = lane.tracker.add_reading(track_id, plate_text, confidence)
+                if track is not None:
+                    self.queues['classify'].put(
+                        lane, captured_at + lane.slo,
+                        (track.best_frame, track.best_box, track.fused_text(), captured_at),
+                    )
+            except Exception as e:
+                logger.exception("Gate OCR error on lane %s: %s", lane.name, e)
+            finally:
+                self.queues['ocr'].task_done()
+            self.stats['ocr'].record(time.perf_counter() - started)
+
+    def _classify_loop(self):
+        while not self._stop.is_set():
+            taken = self.queues['classify'].get_batch(config.GATE_CLASSIFY_BATCH, timeout=0.1)
+            batch = [(lane, job) for lane, job in taken if not lane.recently_decided(job[2])]
+            if not batch:
+                self.queues['classify'].task_done(len(taken))
+                continue
+            started = time.perf_counter()
+            try:
+                crops = []
+                for _, (frame, plate_box, _, _) in batch:
+                    vehicle_box = self.plate_detector.vehicle_box(plate_box, frame.shape)
+                    crops.append(self.plate_detector.crop(frame, vehicle_box))
+                results = self.vehicle_classifier.classify_batch(crops)
+                for (lane, (_, _, plate_text, captured_at)), (color, _, make, _) in zip(batch, results):
+                    self._decide(lane, plate_text, color, make, captured_at)
+            except Exception as e:
+                logger.exception("Gate classify error: %s", e)
+            finally:
+                self.queues['classify'].task_done(len(taken))
+            self.stats['classify'].record(time.perf_counter() - started)
+
+    def _decide(self, lane, plate_text, color, make, captured_at):
+        # Two reads of one vehicle can share a classifier batch
+        if lane.recently_decided(plate_text):
+            return
+        lane.remember_decision(plate_text)
+
+        access, msg, color_warning = check_vehicle_access(plate_text, color, make)
+        log_access_attempt(
+            plate_number=plate_text,
+            detected_color=color,
+            detected_model=make,
+            plate_matched=access,
+            color_matched=not color_warning
+        )
+        latency = time.monotonic() - captured_at
+        lane.record_decision(latency)
+        logger.info("Lane %s decision: %s -> %s (%s) in %.0f ms",
+                    lane.name, plate_text, 'OPEN' if access else 'CLOSED', msg, latency * 1000)
+
+
+def parse_lane(value):
+    """`name=source[@slo_ms]` from the command line, as a GATE_LANES entry."""
+    name, _, source = value.partition("=")
+    if not name or not source:
+        raise argparse.ArgumentTypeError(f"Expected name=source[@slo_ms], got {value!r}")
+    lane = {'name': name, 'source': source}
+    source, _, slo_ms = source.rpartition("@")
+    if source and slo_ms.isdigit():
+        lane.update(source=source, slo_ms=int(slo_ms))
+    return lane
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve several gate lanes from one set of models.")
+    parser.add_argument('--lane', action='append', type=parse_lane, default=None,
+                        help="Lane as name=source[@slo_ms]; repeat per lane (default: config.GATE_LANES)")
+    parser.add_argument('--fps', type=float, default=None, help="Pace for file sources")
+    parser.add_argument('--shared-capture', action='store_true',
+                        help="Capture each lane in its own process through shared memory")
+    args = parser.parse_args()
+    configure_logging()
+    metrics.start_export()
+
+    from model_loader import ModelLoader
+    from recognition.plate_detector import PlateDetector
+    from recognition.ocr_engine import OCREngine
+    from recognition.vehicle_classifier import VehicleClassifier
+
+    models = ModelLoader([
+        ("plate_detector", PlateDetector),
+        ("ocr_engine", OCREngine),
+        ("vehicle_classifier", VehicleClassifier),
+        ("vehicles", start_vehicle_sync),
+    ])
+    models.start()
+    lanes = [
+        Lane(spec['name'], spec['source'], spec.get('slo_ms'), fps=args.fps, shared_capture=args.shared_capture)
+        for spec in (args.lane or config.GATE_LANES)
+    ]
+    server = GateServer(
+        lanes, models.get("plate_detector"), models.get("ocr_engine"), models.get("vehicle_classifier")
+    )
+    models.get("vehicles")  # Decide against the loaded fleet from the first frame
+    server.start()
+    try:
+        while server.running:
+            time.sleep(config.STREAM_STATS_INTERVAL)
+            lines = ["Lane stats:"]
+            for name, s in server.lane_stats().items():
+                lines.append(f"  {name:<12} frames {s['frames']:6d}  skipped {s['skipped']:6d}  "
+                             f"decisions {s['decisions']:4d}  p95 {s['p95_latency'] * 1000:7.1f} ms "
+                             f"(target {s['slo'] * 1000:.0f})  misses {s['slo_misses']}")
+            for stage, s in server.stage_stats().items():
+                lines.append(f"  {stage:<12} {s['per_second']:6.1f}/s  avg {s['avg_latency'] * 1000:7.1f} ms  "
+                             f"queue {s['queue_depth']}  dropped {s['dropped']}")
+            logger.info("\n".join(lines))
+            for name, s in server.lane_stats().items():
+                if s['decisions'] and s['p95_latency'] > s['slo']:
+                    logger.warning("Lane %s p95 latency %.0f ms is over its %.0f ms target",
+                                   name, s['p95_latency'] * 1000, s['slo'] * 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        stop_access_log_writer()
+
+
+if __name__ == "__main__":
+    main()
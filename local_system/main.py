@@ -1,33 +1,84 @@
 import cv2
+import logging
 import tkinter as tk
-from tkinter import simpledialog, messagebox, filedialog
+from tkinter import messagebox, filedialog
 import threading
-import time
-from database import get_registered_vehicles, check_vehicle_access, log_access_attempt
+from telemetry import configure_logging, metrics
+# Before the other imports, so their import-time messages are logged
+configure_logging()
+from database import start_vehicle_sync, check_vehicle_access, log_access_attempt, stop_access_log_writer
 from recognition.plate_detector import PlateDetector
 from recognition.ocr_engine import OCREngine
 from recognition.vehicle_classifier import VehicleClassifier
+from recognition.crop_quality import assess_crop
 from ui import GateUI
-from config import BASE_DIR
+from debug_capture import debug_capture
+from model_loader import ModelLoader
+from stream_pipeline import StreamPipeline
+from config import BASE_DIR, CAMERA_INDEX
 from PIL import Image, ImageTk
 
+logger = logging.getLogger(__name__)
+
 class ANPRSystem:
     def __init__(self):
         self.root = tk.Tk()
         self.ui = GateUI(self.root, on_reset_callback=self.reset_system)
         
-        # Initialize modules
-        print("Initializing Logic Modules...")
-        self.plate_detector = PlateDetector()
-        self.ocr_engine = OCREngine()
-        self.vehicle_classifier = VehicleClassifier()
-        
-        # Sync simple database cache
-        self.registered_vehicles = get_registered_vehicles()
-        print(f"Loaded {len(self.registered_vehicles) if self.registered_vehicles else 0} registered vehicles.")
+        # Initialize modules in the background; the window shows their progress
+        logger.info("Initializing Logic Modules...")
+        self.models = ModelLoader(
+            [
+                ("plate_detector", PlateDetector),
+                ("ocr_engine", OCREngine),
+                ("vehicle_classifier", VehicleClassifier),
+                # Load the vehicle index once; realtime events keep it current
+                ("vehicles", self.load_vehicles),
+            ],
+            on_update=lambda name, state: self.root.after(0, self.refresh_status),
+        )
+        self.models.start()
         
         # Track image window for cleanup
         self.image_window = None
+        
+        # Live camera pipeline (started from the UI)
+        self.stream = None
+        self.stream_btn = None
+
+    @property
+    def plate_detector(self):
+        return self.models.get("plate_detector")
+
+    @property
+    def ocr_engine(self):
+        return self.models.get("ocr_engine")
+
+    @property
+    def vehicle_classifier(self):
+        return self.models.get("vehicle_classifier")
+
+    def load_vehicles(self):
+        self.registered_vehicles = start_vehicle_sync()
+        logger.info("Loaded %d registered vehicles.", len(self.registered_vehicles) if self.registered_vehicles else 0)
+        return self.registered_vehicles
+
+    def refresh_status(self):
+        """Shows model loading progress in the UI."""
+        if self.models.ready:
+            failed = [name for name, state in self.models.states.items() if state == "failed"]
+            if failed:
+                self.ui.set_status(f"⚠ Failed to load: {', '.join(failed)}", ready=False)
+            else:
+                self.ui.set_status("✓ System ready", ready=True)
+            return
+        
+        marks = {"ready": "✓", "failed": "✗"}
+        parts = [
+            f"{name.replace('_', ' ')} {marks.get(state, '…')}"
+            for name, state in self.models.states.items()
+        ]
+        self.ui.set_status("Loading: " + " · ".join(parts), ready=False)
 
     def upload_image(self):
         file_path = filedialog.askopenfilename(
@@ -38,7 +89,7 @@ class ANPRSystem:
         if not file_path:
             return
             
-        print(f"Processing image: {file_path}")
+        logger.info("Processing image: %s", file_path)
         
         # Read image using cv2 for processing
         frame = cv2.imread(file_path)
@@ -50,9 +101,7 @@ class ANPRSystem:
         self.ui.reset_ui()
 
         # Display image in the UI panel
-        rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(rgb_img)
-        self.ui.update_image(pil_img)
+        self.ui.show_frame(frame, force=True)
         
         # Run processing
         threading.Thread(target=self.process_image, args=(frame,)).start()
@@ -80,57 +129,115 @@ class ANPRSystem:
         lbl.pack()
 
     def process_image(self, frame):
+        # A model that failed to load raises here; report it instead of
+        # letting this worker thread die silently
+        try:
+            plate_detector, ocr_engine, vehicle_classifier = (
+                self.plate_detector, self.ocr_engine, self.vehicle_classifier
+            )
+        except RuntimeError as e:
+            error = str(e)
+            logger.error("Cannot process image: %s", error)
+            self.root.after(0, lambda: self.ui.set_status(f"⚠ Cannot process image: {error}", ready=False))
+            return
+        
         # 1. Detect Plate
-        plate_img = self.plate_detector.detect_plate(frame)
+        plate_img, vehicle_img = plate_detector.detect_plate_and_vehicle(frame)
         
         if plate_img is not None:
              # Show plate in UI (optional, can be done similar to show_image_window)
              # self.root.after(0, lambda: self.show_image_window(plate_img, "Detected Plate"))
             
-            plate_text = self.ocr_engine.extract_text(plate_img)
-            valid_plate = self.ocr_engine.validate_plate(plate_text)
+            debug_event = debug_capture.new_event()
+            debug_capture.add(debug_event, "frame", frame)
+            # 2. Read the plate, unless the crop is too small, blurred or badly exposed to be worth it
+            usable, reason, _ = assess_crop(plate_img)
+            if usable:
+                plate_text = ocr_engine.extract_text(plate_img, debug_event)
+                valid_plate = ocr_engine.validate_plate(plate_text)
+                logger.info("OCR Raw: %s (Valid: %s)", plate_text, valid_plate)
+            else:
+                plate_text, valid_plate = "", False
+                logger.info("Plate crop unusable (%s); skipping OCR.", reason)
             
-            print(f"OCR Raw: {plate_text} (Valid: {valid_plate})")
+            # 3. Classify Attributes (on the vehicle region, not the whole frame)
+            color, color_conf, make, make_conf = vehicle_classifier.classify(vehicle_img)
             
-            # If OCR failed or returned invalid plate, allow manual entry
+            logger.info("Attributes: %s (%.2f), %s (%.2f)", color, color_conf, make, make_conf)
+            
+            # If OCR failed or returned invalid plate, ask the operator on the
+            # Tk thread; this worker finishes now instead of waiting for them
             if not plate_text or not valid_plate:
-                manual_plate = simpledialog.askstring(
-                    "Manual Plate Entry",
-                    "OCR could not read the plate.\nPlease enter the plate number manually:",
-                    parent=self.root
+                problem = "OCR could not read the plate." if usable else f"The plate image is unusable ({reason})."
+                self.ui.request_manual_entry(
+                    lambda manual_plate: self.on_manual_entry(manual_plate, color, make, debug_event),
+                    problem + "\nPlease enter the plate number manually:",
                 )
-                if manual_plate:
-                    plate_text = manual_plate.strip().upper()
-                    print(f"Manual entry: {plate_text}")
-                else:
-                    print("User cancelled manual entry.")
-                    return
-            
-            # 3. Classify Attributes
-            color, color_conf = self.vehicle_classifier.predict_color(frame)
-            make, make_conf = self.vehicle_classifier.predict_make(frame)
-            
-            print(f"Attributes: {color} ({color_conf:.2f}), {make} ({make_conf:.2f})")
-            
-            # 4. Check Access
-            access, msg, color_warning = check_vehicle_access(plate_text, color, make)
-            
-            # 5. Log access attempt to Supabase
-            log_access_attempt(
-                plate_number=plate_text,
-                detected_color=color,
-                detected_model=make,
-                plate_matched=access,
-                color_matched=not color_warning
-            )
+                return
             
-            # Update UI
-            self.root.after(0, lambda: self.ui.update_info(plate_text, color, make, msg, access, color_warning))
+            self.decide(plate_text, color, make, debug_event)
             
         else:
-            print("No plate detected.")
+            logger.info("No plate detected.")
             self.root.after(0, lambda: messagebox.showinfo("Result", "No license plate detected in this image."))
 
+    def on_manual_entry(self, plate_text, color, make, debug_event):
+        if not plate_text:
+            logger.info("User cancelled manual entry.")
+            return
+        metrics.inc('anpr_manual_entries_total')
+        logger.info("Manual entry: %s", plate_text)
+        threading.Thread(target=self.decide, args=(plate_text, color, make, debug_event), daemon=True).start()
+
+    def decide(self, plate_text, color, make, debug_event=None):
+        # 4. Check Access
+        access, msg, color_warning = check_vehicle_access(plate_text, color, make)
+        
+        # 5. Log access attempt to Supabase (queued, written in the background)
+        log_access_attempt(
+            plate_number=plate_text,
+            detected_color=color,
+            detected_model=make,
+            plate_matched=access,
+            color_matched=not color_warning,
+            debug_event_id=debug_event
+        )
+        
+        # Update UI
+        self.root.after(0, lambda: self.ui.update_info(plate_text, color, make, msg, access, color_warning))
+
+    def toggle_stream(self):
+        """Starts or stops continuous capture from the configured camera."""
+        if self.stream and self.stream.running:
+            self.stream.stop()
+            self.stream_btn.config(text="🎥 Start Live Camera")
+            return
+        
+        if not self.models.ready:
+            messagebox.showinfo("Please wait", "Models are still loading.")
+            return
+        
+        self.stream = StreamPipeline(
+            self.plate_detector,
+            self.ocr_engine,
+            self.vehicle_classifier,
+            on_decision=self.on_stream_decision,
+            on_frame=self.on_stream_frame,
+        )
+        try:
+            self.stream.start(CAMERA_INDEX)
+        except IOError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.stream_btn.config(text="⏹ Stop Live Camera")
+
+    def on_stream_frame(self, frame):
+        # The presenter keeps the newest frame and caps the preview rate
+        self.ui.show_frame(frame)
+
+    def on_stream_decision(self, frame, plate_text, color, make, msg, access, color_warning):
+        self.root.after(0, lambda: self.ui.update_info(plate_text, color, make, msg, access, color_warning))
+
     def reset_system(self):
         # Cleaup if needed
         pass
@@ -153,9 +260,29 @@ class ANPRSystem:
         )
         upload_btn.pack(pady=20)
         
+        self.stream_btn = tk.Button(
+            self.root,
+            text="🎥 Start Live Camera",
+            command=self.toggle_stream,
+            font=("Segoe UI", 12),
+            bg="#444",
+            fg="white",
+            activebackground="#666",
+            activeforeground="white",
+            relief="flat",
+            padx=20,
+            pady=10,
+            cursor="hand2"
+        )
+        self.stream_btn.pack(pady=(0, 20))
+        
+        metrics.start_export()
         self.root.mainloop()
         
         # Cleanup
+        if self.stream:
+            self.stream.stop()
+        stop_access_log_writer()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoader:
+    """
+    Builds the recognition modules concurrently in the background so the
+    window can appear immediately.
+
+    Each component is a name and a zero-argument factory. `get(name)` blocks
+    until that component is ready; `on_update(name, state)` is called from
+    the loader threads as components go "loading" -> "ready" / "failed".
+    """
+
+    def __init__(self, factories, on_update=None):
+        self.factories = dict(factories)
+        self.on_update = on_update
+        self.timings = {}
+        self.wall_time = None
+        self.errors = {}
+        self.states = {name: "pending" for name in self.factories}
+
+        self._components = {}
+        self._events = {name: threading.Event() for name in self.factories}
+        self._executor = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.factories), thread_name_prefix="model-load")
+        for name in self.factories:
+            self._executor.submit(self._load, name)
+        self._executor.shutdown(wait=False)
+        threading.Thread(target=self._report_when_done, name="model-load-report", daemon=True).start()
+
+    @property
+    def ready(self):
+        return all(event.is_set() for event in self._events.values())
+
+    def get(self, name, timeout=None):
+        """Returns the component, waiting for it to load. Raises if loading failed."""
+        if not self._events[name].wait(timeout):
+            raise TimeoutError(f"{name} is still loading")
+        if name in self.errors:
+            raise RuntimeError(f"{name} failed to load: {self.errors[name]}")
+        return self._components[name]
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for event in self._events.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not event.wait(remaining):
+                return False
+        return True
+
+    def report(self):
+        """Per-component load times, plus wall time for the whole startup."""
+        lines = ["Startup timing:"]
+        for name in self.factories:
+            seconds = self.timings.get(name)
+            status = f"{seconds:6.2f}s" if seconds is not None else "   --  "
+            lines.append(f"  {name:<20} {status}  {self.states[name]}")
+        if self.wall_time is not None:
+            lines.append(f"  {'total (parallel)':<20} {self.wall_time:6.2f}s  (sum of components {sum(self.timings.values()):.2f}s)")
+        return "\n".join(lines)
+
+    def _load(self, name):
+        self._set_state(name, "loading")
+        started = time.perf_counter()
+        try:
+            self._components[name] = self.factories[name]()
+            state = "ready"
+        except Exception as e:
+            logger.error("Error loading %s: %s", name, e)
+            self.errors[name] = e
+            state = "failed"
+        self.timings[name] = time.perf_counter() - started
+        self._set_state(name, state)
+        self._events[name].set()
+
+    def _set_state(self, name, state):
+        self.states[name] = state
+        if self.on_update:
+            self.on_update(name, state)
+
+    def _report_when_done(self):
+        self.wait()
+        self.wall_time = time.perf_counter() - self._started
+        logger.info("%s", self.report())
@@ -0,0 +1,366 @@
+"""
+Confusion-aware plate matching.
+
+`calculate_similarity` compares a read against one plate at a time and is
+the reference score. The other helpers here precompute a canonical form per OCR confusion class so
+registered plates can be indexed once and searched without scanning the fleet,
+or encoded once and scored against the whole fleet with NumPy.
+"""
+import numpy as np
+
+# OCR-similar character groups (characters that look similar)
+OCR_CONFUSION_GROUPS = [
+    {'O', '0', 'Q', 'D'},
+    {'I', '1', 'L', '|'},
+    {'S', '5'},
+    {'G', '6'},
+    {'B', '8'},
+    {'Z', '2'},
+    {'M', 'W'},
+    {'T', '7'},
+    {'A', '4'},
+    {'E', '3'},
+]
+
+# Every member of a group maps to the group's smallest character
+_CANONICAL_CHAR = {c: min(group) for group in OCR_CONFUSION_GROUPS for c in group}
+
+LENGTH_PENALTY = 0.2
+
+# VectorPlateScorer: 0 pads stored plates, this pads reads (and unknown characters)
+_QUERY_PAD = 255
+
+
+def canonical_plate(text):
+    """
+    Maps each character to its confusion-class representative, so two plates
+    are OCR-similar at a position exactly when their canonical forms agree.
+    """
+    return "".join(_CANONICAL_CHAR.get(c, c) for c in text.upper())
+
+
+def calculate_similarity(s1, s2):
+    """
+    Calculate similarity ratio between two strings.
+    OCR-aware: considers commonly confused characters as matches.
+    Returns a value between 0 and 1 (1 = exact match).
+    """
+    if not s1 or not s2:
+        return 0.0
+
+    s1, s2 = s1.upper(), s2.upper()
+
+    if s1 == s2:
+        return 1.0
+
+    def chars_similar(c1, c2):
+        """Check if two characters are OCR-similar."""
+        if c1 == c2:
+            return True
+        for group in OCR_CONFUSION_GROUPS:
+            if c1 in group and c2 in group:
+                return True
+        return False
+
+    # Make strings same length for comparison
+    max_len = max(len(s1), len(s2))
+    min_len = min(len(s1), len(s2))
+
+    # Pad shorter string
+    s1_padded = s1.ljust(max_len)
+    s2_padded = s2.ljust(max_len)
+
+    # Count OCR-similar matches
+    matches = sum(chars_similar(c1, c2) for c1, c2 in zip(s1_padded, s2_padded))
+
+    # Penalize length difference slightly
+    len_penalty = (max_len - min_len) * 0.2
+
+    similarity = (matches - len_penalty) / max_len
+    return max(0, similarity)
+
+
+def canonical_similarity(c1, c2):
+    """
+    Same score as `calculate_similarity`, computed on plates that
+    are already canonical.
+    """
+    if not c1 or not c2:
+        return 0.0
+    if c1 == c2:
+        return 1.0
+
+    max_len = max(len(c1), len(c2))
+    min_len = min(len(c1), len(c2))
+
+    matches = sum(a == b for a, b in zip(c1.ljust(max_len), c2.ljust(max_len)))
+    len_penalty = (max_len - min_len) * LENGTH_PENALTY
+
+    similarity = (matches - len_penalty) / max_len
+    return max(0, similarity)
+
+
+class FuzzyPlateMatcher:
+    """
+    Finds the registered plate with the best `calculate_similarity` score
+    above a threshold without comparing against every plate.
+
+    A score above the threshold bounds both the length difference and the
+    number of mismatching positions in the common prefix. By pigeonhole, a
+    prefix of length l with at most k mismatches split into k + 1 segments
+    has one segment that matches exactly, so plates are indexed by
+    (prefix length, segment number, segment text). A lookup fetches the
+    few plates sharing a segment with the read and scores only those.
+    """
+
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+        self._segments = {}
+        self._plates = {}
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._plates)
+
+    def add(self, key, plate):
+        """Indexes `plate` under `key`. Re-adding a key replaces its plate."""
+        self.remove(key)
+        canonical = canonical_plate(plate)
+        if not canonical:
+            return
+
+        self._seq += 1
+        self._plates[key] = (canonical, self._seq)
+        for segment_key in self._plate_segment_keys(canonical):
+            self._segments.setdefault(segment_key, set()).add(key)
+
+    def remove(self, key):
+        entry = self._plates.pop(key, None)
+        if entry is None:
+            return
+        for segment_key in self._plate_segment_keys(entry[0]):
+            bucket = self._segments.get(segment_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._segments[segment_key]
+
+    def clear(self):
+        self._segments = {}
+        self._plates = {}
+
+    def match(self, plate_text):
+        """
+        Returns (key, score) of the best plate scoring above the threshold,
+        or (None, 0). Ties go to the plate indexed first, like a linear scan.
+        """
+        query = canonical_plate(plate_text)
+        if not query:
+            return None, 0
+
+        best_key = None
+        best_score = 0
+        best_seq = None
+        for key in self._candidates(query):
+            canonical, seq = self._plates[key]
+            score = canonical_similarity(query, canonical)
+            if score <= self.threshold:
+                continue
+            if score > best_score or (score == best_score and seq < best_seq):
+                best_key, best_score, best_seq = key, score, seq
+
+        return best_key, best_score
+
+    def _max_mismatches(self, prefix_len):
+        # Upper bound on mismatches that can still score above the threshold
+        return int((1 - self.threshold) * prefix_len)
+
+    def _max_length_diff(self, prefix_len):
+        # Even a perfect prefix loses LENGTH_PENALTY + 1 of the max length per extra character
+        slack = (1 - self.threshold) * prefix_len
+        return int(slack / (self.threshold + LENGTH_PENALTY))
+
+    def _segments_of(self, canonical, prefix_len):
+        parts = self._max_mismatches(prefix_len) + 1
+        bounds = [i * prefix_len // parts for i in range(parts + 1)]
+        return [
+            (prefix_len, i, canonical[bounds[i]:bounds[i + 1]])
+            for i in range(parts)
+        ]
+
+    def _plate_segment_keys(self, canonical):
+        # Queries of the same length or longer compare the full plate; shorter
+        # queries compare a prefix, as long as the length gap can still pass.
+        keys = []
+        for prefix_len in range(len(canonical), 0, -1):
+            if len(canonical) - prefix_len > self._max_length_diff(prefix_len):
+                break
+            keys.extend(self._segments_of(canonical, prefix_len))
+        return keys
+
+    def _candidates(self, query):
+        candidates = set()
+        query_len = len(query)
+
+        for prefix_len in range(query_len, 0, -1):
+            if query_len - prefix_len > self._max_length_diff(prefix_len):
+                break
+            for segment_key in self._segments_of(query, prefix_len):
+                for key in self._segments.get(segment_key, ()):
+                    plate_len = len(self._plates[key][0])
+                    # prefix_len == query_len covers plates at least as long as
+                    # the read; shorter prefixes only cover plates of that length
+                    if plate_len == prefix_len or (prefix_len == query_len and plate_len > query_len):
+                        candidates.add(key)
+
+        return candidates
+
+
+class VectorPlateScorer:
+    """
+    Scores a read against every registered plate at once with NumPy.
+
+    Plates are stored as columns of a uint8 matrix of confusion-class IDs
+    (0 = padding), so a position matches exactly when the IDs agree. The
+    matrix is position-major, so one broadcast compare and a sum over its
+    short axis count the matches for the whole fleet, and the
+    length penalty is applied the same way as `calculate_similarity`,
+    giving bit-identical scores. Same add/remove/match interface as
+    FuzzyPlateMatcher, plus `top_k`.
+    """
+
+    def __init__(self, threshold=0.75, capacity=1024, width=12):
+        self.threshold = threshold
+        self._class_ids = {}
+        self._codes = np.zeros((width, capacity), dtype=np.uint8)
+        self._lengths = np.zeros(capacity, dtype=np.int64)
+        self._keys = [None] * capacity
+        self._rows = {}
+        self._size = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, key, plate):
+        """Encodes `plate` under `key`. Re-adding a key replaces its plate."""
+        self.remove(key)
+        canonical = canonical_plate(plate)
+        if not canonical:
+            return
+
+        if self._size == len(self._keys):
+            self._compact(grow=True)
+        if len(canonical) > self._codes.shape[0]:
+            self._widen(len(canonical))
+
+        row = self._size
+        self._codes[:len(canonical), row] = self._encode(canonical)
+        self._lengths[row] = len(canonical)
+        self._keys[row] = key
+        self._rows[key] = row
+        self._size += 1
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        # Rows stay in insertion order (it breaks ties), so just blank the slot
+        self._codes[:, row] = 0
+        self._lengths[row] = 0
+        self._keys[row] = None
+        if self._size > 64 and len(self._rows) < self._size // 2:
+            self._compact()
+
+    def clear(self):
+        self._codes[:] = 0
+        self._lengths[:] = 0
+        self._keys = [None] * len(self._keys)
+        self._rows = {}
+        self._size = 0
+
+    def scores(self, plate_text):
+        """
+        `calculate_similarity(plate_text, plate)` for every stored row, as a
+        float64 array (0 for empty slots).
+        """
+        query = canonical_plate(plate_text)
+        count = self._size
+        if not query or not count:
+            return np.zeros(count)
+
+        width = self._codes.shape[0]
+        # Pad the read with an ID no plate uses, so padding never matches padding
+        query_codes = np.full(width, _QUERY_PAD, dtype=np.uint8)
+        query_codes[:min(len(query), width)] = self._encode(query[:width], add_missing=False)
+
+        codes = self._codes[:, :count]
+        lengths = self._lengths[:count]
+        matches = (codes == query_codes[:, None]).sum(axis=0, dtype=np.uint8)
+
+        max_len = np.maximum(lengths, len(query))
+        min_len = np.minimum(lengths, len(query))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = (matches - (max_len - min_len) * LENGTH_PENALTY) / max_len
+        similarity = np.maximum(similarity, 0.0)
+        similarity[lengths == 0] = 0.0
+        return similarity
+
+    def top_k(self, plate_text, k=5, threshold=None):
+        """
+        The `k` best (key, score) pairs scoring above `threshold` (default:
+        the matcher's), best first; ties go to the plate added first.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        scores = self.scores(plate_text)
+        rows = np.flatnonzero(scores > threshold)
+        if not len(rows):
+            return []
+        if len(rows) > k:
+            # Cut at the k-th best score but keep every row tied with it, so
+            # the tie-break below still sees the earliest ones
+            kth = np.partition(scores[rows], len(rows) - k)[len(rows) - k]
+            rows = rows[scores[rows] >= kth]
+        # Row order is insertion order, so sorting by (-score, row) breaks ties like a scan
+        rows = rows[np.lexsort((rows, -scores[rows]))[:k]]
+        return [(self._keys[row], float(scores[row])) for row in rows]
+
+    def match(self, plate_text):
+        """Returns (key, score) of the best plate above the threshold, or (None, 0)."""
+        best = self.top_k(plate_text, k=1)
+        if not best:
+            return None, 0
+        return best[0]
+
+    def _encode(self, canonical, add_missing=True):
+        ids = []
+        for c in canonical:
+            class_id = self._class_ids.get(c)
+            if class_id is None:
+                if not add_missing or len(self._class_ids) >= _QUERY_PAD - 1:
+                    # A character no plate contains can never match
+                    ids.append(_QUERY_PAD)
+                    continue
+                class_id = self._class_ids[c] = len(self._class_ids) + 1
+            ids.append(class_id)
+        return np.array(ids, dtype=np.uint8)
+
+    def _widen(self, width):
+        codes = np.zeros((width, self._codes.shape[1]), dtype=np.uint8)
+        codes[:self._codes.shape[0]] = self._codes
+        self._codes = codes
+
+    def _compact(self, grow=False):
+        live = [row for row in range(self._size) if self._keys[row] is not None]
+        capacity = len(self._keys)
+        if grow and len(live) > capacity // 2:
+            capacity *= 2
+
+        codes = np.zeros((self._codes.shape[0], capacity), dtype=np.uint8)
+        lengths = np.zeros(capacity, dtype=np.int64)
+        codes[:, :len(live)] = self._codes[:, live]
+        lengths[:len(live)] = self._lengths[live]
+        keys = [self._keys[row] for row in live] + [None] * (capacity - len(live))
+
+        self._codes, self._lengths, self._keys = codes, lengths, keys
+        self._rows = {key: row for row, key in enumerate(keys[:len(live)])}
+        self._size = len(live)
@@ -0,0 +1,110 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from telemetry import metrics
+
+
+def dhash(img, grid=(16, 8), margin=8):
+    """
+    Difference hash of an image as an int of 2 x width x height bits.
+
+    The crop is reduced to grayscale at (width + 1) x height, and each pair
+    of neighbouring pixels sets one bit if the right one is brighter by more
+    than `margin` and another if it is darker by more. The hash ignores scale
+    and overall brightness; the margin keeps sensor noise in flat areas
+    (plate background, car body) from flipping bits.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    width, height = grid
+    small = cv2.resize(img, (width + 1, height), interpolation=cv2.INTER_AREA).astype(np.int16)
+    diff = small[:, 1:] - small[:, :-1]
+    bits = np.concatenate([(diff > margin).ravel(), (diff < -margin).ravel()])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class CropCache:
+    """
+    LRU cache of results for image crops, keyed by perceptual hash.
+
+    A crop whose dHash is within `max_distance` bits of a cached crop reuses
+    that result, so the same plate or vehicle seen again a moment later (a
+    stationary car, a re-uploaded image) skips the models. Entries expire
+    after `ttl` seconds; at most `max_entries` are kept.
+    """
+
+    def __init__(self, name, max_entries=256, ttl=30.0, max_distance=10, grid=(16, 8)):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.grid = grid
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # hash -> (stored_at, result)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, img):
+        """Returns (key, result); result is None on a miss. Pass `key` to store()."""
+        key = dhash(img, self.grid)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            match = self._nearest(key, now)
+            if match is None:
+                self.misses += 1
+                result = None
+            else:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                result = self._entries[match][1]
+        metrics.inc('anpr_crop_cache_lookups_total', cache=self.name, result="miss" if result is None else "hit")
+        return key, result
+
+    def store(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'entries': size, 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+    def _nearest(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] <= self.ttl:
+            return key
+        best, best_distance = None, self.max_distance + 1
+        for cached, (stored_at, _) in self._entries.items():
+            distance = (key ^ cached).bit_count()
+            if distance < best_distance and now - stored_at <= self.ttl:
+                best, best_distance = cached, distance
+        return best
+
+    def _expire(self, now):
+        # Least recently used entries sit first; drop expired ones from there
+        while self._entries:
+            stored_at, _ = next(iter(self._entries.values()))
+            if now - stored_at <= self.ttl:
+                break
+            self._entries.popitem(last=False)
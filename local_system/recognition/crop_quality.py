@@ -0,0 +1,55 @@
+import cv2
+
+import config
+from telemetry import metrics
+
+# Sharpness is measured at a fixed height so it does not depend on plate size
+SHARPNESS_HEIGHT = 48
+
+
+def measure_crop(plate_img):
+    """Size, aspect, sharpness (variance of the Laplacian), contrast and mean brightness of a crop."""
+    height, width = plate_img.shape[:2]
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY) if plate_img.ndim == 3 else plate_img
+    scaled = cv2.resize(gray, (max(1, round(width * SHARPNESS_HEIGHT / height)), SHARPNESS_HEIGHT),
+                        interpolation=cv2.INTER_AREA)
+    return {
+        'width': width,
+        'height': height,
+        'aspect': width / float(height),
+        'sharpness': float(cv2.Laplacian(scaled, cv2.CV_64F).var()),
+        'contrast': float(gray.std()),
+        'brightness': float(gray.mean()),
+    }
+
+
+def assess_crop(plate_img):
+    """
+    Cheap check that a plate crop is worth a full OCR pass.
+
+    Returns (usable, reason, measurements); reason is "ok" or the first
+    failed check: "small", "aspect", "blur", "contrast" or "exposure".
+    Every result is counted in anpr_crop_quality_total{result}.
+    """
+    if not config.CROP_QUALITY_ENABLED:
+        return True, "ok", {}
+    if plate_img is None or plate_img.size == 0:
+        metrics.inc('anpr_crop_quality_total', result="small")
+        return False, "small", {}
+
+    m = measure_crop(plate_img)
+    min_aspect, max_aspect = config.CROP_ASPECT_RANGE
+    if m['height'] < config.CROP_MIN_HEIGHT or m['width'] < config.CROP_MIN_WIDTH:
+        reason = "small"
+    elif not min_aspect <= m['aspect'] <= max_aspect:
+        reason = "aspect"
+    elif m['sharpness'] < config.CROP_MIN_SHARPNESS:
+        reason = "blur"
+    elif m['contrast'] < config.CROP_MIN_CONTRAST:
+        reason = "contrast"
+    elif not config.CROP_BRIGHTNESS_RANGE[0] <= m['brightness'] <= config.CROP_BRIGHTNESS_RANGE[1]:
+        reason = "exposure"
+    else:
+        reason = "ok"
+    metrics.inc('anpr_crop_quality_total', result=reason)
+    return reason == "ok", reason, m
@@ -1,14 +1,47 @@
 import cv2
-import easyocr
+import logging
 import re
+import threading
+import time
 import numpy as np
-from config import PLATE_PATTERNS
+from config import PLATE_PATTERNS, OCR_MODE, OCR_CASCADE_CONFIDENCE, OCR_BACKEND, OCR_GPU, OCR_BATCH_MIN_ASPECT
+from config import OCR_CACHE_ENABLED, OCR_CACHE_MAX_DISTANCE, OCR_CACHE_MIN_CONFIDENCE, READ_CACHE_SIZE, READ_CACHE_TTL
+from debug_capture import debug_capture
+from recognition import onnx_backend
+from recognition.crop_cache import CropCache
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
 
 class OCREngine:
-    def __init__(self):
-        # Initialize EasyOCR for English
-        print("Initializing EasyOCR...")
-        self.reader = easyocr.Reader(['en'], gpu=True) # Use GPU if available
+    def __init__(self, backend=None):
+        self.backend = backend or OCR_BACKEND
+        if self.backend == "onnx":
+            # Recognizer only: plate crops need no text detection
+            self.reader = onnx_backend.OnnxTextRecognizer(onnx_backend.model_path(onnx_backend.OCR_MODEL))
+        else:
+            import easyocr
+            # Initialize EasyOCR for English
+            logger.info("Initializing EasyOCR...")
+            self.reader = easyocr.Reader(['en'], gpu=OCR_GPU) # Use GPU if available
+        
+        # Preprocessors in their default order; cascade mode reorders by win rate
+        self.preprocessing_methods = [
+            ("adaptive", self.preprocess_adaptive),
+            ("invert", self.preprocess_invert),
+            ("otsu", self.preprocess_otsu),
+            ("standard", self.preprocess_standard),
+            ("morphology", self.preprocess_morphology),
+        ]
+        # Near-identical crops (same car still at the gate, re-uploads) reuse the last read
+        self.cache = None
+        if OCR_CACHE_ENABLED:
+            self.cache = CropCache("ocr", READ_CACHE_SIZE, READ_CACHE_TTL, OCR_CACHE_MAX_DISTANCE, grid=(48, 12))
+        self._stats_lock = threading.Lock()
+        self._method_stats = {
+            name: {'attempts': 0, 'wins': 0, 'total_time': 0.0}
+            for name, _ in self.preprocessing_methods
+        }
 
     def preprocess_standard(self, img):
         """Standard preprocessing - resize and denoise."""
@@ -64,82 +97,250 @@ class OCREngine:
         enhanced = clahe.apply(gray)
         return enhanced
 
-    def extract_text(self, plate_img):
+    def extract_text(self, plate_img, debug_event=None):
         """
         Extracts text from the plate image using multiple preprocessing methods.
         """
+        text, _ = self.extract_text_with_confidence(plate_img, debug_event)
+        return text
+
+    def extract_text_with_confidence(self, plate_img, debug_event=None, use_cache=True):
+        """
+        Same as extract_text, but returns (text, confidence) so callers can
+        weigh several reads of the same plate.
+        `debug_event` groups the saved debug images; a sampled one is created
+        if none is given (see debug_capture). Pass `use_cache=False` when the
+        read must be a fresh one, e.g. another vote for a tracked plate.
+        """
         if plate_img is None or plate_img.size == 0:
-            return ""
+            return "", 0.0
 
-        # DEBUG: Save plate image for inspection
-        try:
-            cv2.imwrite("debug_plate.jpg", plate_img)
-            print(f"DEBUG OCR: Saved plate image to debug_plate.jpg (size: {plate_img.shape})")
-        except:
-            pass
+        with metrics.span("ocr"):
+            if self.cache is None or not use_cache:
+                return self._extract(plate_img, debug_event)
+            key, cached = self.cache.lookup(plate_img)
+            if cached is not None:
+                logger.debug("OCR: Cache hit '%s' (confidence: %.2f)", *cached)
+                return cached
+            result = self._extract(plate_img, debug_event)
+            text, confidence = result
+            # Failed or doubtful reads are retried next time, not repeated
+            if text and confidence >= OCR_CACHE_MIN_CONFIDENCE and self.validate_plate(text):
+                self.cache.store(key, result)
+            return result
 
-        # Try multiple preprocessing methods
-        preprocessing_methods = [
-            ("adaptive", self.preprocess_adaptive),
-            ("invert", self.preprocess_invert),
-            ("otsu", self.preprocess_otsu),
-            ("standard", self.preprocess_standard),
-            ("morphology", self.preprocess_morphology),
-        ]
+    def _extract(self, plate_img, debug_event):
+        if debug_event is None:
+            debug_event = debug_capture.new_event()
+        debug_capture.add(debug_event, "plate", plate_img)
+
+        height, width = plate_img.shape[:2]
+        if OCR_MODE == "batched" and width >= height * OCR_BATCH_MIN_ASPECT:
+            best_text, best_confidence, best_method = self._extract_batched(plate_img, debug_event)
+        else:
+            best_text, best_confidence, best_method = self._extract_sequential(plate_img, debug_event)
+
+        if best_method:
+            self._record_win(best_method)
+
+        # If no good results, try original image directly
+        if not best_text or best_confidence < 0.3:
+            logger.debug("OCR: Trying original image...")
+            try:
+                results = self.reader.readtext(plate_img, detail=1)
+                if results:
+                    texts = [text for _, text, _ in results]
+                    full_text = "".join(texts)
+                    cleaned = self.clean_text(full_text)
+                    if len(cleaned) >= 3:
+                        best_text = cleaned
+                        best_confidence = sum(conf for _, _, conf in results) / len(results)
+                        metrics.inc('anpr_ocr_method_wins_total', method="original")
+                        logger.debug("OCR [original]: Found '%s'", cleaned)
+            except:
+                pass
+
+        logger.debug("OCR: Final result: '%s' (confidence: %.2f)", best_text, best_confidence)
+        return best_text, best_confidence
+
+    def _extract_sequential(self, plate_img, debug_event=None):
+        """One reader pass per preprocessor; cascade mode may stop early."""
+        cascade = OCR_MODE == "cascade"
+        methods = self.ranked_methods() if cascade else self.preprocessing_methods
 
         best_text = ""
         best_confidence = 0
+        best_method = None
 
-        for method_name, preprocess_func in preprocessing_methods:
+        for method_name, preprocess_func in methods:
+            started = time.perf_counter()
             try:
                 processed_img = preprocess_func(plate_img)
                 
-                # Save debug images
-                cv2.imwrite(f"debug_plate_{method_name}.jpg", processed_img)
+                # Save debug images (sampled, written in the background)
+                debug_capture.add(debug_event, f"plate_{method_name}", processed_img)
                 
                 # Read with detailed output for confidence
-                results = self.reader.readtext(processed_img, detail=1)
+                cleaned, avg_conf = self.read_variant(processed_img)
                 
-                if results:
-                    # Calculate average confidence and concatenate text
-                    texts = []
-                    total_conf = 0
-                    for bbox, text, conf in results:
-                        texts.append(text)
-                        total_conf += conf
-                    
-                    avg_conf = total_conf / len(results)
-                    full_text = "".join(texts)
-                    cleaned = self.clean_text(full_text)
-                    
-                    print(f"DEBUG OCR [{method_name}]: Found '{cleaned}' with confidence {avg_conf:.2f}")
+                if cleaned is not None:
+                    logger.debug("OCR [%s]: Found '%s' with confidence %.2f", method_name, cleaned, avg_conf)
                     
                     # Keep the best result (highest confidence with valid format)
                     if avg_conf > best_confidence and len(cleaned) >= 3:
                         best_text = cleaned
                         best_confidence = avg_conf
+                        best_method = method_name
                         
             except Exception as e:
-                print(f"DEBUG OCR [{method_name}]: Error - {e}")
-                continue
+                logger.debug("OCR [%s]: Error - %s", method_name, e)
+            finally:
+                self._record_attempt(method_name, time.perf_counter() - started)
 
-        # If no good results, try original image directly
-        if not best_text or best_confidence < 0.3:
-            print("DEBUG OCR: Trying original image...")
+            # Cascade: a confident, plausible plate ends the search early
+            if cascade and best_confidence >= OCR_CASCADE_CONFIDENCE and self.validate_plate(best_text):
+                logger.debug("OCR: Cascade stopped after '%s'", method_name)
+                break
+
+        return best_text, best_confidence, best_method
+
+    def _extract_batched(self, plate_img, debug_event=None):
+        """
+        All preprocessors, one recognizer call. The crop is already a plate,
+        so the text detector is skipped and each variant is read as one line,
+        which is why two-row plates go through _extract_sequential instead.
+        """
+        processed = []
+        for method_name, preprocess_func in self.preprocessing_methods:
             try:
-                results = self.reader.readtext(plate_img, detail=1)
-                if results:
-                    texts = [text for _, text, _ in results]
-                    full_text = "".join(texts)
-                    cleaned = self.clean_text(full_text)
-                    if len(cleaned) >= 3:
-                        best_text = cleaned
-                        print(f"DEBUG OCR [original]: Found '{cleaned}'")
-            except:
-                pass
+                processed_img = preprocess_func(plate_img)
+                debug_capture.add(debug_event, f"plate_{method_name}", processed_img)
+                processed.append((method_name, processed_img))
+            except Exception as e:
+                logger.debug("OCR [%s]: Error - %s", method_name, e)
+
+        best_text = ""
+        best_confidence = 0
+        best_method = None
+        if not processed:
+            return best_text, best_confidence, best_method
+
+        started = time.perf_counter()
+        try:
+            reads = self.read_variants_batched([img for _, img in processed])
+        except Exception as e:
+            logger.debug("OCR [batched]: Error - %s", e)
+            reads = [(None, 0.0)] * len(processed)
+        elapsed = (time.perf_counter() - started) / len(processed)
+
+        for (method_name, _), (cleaned, avg_conf) in zip(processed, reads):
+            self._record_attempt(method_name, elapsed)
+            if cleaned is None:
+                continue
+            logger.debug("OCR [%s]: Found '%s' with confidence %.2f", method_name, cleaned, avg_conf)
+            
+            # Keep the best result (highest confidence with valid format)
+            if avg_conf > best_confidence and len(cleaned) >= 3:
+                best_text = cleaned
+                best_confidence = avg_conf
+                best_method = method_name
+
+        return best_text, best_confidence, best_method
+
+    def read_variant(self, processed_img):
+        """
+        Runs the reader on one preprocessed image.
+        Returns (cleaned_text, average_confidence), or (None, 0.0) if nothing was read.
+        """
+        results = self.reader.readtext(processed_img, detail=1)
+        if not results:
+            return None, 0.0
+        
+        # Calculate average confidence and concatenate text
+        texts = []
+        total_conf = 0
+        for bbox, text, conf in results:
+            texts.append(text)
+            total_conf += conf
+        
+        avg_conf = total_conf / len(results)
+        full_text = "".join(texts)
+        return self.clean_text(full_text), avg_conf
+
+    def read_variants_batched(self, processed_imgs):
+        """
+        Reads several single-channel variants of one plate in a single
+        recognizer call. The variants are stacked vertically and each is
+        passed as its own text box, so EasyOCR's detector never runs. The
+        ONNX recognizer reads all boxes in one forward pass; EasyOCR still
+        recognizes them one by one, so there only the detector is saved.
+        Returns one (cleaned_text, confidence) per variant, (None, 0.0) if empty.
+        """
+        width = max(img.shape[1] for img in processed_imgs)
+        height = sum(img.shape[0] for img in processed_imgs)
+        canvas = np.full((height, width), 255, dtype=np.uint8)
+
+        boxes = []
+        row_of = {}
+        y = 0
+        for i, img in enumerate(processed_imgs):
+            h, w = img.shape[:2]
+            canvas[y:y + h, :w] = img
+            boxes.append([0, w, y, y + h])  # x_min, x_max, y_min, y_max
+            row_of[y] = i
+            y += h
+
+        results = self.reader.recognize(
+            canvas,
+            horizontal_list=boxes,
+            free_list=[],
+            detail=1,
+            batch_size=len(boxes),
+        )
+
+        reads = [(None, 0.0)] * len(processed_imgs)
+        for bbox, text, conf in results:
+            i = row_of.get(int(bbox[0][1]))
+            if i is not None and text:
+                reads[i] = (self.clean_text(text), float(conf))
+        return reads
+
+    def ranked_methods(self):
+        """
+        Preprocessors ordered by how often they produced the final reading
+        (smoothed win rate), falling back to the default order on ties.
+        """
+        with self._stats_lock:
+            def win_rate(item):
+                stats = self._method_stats[item[1][0]]
+                return -(stats['wins'] + 1) / (stats['attempts'] + 2), item[0]
+            ranked = sorted(enumerate(self.preprocessing_methods), key=win_rate)
+        return [method for _, method in ranked]
+
+    def method_stats(self):
+        """Per-preprocessor attempts, wins, win rate and mean latency in seconds."""
+        with self._stats_lock:
+            report = {}
+            for name, stats in self._method_stats.items():
+                attempts = stats['attempts']
+                report[name] = {
+                    'attempts': attempts,
+                    'wins': stats['wins'],
+                    'win_rate': stats['wins'] / attempts if attempts else 0.0,
+                    'avg_latency': stats['total_time'] / attempts if attempts else 0.0,
+                }
+            return report
+
+    def _record_attempt(self, method_name, elapsed):
+        with self._stats_lock:
+            self._method_stats[method_name]['attempts'] += 1
+            self._method_stats[method_name]['total_time'] += elapsed
+        metrics.observe('anpr_ocr_method_seconds', elapsed, method=method_name)
 
-        print(f"DEBUG OCR: Final result: '{best_text}' (confidence: {best_confidence:.2f})")
-        return best_text
+    def _record_win(self, method_name):
+        with self._stats_lock:
+            self._method_stats[method_name]['wins'] += 1
+        metrics.inc('anpr_ocr_method_wins_total', method=method_name)
 
     def clean_text(self, text):
         """
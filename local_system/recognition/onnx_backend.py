@@ -0,0 +1,196 @@
+"""
+ONNX Runtime (CPU) versions of the plate detector, the EasyOCR recognizer and
+the vehicle classifiers. Models are produced by `export_onnx.py`; each module
+picks its backend from config.py.
+"""
+import json
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PLATE_MODEL = "plate_detector"
+OCR_MODEL = "ocr_recognizer"
+CLASSIFIER_MODEL = "vehicle_classifier"
+
+
+def model_path(name, int8=None):
+    """Path of an exported model; the INT8 variant when ONNX_USE_INT8 is set."""
+    if int8 is None:
+        int8 = config.ONNX_USE_INT8
+    suffix = ".int8.onnx" if int8 else ".onnx"
+    return os.path.join(config.ONNX_MODEL_DIR, name + suffix)
+
+
+def create_session(path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if config.ONNX_THREADS:
+        options.intra_op_num_threads = config.ONNX_THREADS
+    logger.info("Loading ONNX model from %s...", path)
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxPlateDetector:
+    """YOLO plate detector exported by Ultralytics, decoded with NumPy + OpenCV NMS."""
+
+    def __init__(self, path, imgsz=None, iou_threshold=0.7):
+        self.session = create_session(path)
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = imgsz or config.PLATE_IMGSZ
+        self.iou_threshold = iou_threshold
+
+    def detect(self, img, conf):
+        """Returns plate boxes as (x1, y1, x2, y2, confidence), best first."""
+        blob, scale, pad_x, pad_y = self._letterbox(img)
+        output = self.session.run(None, {self.input_name: blob})[0]
+
+        # (1, 4 + classes, anchors) -> (anchors, 4 + classes)
+        predictions = output[0].T
+        scores = predictions[:, 4:].max(axis=1)
+        keep = scores >= conf
+        predictions, scores = predictions[keep], scores[keep]
+        if not len(scores):
+            return []
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        x1 = (cx - w / 2 - pad_x) / scale
+        y1 = (cy - h / 2 - pad_y) / scale
+        widths, heights = w / scale, h / scale
+
+        rects = np.stack([x1, y1, widths, heights], axis=1).tolist()
+        indices = cv2.dnn.NMSBoxes(rects, scores.tolist(), conf, self.iou_threshold)
+
+        img_height, img_width = img.shape[:2]
+        detections = []
+        for i in np.array(indices).flatten():
+            bx, by, bw, bh = rects[i]
+            detections.append((
+                max(0, int(bx)),
+                max(0, int(by)),
+                min(img_width, int(bx + bw)),
+                min(img_height, int(by + bh)),
+                float(scores[i]),
+            ))
+        detections.sort(key=lambda d: d[4], reverse=True)
+        return detections
+
+    def _letterbox(self, img):
+        height, width = img.shape[:2]
+        scale = min(self.imgsz / height, self.imgsz / width)
+        new_w, new_h = int(round(width * scale)), int(round(height * scale))
+        pad_x = (self.imgsz - new_w) / 2
+        pad_y = (self.imgsz - new_h) / 2
+
+        resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        canvas[top:top + new_h, left:left + new_w] = resized
+
+        blob = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+        blob = np.ascontiguousarray(blob[np.newaxis], dtype=np.float32) / 255.0
+        return blob, scale, left, top
+
+
+class OnnxTextRecognizer:
+    """
+    EasyOCR's recognition network without its text detector. Each image (or
+    box) is read as a single line, which suits crops that are already plates.
+    Exposes the `readtext` / `recognize` calls OCREngine uses.
+    """
+
+    IMG_HEIGHT = 64
+
+    def __init__(self, path):
+        self.session = create_session(path)
+        self.input_name = self.session.get_inputs()[0].name
+        with open(os.path.splitext(path)[0].replace(".int8", "") + ".json") as f:
+            meta = json.load(f)
+        self.characters = np.array(['[blank]'] + list(meta['character']))
+        self.ignore_idx = meta['ignore_idx']
+
+    def readtext(self, img, detail=1):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        return self.recognize(gray, horizontal_list=[[0, width, 0, height]], free_list=[], detail=detail)
+
+    def recognize(self, img_cv_grey, horizontal_list=None, free_list=None, detail=1, batch_size=1, **_):
+        if horizontal_list is None:
+            height, width = img_cv_grey.shape
+            horizontal_list = [[0, width, 0, height]]
+
+        crops, boxes = [], []
+        for x_min, x_max, y_min, y_max in horizontal_list:
+            crop = img_cv_grey[max(0, y_min):y_max, max(0, x_min):x_max]
+            if crop.size:
+                crops.append(crop)
+                boxes.append([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]])
+        if not crops:
+            return []
+
+        reads = self._predict(self._batch(crops))
+        results = []
+        for box, (text, confidence) in zip(boxes, reads):
+            results.append((box, text, confidence) if detail else text)
+        return results
+
+    def _batch(self, crops):
+        # Same as EasyOCR's AlignCollate: keep aspect ratio at height 64,
+        # normalize to [-1, 1] and pad right by repeating the last column.
+        widths = [math.ceil(self.IMG_HEIGHT * c.shape[1] / float(c.shape[0])) for c in crops]
+        max_width = max(widths)
+        batch = np.zeros((len(crops), 1, self.IMG_HEIGHT, max_width), dtype=np.float32)
+        for i, (crop, width) in enumerate(zip(crops, widths)):
+            resized = cv2.resize(crop, (width, self.IMG_HEIGHT), interpolation=cv2.INTER_CUBIC)
+            resized = (resized.astype(np.float32) / 255.0 - 0.5) / 0.5
+            batch[i, 0, :, :width] = resized
+            batch[i, 0, :, width:] = resized[:, -1:]
+        return batch
+
+    def _predict(self, batch):
+        logits = self.session.run(None, {self.input_name: batch})[0]
+
+        # Softmax, drop characters outside the language set, renormalize
+        probs = np.exp(logits - logits.max(axis=2, keepdims=True))
+        probs /= probs.sum(axis=2, keepdims=True)
+        probs[:, :, self.ignore_idx] = 0.0
+        probs /= probs.sum(axis=2, keepdims=True)
+
+        indices = probs.argmax(axis=2)
+        values = probs.max(axis=2)
+
+        reads = []
+        for idx, val in zip(indices, values):
+            # Greedy CTC: collapse repeats, drop blanks
+            keep = np.insert(idx[1:] != idx[:-1], 0, True) & (idx != 0)
+            text = "".join(self.characters[idx[keep]])
+
+            max_probs = val[idx != 0]
+            if not len(max_probs):
+                max_probs = np.array([0.0])
+            confidence = float(max_probs.prod() ** (2.0 / np.sqrt(len(max_probs))))
+            reads.append((text, confidence))
+        return reads
+
+
+class OnnxVehicleClassifier:
+    """Color and make heads exported as one two-output graph."""
+
+    def __init__(self, path):
+        self.session = create_session(path)
+        inputs = self.session.get_inputs()[0]
+        self.input_name = inputs.name
+        self.input_shape = tuple(inputs.shape)
+
+    def predict(self, batch):
+        """Returns (color_probabilities, make_probabilities) for a preprocessed batch."""
+        color, make = self.session.run(None, {self.input_name: batch.astype(np.float32)})
+        return color, make
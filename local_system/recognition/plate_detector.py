@@ -1,24 +1,52 @@
 import cv2
+import logging
 import numpy as np
 import os
-from ultralytics import YOLO
-from config import PLATE_DETECTION_MODEL as PLATE_MODEL_PATH, PLATE_CONFIDENCE
+import threading
+from config import PLATE_DETECTION_MODEL as PLATE_MODEL_PATH, PLATE_CONFIDENCE, PLATE_DETECTOR_BACKEND
+from config import VEHICLE_BOX_WIDTH_RATIO, VEHICLE_BOX_HEIGHT_RATIO, VEHICLE_BOX_PLATE_POSITION
+from config import PLATE_FALLBACK_MODE, PLATE_EMPTY_SCORE, PLATE_IMGSZ, PLATE_BATCH_SIZE
+from config import HAAR_MAX_WIDTH, HAAR_MIN_PLATE_WIDTH, HAAR_SCALE_FACTOR, HAAR_MIN_NEIGHBORS, HAAR_SEARCH_REGION
+from recognition import onnx_backend
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# Russian plate cascade works surprisingly well for general rectangular plates
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_russian_plate_number.xml'
+HAAR_WINDOW_MARGIN = 1.5  # Plates narrower than 1.5x the cascade window are often missed
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
 class PlateDetector:
-    def __init__(self):
+    _haar_cascade = None
+    _haar_lock = threading.Lock()
+
+    def __init__(self, backend=None):
         self.model = None
         self.use_yolo = False
+        self.backend = backend or PLATE_DETECTOR_BACKEND
         
+        if self.backend == "onnx":
+            onnx_path = onnx_backend.model_path(onnx_backend.PLATE_MODEL)
+            if os.path.exists(onnx_path):
+                try:
+                    self.model = onnx_backend.OnnxPlateDetector(onnx_path)
+                    self.use_yolo = True
+                except Exception as e:
+                    logger.error("Failed to load ONNX plate model: %s", e)
+            else:
+                logger.warning("ONNX plate model not found at %s. Run export_onnx.py; using fallback.", onnx_path)
         # Try to load YOLO model
-        if os.path.exists(PLATE_MODEL_PATH):
+        elif os.path.exists(PLATE_MODEL_PATH):
             try:
-                print(f"Loading YOLO model from {PLATE_MODEL_PATH}...")
+                from ultralytics import YOLO
+                logger.info("Loading YOLO model from %s...", PLATE_MODEL_PATH)
                 self.model = YOLO(PLATE_MODEL_PATH)
                 self.use_yolo = True
             except Exception as e:
-                print(f"Failed to load YOLO model: {e}")
+                logger.error("Failed to load YOLO model: %s", e)
         else:
-            print(f"YOLO model not found at {PLATE_MODEL_PATH}. Attempting download or using fallback.")
+            logger.warning("YOLO model not found at %s. Attempting download or using fallback.", PLATE_MODEL_PATH)
             # Note: YOLO() constructor can auto-download standard models, 
             # but for custom trained ones we need the file.
             # We'll default to standard 'yolov8n.pt' or similar if specific one missing? 
@@ -28,85 +56,246 @@ class PlateDetector:
         """
         Returns the cropped plate image.
         """
-        if self.use_yolo:
-            return self.detect_plate_yolo(img)
-        else:
-            print("Using fallback CV detection.")
-            return self.detect_plate_traditional(img)
+        boxes = self.detect_boxes(img)
+        if not boxes:
+            return None
+        return self.crop(img, boxes[0])
+
+    def detect_boxes(self, img, search_box=None):
+        """
+        Returns every plate box as (x1, y1, x2, y2, confidence), best first.
+        Haar fallback boxes carry a confidence of 0.0. `search_box` (e.g. a
+        tracked vehicle's box) narrows where the fallback looks.
+        """
+        with metrics.span("detect"):
+            if self.use_yolo:
+                candidates = self._yolo_candidates(img)
+                boxes = [b for b in candidates if b[4] >= PLATE_CONFIDENCE]
+                # If nothing found by YOLO, try fallback
+                if not boxes and self._should_fall_back(candidates):
+                    return self._counted(self.detect_boxes_traditional(img, search_box), "haar")
+                return self._counted(boxes, "yolo")
+            logger.debug("Using fallback CV detection.")
+            return self._counted(self.detect_boxes_traditional(img, search_box), "haar")
+
+    @staticmethod
+    def _counted(boxes, method):
+        metrics.inc('anpr_plate_detections_total', method=method if boxes else "none")
+        return boxes
+
+    def _should_fall_back(self, candidates):
+        # "uncertain": only when YOLO saw something, just not confidently
+        if PLATE_FALLBACK_MODE == "never":
+            return False
+        if PLATE_FALLBACK_MODE == "uncertain":
+            return bool(candidates)
+        return True
+
+    def detect_plate_and_vehicle(self, img):
+        """
+        Returns (plate_img, vehicle_img): the plate crop and the vehicle
+        region around it, or (None, None) if no plate was found.
+        """
+        boxes = self.detect_boxes(img)
+        if not boxes:
+            return None, None
+        plate_box = boxes[0]
+        vehicle_img = self.crop(img, self.vehicle_box(plate_box, img.shape))
+        if vehicle_img.size == 0:
+            vehicle_img = img
+        return self.crop(img, plate_box), vehicle_img
+
+    @staticmethod
+    def vehicle_box(plate_box, frame_shape):
+        """
+        Estimates the vehicle's box from its plate box. The plate model only
+        finds plates, so the vehicle is taken as a fixed multiple of the plate
+        width, centred on the plate horizontally with the plate in its lower part.
+        """
+        x1, y1, x2, y2 = plate_box[:4]
+        plate_w = x2 - x1
+        center_x = (x1 + x2) / 2.0
+        center_y = (y1 + y2) / 2.0
+        
+        width = plate_w * VEHICLE_BOX_WIDTH_RATIO
+        height = plate_w * VEHICLE_BOX_HEIGHT_RATIO
+        top = center_y - height * VEHICLE_BOX_PLATE_POSITION
+        
+        img_height, img_width = frame_shape[:2]
+        vx1 = max(0, int(center_x - width / 2))
+        vy1 = max(0, int(top))
+        vx2 = min(img_width, int(center_x + width / 2))
+        vy2 = min(img_height, int(top + height))
+        return (vx1, vy1, vx2, vy2)
+
+    @staticmethod
+    def crop(img, box):
+        x1, y1, x2, y2 = box[:4]
+        return img[y1:y2, x1:x2]
 
     def detect_plate_yolo(self, img):
-        results = self.model(img, conf=PLATE_CONFIDENCE)
+        boxes = self.detect_boxes_yolo(img)
+        if boxes:
+            return self.crop(img, boxes[0])
+        return self.detect_plate_traditional(img)
+
+    def detect_boxes_yolo(self, img):
+        return [b for b in self._yolo_candidates(img) if b[4] >= PLATE_CONFIDENCE]
+
+    def _yolo_candidates(self, img):
+        return self._yolo_candidates_batch([img])[0]
+
+    def _yolo_candidates_batch(self, frames):
+        # In "uncertain" fallback mode, also collect weak boxes to tell an empty
+        # frame from a missed plate
+        conf = PLATE_CONFIDENCE
+        if PLATE_FALLBACK_MODE == "uncertain":
+            conf = min(PLATE_CONFIDENCE, PLATE_EMPTY_SCORE)
+        
+        if self.backend == "onnx":
+            # The exported graph has a fixed batch of 1
+            return [self.model.detect(img, conf) for img in frames]
+        
+        results = self.model(list(frames), conf=conf, imgsz=PLATE_IMGSZ, verbose=False)
         
+        batch = []
         for result in results:
-            boxes = result.boxes
-            if len(boxes) > 0:
-                # Get highest confidence box
-                # Assuming class 0 is plate (standard for single-class models)
-                box = boxes[0] 
+            detections = []
+            # Assuming class 0 is plate (standard for single-class models)
+            for box in result.boxes:
                 x1, y1, x2, y2 = map(int, box.xyxy[0])
-                
-                # Crop
-                plate_img = img[y1:y2, x1:x2]
-                return plate_img
-                
-        # If nothing found by YOLO, try fallback?
-        return self.detect_plate_traditional(img)
+                detections.append((x1, y1, x2, y2, float(box.conf[0])))
+            # Highest confidence first
+            detections.sort(key=lambda d: d[4], reverse=True)
+            batch.append(detections)
+        return batch
+
+    def detect_batch(self, frames):
+        """
+        Detects plates in several frames with one model call. Returns one list
+        per frame of every box as (x1, y1, x2, y2, confidence), best first;
+        frames YOLO finds nothing in go through the same fallback as detect_boxes.
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+        with metrics.span("detect_batch"):
+            if not self.use_yolo:
+                return [self._counted(self.detect_boxes_traditional(img), "haar") for img in frames]
+            
+            batch = []
+            for img, candidates in zip(frames, self._yolo_candidates_batch(frames)):
+                boxes = [b for b in candidates if b[4] >= PLATE_CONFIDENCE]
+                if not boxes and self._should_fall_back(candidates):
+                    batch.append(self._counted(self.detect_boxes_traditional(img), "haar"))
+                else:
+                    batch.append(self._counted(boxes, "yolo"))
+            return batch
+
+    def detect_directory(self, directory, batch_size=None):
+        """
+        Yields (path, frame, boxes) for every image in `directory`, reading and
+        detecting `batch_size` images at a time. Unreadable files are skipped.
+        """
+        batch_size = batch_size or PLATE_BATCH_SIZE
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for start in range(0, len(paths), batch_size):
+            loaded = []
+            for path in paths[start:start + batch_size]:
+                frame = cv2.imread(path)
+                if frame is None:
+                    logger.warning("Could not read %s", path)
+                    continue
+                loaded.append((path, frame))
+            if not loaded:
+                continue
+            results = self.detect_batch([frame for _, frame in loaded])
+            for (path, frame), boxes in zip(loaded, results):
+                yield path, frame, boxes
 
     def detect_plate_traditional(self, img):
         """
         Fallback method using Haar Cascade (Better than contours).
         """
-        print("Running Haar Cascade Detection...")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Load Haar Cascade
-        # Russian plate cascade works surprisingly well for general rectangular plates
-        haar_path = cv2.data.haarcascades + 'haarcascade_russian_plate_number.xml'
+        boxes = self.detect_boxes_traditional(img)
+        if boxes:
+            return self.crop(img, boxes[0])
+        return None
+
+    @classmethod
+    def haar_cascade(cls):
+        """The plate cascade, loaded from disk once per process."""
+        with cls._haar_lock:
+            if cls._haar_cascade is None:
+                if not os.path.exists(HAAR_CASCADE_PATH):
+                    logger.error("Haar cascade not found at %s", HAAR_CASCADE_PATH)
+                    return None
+                cls._haar_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+            return cls._haar_cascade
+
+    def detect_boxes_traditional(self, img, search_box=None):
+        """
+        One cascade pass over a downscaled grayscale of the search region:
+        the lower half of `search_box` if given, else HAAR_SEARCH_REGION of
+        the frame. The region is never shrunk so far that a plate
+        HAAR_MIN_PLATE_WIDTH pixels wide becomes too small for the cascade.
+        """
+        logger.debug("Running Haar Cascade Detection...")
+        plate_cascade = self.haar_cascade()
+        if plate_cascade is None:
+            return []
         
-        if not os.path.exists(haar_path):
-             print(f"Haar cascade not found at {haar_path}")
-             return None
-             
-        plate_cascade = cv2.CascadeClassifier(haar_path)
+        img_height, img_width = img.shape[:2]
+        if search_box is not None:
+            bx1, by1, bx2, by2 = search_box[:4]
+            rx1, ry1, rx2, ry2 = bx1, (by1 + by2) // 2, bx2, by2
+        else:
+            fx1, fy1, fx2, fy2 = HAAR_SEARCH_REGION
+            rx1, ry1 = int(fx1 * img_width), int(fy1 * img_height)
+            rx2, ry2 = int(fx2 * img_width), int(fy2 * img_height)
+        rx1, ry1 = max(0, rx1), max(0, ry1)
+        rx2, ry2 = min(img_width, rx2), min(img_height, ry2)
+        if rx2 <= rx1 or ry2 <= ry1:
+            return []
         
-        # Try multiple parameter combinations for better detection
-        param_sets = [
-            {'scaleFactor': 1.1, 'minNeighbors': 3},  # Standard
-            {'scaleFactor': 1.05, 'minNeighbors': 2}, # More sensitive
-            {'scaleFactor': 1.2, 'minNeighbors': 4},  # Less sensitive but more accurate
-        ]
+        gray = cv2.cvtColor(img[ry1:ry2, rx1:rx2], cv2.COLOR_BGR2GRAY)
+        # The cascade only finds plates comfortably larger than its window,
+        # so keep the smallest plate we look for that large after downscaling
+        window_w, _ = plate_cascade.getOriginalWindowSize()
+        min_scale = HAAR_WINDOW_MARGIN * window_w / float(HAAR_MIN_PLATE_WIDTH)
+        scale = min(1.0, max(HAAR_MAX_WIDTH / float(gray.shape[1]), min_scale))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
         
-        plates = []
-        for params in param_sets:
-            plates = plate_cascade.detectMultiScale(gray, **params)
-            if len(plates) > 0:
-                print(f"Detected with params: {params}")
-                break
+        # detectMultiScale already searches an image pyramid
+        plates = plate_cascade.detectMultiScale(
+            gray, scaleFactor=HAAR_SCALE_FACTOR, minNeighbors=HAAR_MIN_NEIGHBORS
+        )
         
-        if len(plates) > 0:
-            # Take the largest plate found
-            plates = sorted(plates, key=lambda x: x[2] * x[3], reverse=True)
-            x, y, w, h = plates[0]
+        # Simple validation on aspect ratio (2 to 6), then take the largest plate
+        plates = [p for p in plates if 2 <= p[2] / float(p[3]) <= 6]
+        if plates:
+            x, y, w, h = max(plates, key=lambda p: p[2] * p[3])
+            # Back to full-frame coordinates
+            x, y = int(x / scale) + rx1, int(y / scale) + ry1
+            w, h = int(w / scale), int(h / scale)
+            logger.debug("Haar detected plate at %d,%d %dx%d", x, y, w, h)
+            
+            # Add padding around the plate for better OCR (20% on each side)
+            pad_w = int(w * 0.2)
+            pad_h = int(h * 0.2)
             
-            # Simple validation on aspect ratio (2 to 6)
-            aspect = w / float(h)
-            if 2 <= aspect <= 6:
-                print(f"Haar detected plate at {x},{y} {w}x{h}")
-                
-                # Add padding around the plate for better OCR (20% on each side)
-                img_height, img_width = img.shape[:2]
-                pad_w = int(w * 0.2)
-                pad_h = int(h * 0.2)
-                
-                # Calculate padded coordinates with bounds checking
-                x1 = max(0, x - pad_w)
-                y1 = max(0, y - pad_h)
-                x2 = min(img_width, x + w + pad_w)
-                y2 = min(img_height, y + h + pad_h)
-                
-                plate_img = img[y1:y2, x1:x2]
-                print(f"Padded plate region: {x1},{y1} to {x2},{y2} (size: {x2-x1}x{y2-y1})")
-                return plate_img
+            # Calculate padded coordinates with bounds checking
+            x1 = max(0, x - pad_w)
+            y1 = max(0, y - pad_h)
+            x2 = min(img_width, x + w + pad_w)
+            y2 = min(img_height, y + h + pad_h)
+            
+            logger.debug("Padded plate region: %d,%d to %d,%d (size: %dx%d)", x1, y1, x2, y2, x2 - x1, y2 - y1)
+            return [(int(x1), int(y1), int(x2), int(y2), 0.0)]
         
-        print("Haar detection failed.")
-        return None
+        logger.debug("Haar detection failed.")
+        return []
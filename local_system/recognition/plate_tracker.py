@@ -0,0 +1,204 @@
+import itertools
+import threading
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2, ...) boxes."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+class PlateTrack:
+    """One vehicle's plate followed across frames, with its fused OCR readings."""
+
+    def __init__(self, track_id, box, frame):
+        self.track_id = track_id
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.best_frame = frame
+        self.best_box = box
+        self.ocr_quality = 0.0  # Quality of the best crop sent to OCR so far
+        self.last_ocr_hit = 0
+        self.ocr_request = (0.0, 0)  # (ocr_quality, last_ocr_hit) before the last request
+        self.deferrals = 0  # OCR requests taken back because the crop was unusable
+        self.votes = {}
+        self.readings = 0
+        self.decided = False
+
+    @property
+    def rereading(self):
+        """True when the pending OCR request is not the track's first."""
+        return self.ocr_request[0] > 0.0
+
+    @property
+    def quality(self):
+        # Closer plates are larger and read better
+        return float(box_area(self.box))
+
+    def add_reading(self, text, confidence):
+        """Votes for `text` with weight `confidence`."""
+        if not text:
+            return
+        self.votes[text] = self.votes.get(text, 0.0) + max(confidence, 1e-3)
+        self.readings += 1
+
+    def fused_text(self):
+        """The reading with the most confidence-weighted votes, or ''."""
+        if not self.votes:
+            return ""
+        return max(self.votes.items(), key=lambda item: item[1])[0]
+
+
+class PlateTracker:
+    """
+    Greedy IoU tracker over per-frame plate boxes.
+
+    Each box is matched to the live track it overlaps most; unmatched boxes
+    start new tracks and tracks unseen for `max_missed` frames are closed.
+    OCR is requested for a track when it is new, when its crop is noticeably
+    larger than the best one read so far, or every `reocr_interval` frames
+    while it is still undecided. A track is ready for a gate decision after
+    one reading above `decide_confidence`, after `min_readings` readings, or
+    when it leaves the frame. OCR on a track's unusable crops is deferred at
+    most `max_deferrals` times before its best crop is read anyway.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=15, reocr_gain=1.25,
+                 reocr_interval=10, min_readings=3, decide_confidence=0.8, max_deferrals=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reocr_gain = reocr_gain
+        self.reocr_interval = reocr_interval
+        self.min_readings = min_readings
+        self.decide_confidence = decide_confidence
+        self.max_deferrals = max_deferrals
+        self.tracks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, boxes, frame):
+        """
+        Feeds one frame's boxes. Returns (to_ocr, finished):
+        tracks whose crop should be read now, and tracks that left the
+        frame without a decision. A finished track whose crops were never
+        usable has no readings, and its fused_text() is "".
+        """
+        with self._lock:
+            pairs = sorted(
+                ((box_iou(track.box, box), track_id, i)
+                 for track_id, track in self.tracks.items()
+                 for i, box in enumerate(boxes)),
+                reverse=True,
+            )
+
+            matched_tracks, matched_boxes = set(), set()
+            for iou, track_id, i in pairs:
+                if iou < self.iou_threshold:
+                    break
+                if track_id in matched_tracks or i in matched_boxes:
+                    continue
+                track = self.tracks[track_id]
+                track.box = boxes[i]
+                track.hits += 1
+                track.missed = 0
+                matched_tracks.add(track_id)
+                matched_boxes.add(i)
+
+            for i, box in enumerate(boxes):
+                if i not in matched_boxes:
+                    track = PlateTrack(next(self._ids), box, frame)
+                    self.tracks[track.track_id] = track
+                    matched_tracks.add(track.track_id)
+
+            finished = []
+            for track_id in list(self.tracks):
+                if track_id in matched_tracks:
+                    continue
+                track = self.tracks[track_id]
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track_id]
+                    if not track.decided and (track.readings or track.deferrals):
+                        track.decided = True
+                        finished.append(track)
+
+            to_ocr = []
+            for track_id in matched_tracks:
+                track = self.tracks[track_id]
+                if track.decided or track.missed:
+                    continue
+                is_new = track.ocr_quality == 0.0
+                improved = track.quality >= track.ocr_quality * self.reocr_gain
+                stale = track.hits - track.last_ocr_hit >= self.reocr_interval
+                if is_new or improved or stale:
+                    track.ocr_request = (track.ocr_quality, track.last_ocr_hit)
+                    if is_new or improved:
+                        track.ocr_quality = track.quality
+                        track.best_frame = frame
+                        track.best_box = track.box
+                    track.last_ocr_hit = track.hits
+                    to_ocr.append(track)
+
+            return to_ocr, finished
+
+    def live_boxes(self):
+        """Current boxes of tracks seen in the last frame, largest first."""
+        with self._lock:
+            boxes = [t.box for t in self.tracks.values() if not t.missed]
+            return sorted(boxes, key=box_area, reverse=True)
+
+    def keep_frame(self, frame, copy):
+        """
+        Points tracks holding `frame` at one `copy(frame)`, for frames that are
+        only borrowed (shared-memory views). Returns the frame they now hold.
+        """
+        with self._lock:
+            holders = [t for t in self.tracks.values() if t.best_frame is frame]
+            if not holders:
+                return frame
+            kept = copy(frame)
+            for track in holders:
+                track.best_frame = kept
+            return kept
+
+    def defer_ocr(self, track_id):
+        """
+        Takes back the last OCR request for a track (unusable crop), so the
+        next frame is tried. Returns False instead once the track has waited
+        `max_deferrals` times: the caller should read its best crop now.
+        """
+        with self._lock:
+            track = self.tracks.get(track_id)
+            if track is None:
+                return True
+            if track.deferrals >= self.max_deferrals:
+                return False
+            track.deferrals += 1
+            track.ocr_quality, track.last_ocr_hit = track.ocr_request
+            return True
+
+    def add_reading(self, track_id, text, confidence):
+        """
+        Records an OCR result for a track. Returns the track once it has
+        enough readings for a decision (only once per track), else None.
+        """
+        with self._lock:
+            track = self.tracks.get(track_id)
+            if track is None or track.decided:
+                return None
+            track.add_reading(text, confidence)
+            if track.readings >= self.min_readings or (text and confidence >= self.decide_confidence):
+                track.decided = True
+                return track
+            return None
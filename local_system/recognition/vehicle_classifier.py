@@ -1,22 +1,57 @@
 import cv2
+import logging
 import numpy as np
 import os
-# Force legacy keras for Teachable Machine models
-os.environ["TF_USE_LEGACY_KERAS"] = "1"
-import tensorflow as tf
-import tf_keras as keras 
-from tf_keras.models import load_model
 import config
+from recognition import onnx_backend
+from recognition.crop_cache import CropCache
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+tf = None
+keras = None
+
+
+def _import_keras():
+    """TensorFlow is only needed for the Keras backend, so import it on demand."""
+    global tf, keras
+    # Force legacy keras for Teachable Machine models
+    os.environ["TF_USE_LEGACY_KERAS"] = "1"
+    import tensorflow as tf
+    import tf_keras as keras
+
 
 class VehicleClassifier:
-    def __init__(self):
-        print("Loading Vehicle Classification Models...")
-        print(f"DEBUG: Color Path: {config.COLOR_MODEL_PATH}")
-        print(f"DEBUG: Make Path: {config.MAKE_MODEL_PATH}")
+    def __init__(self, backend=None):
+        self.backend = backend or config.CLASSIFIER_BACKEND
+        logger.info("Loading Vehicle Classification Models (%s)...", self.backend)
+        logger.debug("Color Path: %s", config.COLOR_MODEL_PATH)
+        logger.debug("Make Path: %s", config.MAKE_MODEL_PATH)
         
+        self.color_model = None
+        self.make_model = None
+        self.fused_model = None
+        self._fused = None
+        self._onnx = None
+        self.input_size = (224, 224)
+        self.cache = None
+        if config.CLASSIFIER_CACHE_ENABLED:
+            self.cache = CropCache(
+                "classifier", config.READ_CACHE_SIZE, config.READ_CACHE_TTL, config.CLASSIFIER_CACHE_MAX_DISTANCE
+            )
         try:
-            self.color_model = load_model(config.COLOR_MODEL_PATH)
-            self.make_model = load_model(config.MAKE_MODEL_PATH)
+            if self.backend == "onnx":
+                self._onnx = onnx_backend.OnnxVehicleClassifier(
+                    onnx_backend.model_path(onnx_backend.CLASSIFIER_MODEL)
+                )
+                self.input_size = tuple(self._onnx.input_shape[2:0:-1])
+            else:
+                _import_keras()
+                self.color_model = keras.models.load_model(config.COLOR_MODEL_PATH)
+                self.make_model = keras.models.load_model(config.MAKE_MODEL_PATH)
+                # Resize straight to what the model takes
+                self.input_size = tuple(self.color_model.input_shape[2:0:-1])
             
             # Load Labels
             color_label_path = config.COLOR_MODEL_PATH.replace('keras_model.h5', 'labels.txt')
@@ -25,17 +60,41 @@ class VehicleClassifier:
             self.color_labels = self.load_labels(color_label_path)
             self.make_labels = self.load_labels(make_label_path)
             
-            print(f"DEBUG: Color Labels Loaded: {self.color_labels}")
-            print(f"DEBUG: Make Labels Loaded: {self.make_labels}")
-            print("Models loaded successfully.")
+            logger.debug("Color Labels Loaded: %s", self.color_labels)
+            logger.debug("Make Labels Loaded: %s", self.make_labels)
+            
+            if self.color_model:
+                self._build_fused_model()
+            logger.info("Models loaded successfully.")
         except Exception as e:
-            print(f"Error loading models: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error loading models: %s", e)
             self.color_model = None
             self.make_model = None
             self.color_labels = []
             self.make_labels = []
+            self._fused = None
+            self._onnx = None
+
+    def _build_fused_model(self):
+        """
+        Wraps both heads in one graph so a single call runs color and make.
+        `model.predict` sets up a data pipeline on every call; a compiled
+        tf.function over the models' __call__ does not.
+        """
+        self._fused = None
+        if self.color_model.input_shape != self.make_model.input_shape:
+            logger.debug("Color and make models take different inputs; not fusing.")
+            return
+        
+        inputs = keras.Input(shape=self.color_model.input_shape[1:])
+        self.fused_model = keras.Model(inputs, [self.color_model(inputs), self.make_model(inputs)])
+        fused = self.fused_model
+        
+        @tf.function(input_signature=[tf.TensorSpec(self.color_model.input_shape, tf.float32)])
+        def infer(batch):
+            return fused(batch, training=False)
+        
+        self._fused = infer
 
     def load_labels(self, path):
         try:
@@ -51,56 +110,139 @@ class VehicleClassifier:
                         labels.append(line.strip())
                 return labels
         except Exception as e:
-            print(f"Warning: Could not load labels from {path}: {e}")
+            logger.warning("Could not load labels from %s: %s", path, e)
             return []
 
     def preprocess(self, image):
-        img = cv2.resize(image, (224, 224))
+        # `image` should be the vehicle region, not the whole frame
+        img = cv2.resize(image, self.input_size)
         # Teachable Machine Standard Image Model uses (Image / 127.5) - 1
         img = (np.asarray(img, dtype=np.float32) / 127.5) - 1.0
         img = np.expand_dims(img, axis=0)
         return img
 
+    def classify(self, image):
+        """
+        Predicts color and make from one preprocessing pass and one model call.
+        Returns (color, color_confidence, make, make_confidence).
+        """
+        with metrics.span("classify"):
+            if self.cache is None:
+                return self._classify(image)
+            key, cached = self.cache.lookup(image)
+            if cached is not None:
+                return cached
+            result = self._classify(image)
+            if result[0] != "Error":
+                self.cache.store(key, result)
+            return result
+
+    def _classify(self, image):
+        if self._onnx:
+            try:
+                color_pred, make_pred = self._onnx.predict(self.preprocess(image))
+                color, color_conf = self._decode(color_pred, self.color_labels, "Color")
+                make, make_conf = self._decode(make_pred, self.make_labels, "Make")
+                return color, color_conf, make, make_conf
+            except Exception as e:
+                logger.error("Classification error: %s", e)
+                return "Error", 0.0, "Error", 0.0
+        
+        if not self._fused:
+            color, color_conf = self.predict_color(image)
+            make, make_conf = self.predict_make(image)
+            return color, color_conf, make, make_conf
+        
+        try:
+            processed = self.preprocess(image)
+            color_pred, make_pred = self._fused(tf.constant(processed))
+            color, color_conf = self._decode(color_pred.numpy(), self.color_labels, "Color")
+            make, make_conf = self._decode(make_pred.numpy(), self.make_labels, "Make")
+            return color, color_conf, make, make_conf
+        except Exception as e:
+            logger.error("Classification error: %s", e)
+            return "Error", 0.0, "Error", 0.0
+
+    def classify_batch(self, images):
+        """
+        Classifies several vehicle regions with one model call.
+        Returns one (color, color_confidence, make, make_confidence) per image.
+        """
+        images = list(images)
+        if not images:
+            return []
+        with metrics.span("classify_batch"):
+            keys = [None] * len(images)
+            results = [None] * len(images)
+            if self.cache is not None:
+                for i, image in enumerate(images):
+                    keys[i], results[i] = self.cache.lookup(image)
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                for i, result in zip(misses, self._classify_many([images[i] for i in misses])):
+                    results[i] = result
+                    if self.cache is not None and result[0] != "Error":
+                        self.cache.store(keys[i], result)
+            return results
+
+    def _classify_many(self, images):
+        if not self._onnx and not self._fused:
+            return [self._classify(image) for image in images]
+        try:
+            batch = np.concatenate([self.preprocess(image) for image in images])
+            if self._onnx:
+                color_pred, make_pred = self._onnx.predict(batch)
+            else:
+                color_pred, make_pred = (pred.numpy() for pred in self._fused(tf.constant(batch)))
+            results = []
+            for i in range(len(images)):
+                color, color_conf = self._decode(color_pred[i:i + 1], self.color_labels, "Color")
+                make, make_conf = self._decode(make_pred[i:i + 1], self.make_labels, "Make")
+                results.append((color, color_conf, make, make_conf))
+            return results
+        except Exception as e:
+            logger.error("Classification error: %s", e)
+            return [("Error", 0.0, "Error", 0.0)] * len(images)
+
+    def _decode(self, prediction, labels, name):
+        idx = np.argmax(prediction)
+        confidence = prediction[0][idx]
+        
+        logger.debug("%s Raw Pred: %s -> Idx: %s", name, prediction, idx)
+        
+        if idx < len(labels):
+            label = labels[idx]
+        else:
+            label = f"Index {idx}"
+            
+        return label, float(confidence)
+
     def predict_color(self, image):
+        if self._onnx:
+            color, color_conf, _, _ = self.classify(image)
+            return color, color_conf
         if not self.color_model:
             return "Unknown (No Model)", 0.0
         
         try:
             processed = self.preprocess(image)
-            prediction = self.color_model.predict(processed, verbose=0)
-            idx = np.argmax(prediction)
-            confidence = prediction[0][idx]
-            
-            print(f"DEBUG: Color Raw Pred: {prediction} -> Idx: {idx}")
-            
-            if idx < len(self.color_labels):
-                label = self.color_labels[idx]
-            else:
-                label = f"Index {idx}"
-                
-            return label, float(confidence)
+            prediction = self.color_model(processed, training=False).numpy()
+            return self._decode(prediction, self.color_labels, "Color")
         except Exception as e:
-            print(f"Color prediction error: {e}")
+            logger.error("Color prediction error: %s", e)
             return "Error", 0.0
 
     def predict_make(self, image):
+        if self._onnx:
+            _, _, make, make_conf = self.classify(image)
+            return make, make_conf
         if not self.make_model:
             return "Unknown (No Model)", 0.0
             
         try:
             processed = self.preprocess(image)
-            prediction = self.make_model.predict(processed, verbose=0)
-            idx = np.argmax(prediction)
-            confidence = prediction[0][idx]
-            
-            print(f"DEBUG: Make Raw Pred: {prediction} -> Idx: {idx}")
-            
-            if idx < len(self.make_labels):
-                label = self.make_labels[idx]
-            else:
-                label = f"Index {idx}"
-                
-            return label, float(confidence)
+            prediction = self.make_model(processed, training=False).numpy()
+            return self._decode(prediction, self.make_labels, "Make")
         except Exception as e:
-            print(f"Make prediction error: {e}")
+            logger.error("Make prediction error: %s", e)
             return "Error", 0.0
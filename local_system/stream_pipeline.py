@@ -0,0 +1,451 @@
+"""
+Continuous capture mode.
+
+Capture, plate detection, OCR, classification and the access decision each
+run on their own thread, connected by queues. The frame and plate-crop
+queues are small and drop their oldest item when a stage falls behind, so
+capture never stalls; the classify and decide queues carry one item per
+vehicle and never drop.
+Plates are tracked across frames so each vehicle is read a few times and
+decided once, not once per frame.
+
+Run headless against a camera, a video file or an image directory:
+
+    python stream_pipeline.py --source 0
+    python stream_pipeline.py --source clips/gate.mp4
+    python stream_pipeline.py --source 0 --shared-capture
+"""
+import argparse
+import collections
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import config
+from database import check_vehicle_access, log_access_attempt
+from frame_ring import SharedFrameSource
+from recognition.crop_quality import assess_crop
+from recognition.plate_tracker import PlateTracker
+from telemetry import configure_logging, metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class DropOldestQueue:
+    """
+    Bounded FIFO that discards its oldest item instead of blocking the
+    producer. With `maxsize=None` it is unbounded and never drops.
+
+    Like queue.Queue, an item taken by `get()` counts as unfinished until
+    the consumer calls `task_done()`, so `pending()` covers items still
+    being handled.
+    """
+
+    def __init__(self, maxsize, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.unfinished = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def pending(self):
+        """Items queued or taken but not yet marked done."""
+        with self._cond:
+            return len(self._items) + self.unfinished
+
+    def put(self, item):
+        with self._cond:
+            if self.maxsize is not None and len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(dropped)
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the next item, or None if nothing arrived within `timeout`."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            self.unfinished += 1
+            return self._items.popleft()
+
+    def task_done(self):
+        with self._cond:
+            self.unfinished -= 1
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed):
+        with self._lock:
+            self.processed += 1
+            self.busy_time += elapsed
+        metrics.observe('anpr_stream_stage_seconds', elapsed, stage=self.name)
+
+    def snapshot(self):
+        with self._lock:
+            uptime = max(time.monotonic() - self.started, 1e-9)
+            return {
+                'processed': self.processed,
+                'per_second': self.processed / uptime,
+                'avg_latency': self.busy_time / self.processed if self.processed else 0.0,
+            }
+
+
+class FrameSource:
+    """
+    Yields BGR frames from a camera index, a video file or a directory of images.
+    File sources are paced to `fps` so they behave like a live camera.
+    """
+
+    def __init__(self, source, fps=None):
+        self.source = source
+        self.fps = fps
+        self._capture = None
+        self._images = None
+        self._last_read = 0.0
+
+        if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+            self._capture = cv2.VideoCapture(int(source))
+            self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
+            self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
+            self.live = True
+        elif os.path.isdir(source):
+            self._images = sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self.fps = fps or config.STREAM_SOURCE_FPS
+            self.live = False
+        else:
+            self._capture = cv2.VideoCapture(source)
+            self.fps = fps or self._capture.get(cv2.CAP_PROP_FPS) or config.STREAM_SOURCE_FPS
+            self.live = False
+
+        if self._capture is not None and not self._capture.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+
+    def read(self):
+        """Returns the next frame, or None when the source is exhausted."""
+        if not self.live and self.fps:
+            wait = self._last_read + 1.0 / self.fps - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_read = time.monotonic()
+
+        if self._images is not None:
+            while self._images:
+                frame = cv2.imread(self._images.pop(0))
+                if frame is not None:
+                    return frame
+            return None
+
+        ok, frame = self._capture.read()
+        return frame if ok else None
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+
+
+class StreamPipeline:
+    """
+    Staged producer/consumer pipeline for continuous gate operation.
+
+    `on_decision(frame, plate_text, color, make, message, access, color_warning)`
+    is called from the decision thread for every access decision.
+    `on_frame(frame)` is called from the capture thread for every frame.
+    """
+
+    STAGES = ('capture', 'detect', 'ocr', 'classify', 'decide')
+
+    def __init__(self, plate_detector, ocr_engine, vehicle_classifier,
+                 on_decision=None, on_frame=None, queue_size=None):
+        self.plate_detector = plate_detector
+        self.ocr_engine = ocr_engine
+        self.vehicle_classifier = vehicle_classifier
+        self.on_decision = on_decision
+        self.on_frame = on_frame
+
+        queue_size = queue_size or config.STREAM_QUEUE_SIZE
+        self.queues = {
+            # Frames and crops go stale: a newer one is worth more than a backlog
+            'detect': DropOldestQueue(queue_size, on_drop=lambda item: self._frame_done(item[0])),
+            'ocr': DropOldestQueue(queue_size),
+            # One item per vehicle; dropping one would lose a gate decision
+            'classify': DropOldestQueue(None),
+            'decide': DropOldestQueue(None),
+        }
+        self.stats = {stage: StageStats(stage) for stage in self.STAGES}
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._source = None
+        self._recent_plates = {}
+        self.tracker = PlateTracker(
+            iou_threshold=config.TRACK_IOU_THRESHOLD,
+            max_missed=config.TRACK_MAX_MISSED,
+            reocr_gain=config.TRACK_REOCR_GAIN,
+            reocr_interval=config.TRACK_REOCR_INTERVAL,
+            min_readings=config.TRACK_MIN_READINGS,
+            decide_confidence=config.TRACK_DECIDE_CONFIDENCE,
+            max_deferrals=config.CROP_MAX_DEFERRALS,
+        )
+
+    @property
+    def running(self):
+        """True while frames are still being captured or are queued for a stage."""
+        if self._stop.is_set() or not self._threads:
+            return False
+        return (
+            self._threads[0].is_alive()
+            or any(q.pending() for q in self.queues.values())
+        )
+
+    def start(self, source):
+        """
+        Starts all stages reading from `source` (camera index, video path or
+        image dir, or a FrameSource / SharedFrameSource).
+        """
+        self._stop.clear()
+        self._source = source if isinstance(source, (FrameSource, SharedFrameSource)) else FrameSource(source)
+        workers = {
+            'capture': self._capture_loop,
+            'detect': self._detect_loop,
+            'ocr': self._ocr_loop,
+            'classify': self._classify_loop,
+            'decide': self._decide_loop,
+        }
+        self._threads = [
+            threading.Thread(target=workers[stage], name=f"stream-{stage}", daemon=True)
+            for stage in self.STAGES
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        if self._source:
+            self._source.release()
+
+    def wait(self):
+        """Blocks until the source is exhausted and every queue has drained."""
+        while self.running:
+            time.sleep(0.05)
+        self.stop()
+
+    def stage_stats(self):
+        """Per-stage throughput, latency, queue depth and drop counters."""
+        report = {}
+        for stage in self.STAGES:
+            report[stage] = self.stats[stage].snapshot()
+            q = self.queues.get(stage)
+            report[stage]['queue_depth'] = len(q) if q is not None else 0
+            report[stage]['dropped'] = q.dropped if q is not None else 0
+        return report
+
+    def _run_stage(self, stage, handler):
+        """Pulls items from the stage's input queue until stopped."""
+        inbox = self.queues[stage]
+        while not self._stop.is_set():
+            item = inbox.get(timeout=0.1)
+            if item is None:
+                continue
+            started = time.perf_counter()
+            try:
+                handler(*item)
+            except Exception as e:
+                logger.exception("Stream stage %s error: %s", stage, e)
+            finally:
+                # After the handler queued its output, so the item is never unaccounted for
+                inbox.task_done()
+            self.stats[stage].record(time.perf_counter() - started)
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            frame = self._source.read()
+            if frame is None:
+                logger.info("Stream source exhausted.")
+                break
+            self.stats['capture'].record(time.perf_counter() - started)
+            # Before queueing: a shared-memory frame may be released once detected
+            if self.on_frame:
+                self.on_frame(frame)
+            self.queues['detect'].put((frame,))
+
+    def _detect_loop(self):
+        def handle(frame):
+            try:
+                detect(frame)
+            finally:
+                self._frame_done(frame)
+
+        def detect(frame):
+            # If YOLO misses a tracked vehicle, the fallback only searches around it
+            search_box = None
+            live = self.tracker.live_boxes()
+            if live:
+                search_box = self.plate_detector.vehicle_box(live[0], frame.shape)
+            boxes = self.plate_detector.detect_boxes(frame, search_box)
+            to_ocr, finished = self.tracker.update(boxes, frame)
+            borrowed = getattr(self._source, 'zero_copy', False)
+            if borrowed:
+                # Shared-memory frames go back to the ring after this stage;
+                # copy only what later stages keep
+                frame = self.tracker.keep_frame(frame, np.copy)
+            for track in to_ocr:
+                plate_img = self.plate_detector.crop(frame, track.box)
+                if not plate_img.size:
+                    self.tracker.defer_ocr(track.track_id)
+                    continue
+                usable, reason, _ = assess_crop(plate_img)
+                if not usable:
+                    if self.tracker.defer_ocr(track.track_id):
+                        # Blurred, tiny or badly exposed: wait for a better frame of this vehicle
+                        logger.debug("Track %d: crop unusable (%s), deferring OCR", track.track_id, reason)
+                        continue
+                    # No better frame came; read the largest crop seen rather than lose the vehicle
+                    logger.debug("Track %d: no usable crop after %d tries, reading the best one",
+                                 track.track_id, track.deferrals)
+                    plate_img = self.plate_detector.crop(track.best_frame, track.best_box)
+                if borrowed:
+                    plate_img = plate_img.copy()
+                self.queues['ocr'].put((track.track_id, plate_img, track.rereading))
+            # Vehicles that left before enough readings are decided on what we have,
+            # an empty plate when none of their crops was usable
+            for track in finished:
+                self.queues['classify'].put((track.best_frame, track.best_box, track.fused_text()))
+        self._run_stage('detect', handle)
+
+    def _ocr_loop(self):
+        def handle(track_id, plate_img, rereading):
+            # A cached result for a re-read would only repeat an earlier vote
+            plate_text, confidence = self.ocr_engine.extract_text_with_confidence(
+                plate_img, use_cache=not rereading
+            )
+            # No operator in the loop: unreadable plates wait for a better frame
+            if not plate_text or not self.ocr_engine.validate_plate(plate_text):
+                plate_text = ""
+            track = self.tracker.add_reading(track_id, plate_text, confidence)
+            if track is not None:
+                self.queues['classify'].put((track.best_frame, track.best_box, track.fused_text()))
+        self._run_stage('ocr', handle)
+
+    def _classify_loop(self):
+        def handle(frame, plate_box, plate_text):
+            if self._recently_decided(plate_text):
+                return
+            vehicle_box = self.plate_detector.vehicle_box(plate_box, frame.shape)
+            color, _, make, _ = self.vehicle_classifier.classify(self.plate_detector.crop(frame, vehicle_box))
+            self.queues['decide'].put((frame, plate_text, color, make))
+        self._run_stage('classify', handle)
+
+    def _decide_loop(self):
+        def handle(frame, plate_text, color, make):
+            if self._recently_decided(plate_text):
+                return
+            self._remember_decision(plate_text)
+
+            access, msg, color_warning = check_vehicle_access(plate_text, color, make)
+            log_access_attempt(
+                plate_number=plate_text,
+                detected_color=color,
+                detected_model=make,
+                plate_matched=access,
+                color_matched=not color_warning
+            )
+            logger.info("Stream decision: %s -> %s (%s)", plate_text, 'OPEN' if access else 'CLOSED', msg)
+            if self.on_decision:
+                self.on_decision(frame, plate_text, color, make, msg, access, color_warning)
+        self._run_stage('decide', handle)
+
+    def _frame_done(self, frame):
+        done = getattr(self._source, 'done', None)
+        if done:
+            done(frame)
+
+    def _recently_decided(self, plate_text):
+        # A vehicle stays in view for many frames; decide on it once.
+        # Unread plates are different vehicles, so they are never merged.
+        if not plate_text:
+            return False
+        decided_at = self._recent_plates.get(plate_text)
+        return decided_at is not None and time.monotonic() - decided_at < config.STREAM_DECISION_COOLDOWN
+
+    def _remember_decision(self, plate_text):
+        if not plate_text:
+            return
+        now = time.monotonic()
+        # Oldest decisions sit first; forget those past the cooldown so the map stays small
+        for plate, decided_at in list(self._recent_plates.items()):
+            if now - decided_at < config.STREAM_DECISION_COOLDOWN:
+                break
+            del self._recent_plates[plate]
+        self._recent_plates.pop(plate_text, None)
+        self._recent_plates[plate_text] = now
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the gate pipeline on a live or recorded source.")
+    parser.add_argument('--source', default=str(config.CAMERA_INDEX),
+                        help="Camera index, video file or image directory")
+    parser.add_argument('--fps', type=float, default=None,
+                        help="Pace for file sources (default: the video's own rate)")
+    parser.add_argument('--shared-capture', action='store_true',
+                        help="Capture in a separate process and share frames through shared memory")
+    args = parser.parse_args()
+    configure_logging()
+    metrics.start_export()
+
+    from recognition.plate_detector import PlateDetector
+    from recognition.ocr_engine import OCREngine
+    from recognition.vehicle_classifier import VehicleClassifier
+
+    pipeline = StreamPipeline(PlateDetector(), OCREngine(), VehicleClassifier())
+    if args.shared_capture:
+        source = SharedFrameSource(args.source, fps=args.fps)
+    else:
+        source = FrameSource(args.source, fps=args.fps)
+    pipeline.start(source)
+    try:
+        while pipeline.running:
+            time.sleep(config.STREAM_STATS_INTERVAL)
+            lines = ["Stage stats:"]
+            for stage, s in pipeline.stage_stats().items():
+                lines.append(f"  {stage:<9} {s['per_second']:6.1f}/s  avg {s['avg_latency'] * 1000:7.1f} ms  "
+                             f"queue {s['queue_depth']}  dropped {s['dropped']}")
+            logger.info("\n".join(lines))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+
+
+if __name__ == "__main__":
+    main()
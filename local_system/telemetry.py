@@ -0,0 +1,244 @@
+"""
+Logging setup and lightweight metrics for the gate pipeline.
+
+Stages are timed with `metrics.span(stage)` blocks into latency histograms,
+and events (YOLO vs Haar detections, OCR method wins, exact vs fuzzy
+matches, manual entries) are counted with `metrics.inc(...)`. Everything is
+exposed in the Prometheus text format on a local HTTP endpoint
+(METRICS_PORT) and/or rewritten periodically to a file (METRICS_FILE).
+With METRICS_ENABLED off, spans and counters are no-ops.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Seconds; covers sub-millisecond matching up to multi-second OCR on CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'anpr_stage_seconds': "Latency of each recognition stage.",
+    'anpr_ocr_method_seconds': "Latency of one OCR preprocessing method plus its read.",
+    'anpr_stream_stage_seconds': "Per-item latency of each stream pipeline stage.",
+    'anpr_access_log_flush_seconds': "Latency of one access-log batch insert.",
+    'anpr_access_log_dead_letters_total': "Access-log rows moved to the dead-letter table after repeated rejections.",
+    'anpr_plate_detections_total': "Plate detection calls by the method that produced the box.",
+    'anpr_ocr_method_wins_total': "OCR reads won by each preprocessing method.",
+    'anpr_plate_matches_total': "Access checks by how the plate was matched.",
+    'anpr_access_decisions_total': "Access decisions by result.",
+    'anpr_manual_entries_total': "Plates typed in by the operator after OCR failed.",
+    'anpr_crop_quality_total': "Plate crops by quality check result (ok, or the reason OCR was skipped).",
+    'anpr_crop_cache_lookups_total': "Read cache lookups by cache and hit/miss.",
+    'anpr_lane_decision_seconds': "Time from frame capture to gate decision, per lane.",
+    'anpr_lane_slo_misses_total': "Gate decisions slower than the lane's latency target.",
+    'anpr_lane_frames_skipped_total': "Frames replaced by a newer one before detection, per lane.",
+}
+
+
+def configure_logging(level=None, fmt=None):
+    """Sets up root logging once, at LOG_LEVEL unless `level` is given."""
+    level = level or config.LOG_LEVEL
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO), format=fmt or LOG_FORMAT)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as Prometheus expects."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """Thread-safe registry of labelled histograms and counters."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._server = None
+        self._file_thread = None
+
+    def span(self, stage, name='anpr_stage_seconds', **labels):
+        """Times a `with` block into the `name` histogram, labelled with `stage`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        labels['stage'] = stage
+        return _Span(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start_export(self, port=None, path=None, interval=None):
+        """
+        Starts the HTTP endpoint and/or file writer configured in config.py.
+        Safe to call more than once.
+        """
+        port = config.METRICS_PORT if port is None else port
+        path = config.METRICS_FILE if path is None else path
+        if not self.enabled:
+            return
+        if port and self._server is None:
+            self._serve(port)
+        if path and self._file_thread is None:
+            interval = interval or config.METRICS_FILE_INTERVAL
+            self._file_thread = threading.Thread(
+                target=self._write_file_loop, args=(path, interval), name="metrics-file", daemon=True
+            )
+            self._file_thread.start()
+
+    def stop_export(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def write_file(self, path):
+        # Write then rename so scrapers never read a half-written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def _serve(self, port):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug("metrics request: " + fmt, *args)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+
+    def _write_file_loop(self, path, interval):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger.info("Writing metrics to %s every %ss", path, interval)
+        while True:
+            try:
+                self.write_file(path)
+            except OSError as e:
+                logger.warning("Could not write metrics file %s: %s", path, e)
+            time.sleep(interval)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+metrics = Metrics(enabled=config.METRICS_ENABLED)
@@ -0,0 +1,96 @@
+"""AccessLogWriter shipping: transient failures, rejected rows and the dead-letter table."""
+import sqlite3
+
+import pytest
+
+from access_log_writer import AccessLogWriter, is_permanent_error
+
+
+class APIError(Exception):
+    """Shaped like postgrest.exceptions.APIError."""
+
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class FakeTable:
+    def __init__(self, bad_plates=(), outage=False):
+        self.rows = []
+        self.calls = 0
+        self.bad_plates = set(bad_plates)
+        self.outage = outage
+
+    def insert_batch(self, rows):
+        self.calls += 1
+        if self.outage:
+            raise ConnectionError("network down")
+        if any(row['plate_number'] in self.bad_plates for row in rows):
+            raise APIError("22P02")
+        self.rows.extend(rows)
+
+
+def make_writer(tmp_path, table, **kwargs):
+    return AccessLogWriter(table.insert_batch, str(tmp_path / "spool.db"), batch_size=8, **kwargs)
+
+
+def ship(writer, rows):
+    conn = writer._connect()
+    for row in rows:
+        writer.enqueue(row)
+    writer._spool(conn)
+    return conn, writer._ship(conn)
+
+
+def plates(n):
+    return [{'plate_number': f"ABC{i}"} for i in range(n)]
+
+
+@pytest.mark.parametrize("code, permanent", [
+    ("22P02", True), ("23502", True), ("42703", True), ("PGRST204", True), (400, True), ("404", True),
+    ("42501", False), ("PGRST301", False), (502, False), (429, False), ("57014", False), (None, False),
+])
+def test_is_permanent_error(code, permanent):
+    assert is_permanent_error(APIError(code)) is permanent
+
+
+def test_network_error_keeps_batch(tmp_path):
+    table = FakeTable(outage=True)
+    writer = make_writer(tmp_path, table)
+    conn, healthy = ship(writer, plates(5))
+    assert not healthy
+    assert writer._spool_depth == 5
+    assert conn.execute("SELECT MAX(attempts) FROM pending_access_logs").fetchone()[0] == 0
+
+
+def test_bad_row_is_isolated_then_dead_lettered(tmp_path):
+    table = FakeTable(bad_plates={"ABC5"})
+    writer = make_writer(tmp_path, table, max_attempts=2)
+    conn, healthy = ship(writer, plates(20))
+
+    # Everything but the bad row went in, in order
+    assert not healthy
+    assert [row['plate_number'] for row in table.rows] == [f"ABC{i}" for i in range(20) if i != 5]
+    assert writer._spool_depth == 1
+
+    assert writer._ship(conn)
+    assert writer._spool_depth == 0
+    dead = conn.execute("SELECT row, error FROM dead_access_logs").fetchall()
+    assert len(dead) == 1 and "ABC5" in dead[0][0]
+    assert writer.metrics()['rows_dead_lettered'] == 1
+
+
+def test_old_spool_gains_attempts_column(tmp_path):
+    path = tmp_path / "spool.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE pending_access_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)")
+    conn.execute("INSERT INTO pending_access_logs (row) VALUES ('{\"plate_number\": \"OLD1\"}')")
+    conn.commit()
+    conn.close()
+
+    table = FakeTable()
+    writer = AccessLogWriter(table.insert_batch, str(path))
+    conn = writer._connect()
+    writer._spool_depth = 1
+    assert writer._ship(conn)
+    assert table.rows == [{'plate_number': "OLD1"}]
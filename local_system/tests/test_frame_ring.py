@@ -0,0 +1,89 @@
+"""FrameRing reference counting across reader processes."""
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing
+
+SHAPE = (4, 4, 3)
+
+
+def _reader(spec, ref, release, events):
+    ring = FrameRing.attach(spec)
+    events.put(("held", int(ring.view(ref)[0, 0, 0])))
+    release.wait(10)
+    ring.release(ref)
+    events.put(("released", None))
+    ring.close()
+
+
+@pytest.fixture
+def ring():
+    ctx = multiprocessing.get_context("spawn")
+    ring = FrameRing.create(slots=2, shape=SHAPE, ctx=ctx)
+    yield ctx, ring
+    ring.close()
+
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_slot_reused_only_after_every_reader_releases(ring):
+    ctx, ring = ring
+    writer = FrameRing.attach(ring.spec(), writer=True)
+    ref = writer.write(frame(7), refs=2)
+
+    events = ctx.Queue()
+    releases = [ctx.Event(), ctx.Event()]
+    readers = [
+        ctx.Process(target=_reader, args=(ring.spec(), ref, release, events), daemon=True)
+        for release in releases
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        assert [events.get(timeout=30) for _ in readers] == [("held", 7), ("held", 7)]
+
+        # The other slot takes one frame; after that the held one must not be reused
+        other = writer.write(frame(1))
+        assert other is not None
+        releases[0].set()
+        assert events.get(timeout=10) == ("released", None)
+        assert writer.write(frame(2)) is None
+        assert ring.view(ref)[0, 0, 0] == 7
+
+        releases[1].set()
+        assert events.get(timeout=10) == ("released", None)
+        ring.release(other)
+        new_ref = writer.write(frame(3))
+        assert new_ref is not None and new_ref[0] == ref[0]
+        with pytest.raises(LookupError):
+            ring.view(ref)
+    finally:
+        for release in releases:
+            release.set()
+        for reader in readers:
+            reader.join(5)
+        writer.close()
+
+
+def test_retain_adds_holders(ring):
+    _, ring = ring
+    writer = FrameRing.attach(ring.spec(), writer=True)
+    ref = writer.write(frame(5))
+    ring.retain(ref)
+    ring.release(ref)
+    assert ring.in_use() == 1
+    ring.release(ref)
+    assert ring.in_use() == 0
+    with pytest.raises(LookupError):
+        ring.retain(ref)
+
+
+def test_only_the_writer_writes(ring):
+    _, ring = ring
+    FrameRing.attach(ring.spec(), writer=True).close()
+    with pytest.raises(RuntimeError):
+        ring.write(frame(1))
@@ -0,0 +1,68 @@
+"""
+Original vs ONNX backends on the same frames, within export_onnx's parity
+tolerances: plate box IoU, the OCR character error rate and confidence of
+both recognizers on the same crop, and classifier probabilities. Skipped
+unless the original models, the exported FP32 ONNX models and both
+runtimes are available. Frames come from ONNX_PARITY_IMAGES (a directory
+of real images) when set, else from the benchmark's synthetic plate
+generator.
+"""
+import os
+
+import cv2
+import pytest
+
+import config
+import export_onnx
+from recognition import onnx_backend
+
+SYNTHETIC_FRAMES = 20
+
+for module in ("onnxruntime", "ultralytics", "easyocr", "tensorflow", "tf_keras"):
+    pytest.importorskip(module)
+
+REQUIRED_FILES = [
+    config.PLATE_DETECTION_MODEL,
+    config.COLOR_MODEL_PATH,
+    config.MAKE_MODEL_PATH,
+] + [onnx_backend.model_path(name, int8=False) for name in (
+    onnx_backend.PLATE_MODEL, onnx_backend.OCR_MODEL, onnx_backend.CLASSIFIER_MODEL,
+)]
+missing = [path for path in REQUIRED_FILES if not os.path.exists(path)]
+if missing:
+    pytest.skip("model files missing: %s" % ", ".join(missing), allow_module_level=True)
+
+
+def load_frames():
+    image_dir = os.getenv("ONNX_PARITY_IMAGES")
+    if image_dir:
+        paths = sorted(
+            os.path.join(image_dir, name) for name in os.listdir(image_dir)
+            if name.lower().endswith(export_onnx.IMAGE_EXTENSIONS)
+        )
+        return [(os.path.basename(path), cv2.imread(path)) for path in paths]
+
+    from benchmark import SyntheticPlates
+
+    gen = SyntheticPlates(seed=0)
+    return [
+        (f"synthetic-{i}-{text}", gen.render_frame(text, **degrade))
+        for i, (text, degrade) in enumerate(gen.samples(SYNTHETIC_FRAMES))
+    ]
+
+
+@pytest.fixture(scope="module")
+def models():
+    detectors, ocr, classifiers = export_onnx.load_parity_models(int8=False)
+    # A backend that failed to load silently falls back; that is not parity
+    assert all(d.use_yolo for d in detectors)
+    assert ocr[1].reader is not None
+    assert classifiers[0]._fused is not None and classifiers[1]._onnx is not None
+    return detectors, ocr, classifiers
+
+
+@pytest.mark.parametrize("name, frame", load_frames())
+def test_backends_agree(models, name, frame):
+    assert frame is not None, f"{name} could not be read"
+    result = export_onnx.compare_backends(frame, *models)
+    assert export_onnx.parity_failures(result) == []
@@ -0,0 +1,88 @@
+"""
+FuzzyPlateMatcher and VectorPlateScorer against a linear scan with
+`calculate_similarity`, the reference, over random adds, removals and
+re-adds. Plates are drawn from a small alphabet rich in OCR confusions so
+that many of them tie.
+"""
+import random
+
+import pytest
+
+from plate_matching import FuzzyPlateMatcher, VectorPlateScorer, calculate_similarity
+
+ALPHABET = "ABDOQ08S5Z2IL1"
+THRESHOLD = 0.75
+STEPS = 600
+
+
+def random_plate(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 9)))
+
+
+def scan(plates, read, threshold=THRESHOLD):
+    """All (key, score) above the threshold, best first, ties in insertion order."""
+    scored = [(key, calculate_similarity(read, plate)) for key, plate in plates.items()]
+    return sorted((item for item in scored if item[1] > threshold), key=lambda item: -item[1])
+
+
+def check(matcher, plates, read):
+    ranked = scan(plates, read)
+    expected = ranked[0] if ranked else (None, 0)
+    assert matcher.match(read) == pytest.approx(expected), read
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("matcher_class", [FuzzyPlateMatcher, VectorPlateScorer])
+def test_matches_linear_scan(matcher_class, seed):
+    rng = random.Random(seed)
+    matcher = matcher_class(threshold=THRESHOLD)
+    plates = {}  # Insertion order, as a scan over the fleet sees it
+    keys = list(range(120))
+
+    for _ in range(STEPS):
+        key = rng.choice(keys)
+        action = rng.random()
+        if action < 0.55:
+            # A re-add moves the plate to the end, like a fresh row
+            plates.pop(key, None)
+            plates[key] = random_plate(rng)
+            matcher.add(key, plates[key])
+        elif action < 0.8:
+            plates.pop(key, None)
+            matcher.remove(key)
+        else:
+            check(matcher, plates, random_plate(rng))
+
+    assert len(matcher) == len(plates)
+    for plate in list(plates.values())[:50]:
+        check(matcher, plates, plate)
+
+
+def test_top_k_breaks_ties_by_insertion_order():
+    scorer = VectorPlateScorer(threshold=THRESHOLD)
+    for key in range(400):
+        scorer.add(key, "ABCDEF" + "0123456789"[key % 10] + "X")
+    ranked = scan({key: "ABCDEF" + "0123456789"[key % 10] + "X" for key in range(400)}, "ABCDEFZX")
+    assert scorer.top_k("ABCDEFZX", k=5) == ranked[:5]
+    assert scorer.match("ABCDEFZX") == ranked[0]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_top_k_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    scorer = VectorPlateScorer(threshold=THRESHOLD)
+    plates = {}
+    for key in range(300):
+        plates[key] = random_plate(rng)
+        scorer.add(key, plates[key])
+    for key in rng.sample(range(300), 150):
+        del plates[key]
+        scorer.remove(key)
+    for key in range(300, 350):
+        plates[key] = random_plate(rng)
+        scorer.add(key, plates[key])
+
+    for _ in range(100):
+        read = random_plate(rng)
+        k = rng.randint(1, 8)
+        assert scorer.top_k(read, k=k) == pytest.approx(scan(plates, read)[:k])
@@ -0,0 +1,33 @@
+"""PlateTracker handling of plates whose crops never pass the quality gate."""
+from recognition.plate_tracker import PlateTracker
+
+BOX = (0, 0, 120, 30, 0.9)
+
+
+def test_unusable_crops_are_read_after_max_deferrals():
+    tracker = PlateTracker(max_deferrals=3)
+    deferred = []
+    for _ in range(8):
+        to_ocr, _ = tracker.update([BOX], None)
+        deferred.extend(tracker.defer_ocr(track.track_id) for track in to_ocr)
+    # Three frames wait for a better crop, the fourth is read anyway
+    assert deferred == [True, True, True, False]
+
+
+def test_track_with_only_unusable_crops_is_finished():
+    tracker = PlateTracker(max_missed=1, max_deferrals=5)
+    to_ocr, _ = tracker.update([BOX], None)
+    tracker.defer_ocr(to_ocr[0].track_id)
+
+    finished = []
+    for _ in range(3):
+        finished.extend(tracker.update([], None)[1])
+    assert len(finished) == 1
+    assert finished[0].readings == 0 and finished[0].fused_text() == ""
+
+
+def test_track_without_readings_or_deferrals_is_not_finished():
+    tracker = PlateTracker(max_missed=1)
+    to_ocr, _ = tracker.update([BOX], None)
+    assert to_ocr
+    assert [tracker.update([], None)[1] for _ in range(3)] == [[], [], []]
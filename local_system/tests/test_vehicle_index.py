@@ -0,0 +1,39 @@
+"""VehicleIndex reloads that race with realtime change events."""
+from vehicle_index import VehicleIndex
+
+
+def row(vehicle_id, plate):
+    return {'id': vehicle_id, 'plate_number': plate}
+
+
+def test_reload_keeps_changes_made_during_the_fetch():
+    index = VehicleIndex()
+    index.load([row(1, "ABC123"), row(2, "XYZ789")])
+
+    since = index.sequence
+    snapshot = [row(1, "ABC123"), row(2, "XYZ789")]  # fetched before the events below
+    index.upsert(row(3, "NEW111"))
+    index.upsert(row(1, "ABC124"))
+    index.remove({'id': 2})
+    index.load(snapshot, since=since)
+
+    assert sorted(v['plate_number'] for v in index.vehicles()) == ["ABC124", "NEW111"]
+    assert index.get("XYZ789") is None and index.get("ABC123") is None
+
+
+def test_reload_replaces_changes_made_before_the_fetch():
+    index = VehicleIndex()
+    index.load([row(1, "ABC123")])
+    index.upsert(row(2, "OLD222"))
+
+    since = index.sequence
+    index.load([row(1, "ABC123")], since=since)  # the snapshot no longer has vehicle 2
+
+    assert [v['plate_number'] for v in index.vehicles()] == ["ABC123"]
+
+
+def test_load_without_since_is_a_full_replace():
+    index = VehicleIndex()
+    index.upsert(row(1, "ABC123"))
+    index.load([row(2, "XYZ789")])
+    assert [v['plate_number'] for v in index.vehicles()] == ["XYZ789"]
@@ -1,8 +1,105 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
 from threading import Thread
+import queue
+import threading
 import time
 
+import cv2
+
+import config
+
+
+class FramePresenter:
+    """
+    Shows the newest BGR frame in a Tk label at no more than `max_fps`.
+
+    `submit()` may be called from any thread at camera rate; frames arriving
+    faster than the cap are skipped. Downscaling and colour conversion run on
+    the presenter's own thread, and the Tk thread only pastes the result into
+    one reused PhotoImage (a new one is made only when the size changes).
+    """
+
+    def __init__(self, root, label, size=None, max_fps=None):
+        self.root = root
+        self.label = label
+        self.size = size or config.UI_PREVIEW_SIZE
+        self.interval = 1.0 / (max_fps or config.UI_PREVIEW_FPS)
+        self.shown = 0
+        self.skipped = 0
+        self._pending = None  # (generation, frame) waiting to be scaled
+        self._ready = None  # Scaled PIL image waiting for the Tk thread
+        self._generation = 0  # Bumped by clear() so in-flight frames are not shown
+        self._last_submit = 0.0
+        self._photo = None
+        self._cond = threading.Condition()
+        Thread(target=self._scale_loop, name="ui-presenter", daemon=True).start()
+        self._schedule()
+
+    def submit(self, frame, force=False):
+        """Queues `frame` for display; `force` bypasses the rate cap (single images)."""
+        now = time.monotonic()
+        with self._cond:
+            if not force and now - self._last_submit < self.interval:
+                self.skipped += 1
+                return
+            self._last_submit = now
+            self._pending = (self._generation, frame)
+            self._cond.notify()
+
+    def clear(self):
+        """Drops queued frames; call from the Tk thread."""
+        with self._cond:
+            self._generation += 1
+            self._pending = None
+            self._ready = None
+        self._photo = None
+
+    def _scale_loop(self):
+        from PIL import Image
+
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                generation, frame = self._pending
+                self._pending = None
+            image = Image.fromarray(cv2.cvtColor(self._fit(frame), cv2.COLOR_BGR2RGB))
+            with self._cond:
+                if generation == self._generation:
+                    self._ready = image
+
+    def _fit(self, frame):
+        # Same bounds as PIL's thumbnail: keep the aspect ratio, never upscale
+        height, width = frame.shape[:2]
+        scale = min(self.size[0] / width, self.size[1] / height, 1.0)
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _tick(self):
+        with self._cond:
+            image, self._ready = self._ready, None
+        if image is not None:
+            self._show(image)
+        self._schedule()
+
+    def _show(self, image):
+        from PIL import ImageTk
+
+        if self._photo is not None and (self._photo.width(), self._photo.height()) == image.size:
+            self._photo.paste(image)
+        else:
+            self._photo = ImageTk.PhotoImage(image)
+            self.label.config(image=self._photo, text="")
+            self.label.image = self._photo  # Keep reference
+        self.shown += 1
+
+    def _schedule(self):
+        self.root.after(max(1, int(self.interval * 1000)), self._tick)
+
+
 class GateUI:
     def __init__(self, root, on_reset_callback=None):
         self.root = root
@@ -28,7 +125,17 @@ class GateUI:
             bg="#16213e",
             fg="#00d4ff"
         )
-        self.header.pack(pady=20)
+        self.header.pack(pady=(12, 0))
+        
+        # Model loading / readiness indicator
+        self.lbl_status = tk.Label(
+            header_frame,
+            text="Loading models…",
+            font=("Segoe UI", 10),
+            bg="#16213e",
+            fg="#ffa500"
+        )
+        self.lbl_status.pack()
         
         # Main container with left and right panels
         main_container = tk.Frame(root, bg="#1a1a2e")
@@ -123,17 +230,35 @@ class GateUI:
         )
         self.btn_reset.pack(pady=10)
         
-    def update_image(self, pil_image):
-        """Update the displayed vehicle image"""
-        from PIL import ImageTk
+        # Live preview and operator prompts; both are safe to feed from worker threads
+        self.presenter = FramePresenter(root, self.lbl_image)
+        self._manual_requests = queue.Queue()
+        self.root.after(100, self._poll_manual_requests)
+        
+    def show_frame(self, frame, force=False):
+        """Shows a BGR frame through the rate-capped presenter (any thread)."""
+        self.presenter.submit(frame, force)
         
-        # Resize image to fit the panel while maintaining aspect ratio
-        pil_image.thumbnail((480, 400))
+    def request_manual_entry(self, on_result, prompt="Please enter the plate number manually:"):
+        """
+        Asks the operator for a plate without blocking the caller (any thread).
+        `on_result(plate or None)` runs on the Tk thread once they answer.
+        """
+        self._manual_requests.put((prompt, on_result))
         
-        tk_image = ImageTk.PhotoImage(pil_image)
+    def _poll_manual_requests(self):
+        try:
+            prompt, on_result = self._manual_requests.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            answer = simpledialog.askstring("Manual Plate Entry", prompt, parent=self.root)
+            on_result(answer.strip().upper() if answer and answer.strip() else None)
+        self.root.after(100, self._poll_manual_requests)
         
-        self.lbl_image.config(image=tk_image, text="")
-        self.lbl_image.image = tk_image  # Keep reference
+    def set_status(self, text, ready=False):
+        """Update the model readiness indicator in the header"""
+        self.lbl_status.config(text=text, fg="#00ff00" if ready else "#ffa500")
         
     def update_info(self, plate, color, model, status, access_granted, color_warning=False):
         # Update plate number
@@ -184,6 +309,7 @@ class GateUI:
         self.lbl_model.config(text="Vehicle Model: --")
         self.lbl_gate_status.config(text="GATE: STANDBY", fg="#ffa500")
         self.lbl_warning.config(text="")
+        self.presenter.clear()
         self.lbl_image.config(image="", text="📷\n\nNo Image Loaded")
         self.root.configure(bg="#1a1a2e")
         self.info_frame.configure(bg="#1a1a2e")
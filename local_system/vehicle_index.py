@@ -0,0 +1,146 @@
+import threading
+import config
+from plate_matching import FuzzyPlateMatcher, VectorPlateScorer, canonical_plate
+
+
+def normalize_plate(plate):
+    """Strips whitespace and upper-cases a plate so reads and registrations compare equal."""
+    if not plate:
+        return ""
+    return "".join(plate.split()).upper()
+
+
+def create_matcher():
+    """The fuzzy matcher selected by FUZZY_MATCH_BACKEND."""
+    if config.FUZZY_MATCH_BACKEND == "vector":
+        return VectorPlateScorer(config.FUZZY_MATCH_THRESHOLD)
+    return FuzzyPlateMatcher(config.FUZZY_MATCH_THRESHOLD)
+
+
+class VehicleIndex:
+    """
+    In-process copy of the `vehicles` table keyed by normalized plate.
+
+    Loaded once from Supabase and then kept current by applying change
+    events, so gate decisions never need a network round trip. Every
+    change bumps `sequence`; a snapshot fetched while changes arrive is
+    loaded with `since` set to the sequence read before the fetch, so
+    those changes survive the reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_plate = {}
+        self._by_canonical = {}
+        self._matcher = create_matcher()
+        self.loaded = False
+        self.watermark = None
+        self.sequence = 0
+        self._changes = {}  # vehicle id -> (sequence, row or None when deleted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+    def load(self, rows, since=None):
+        """
+        Replaces the whole index with a fresh snapshot of the table. With
+        `since`, changes applied after that sequence are replayed on top,
+        as the snapshot may predate them.
+        """
+        with self._lock:
+            replay = [] if since is None else [
+                (vehicle_id, row) for vehicle_id, (seq, row) in self._changes.items() if seq > since
+            ]
+            self._by_id = {}
+            self._by_plate = {}
+            self._by_canonical = {}
+            self._matcher = create_matcher()
+            self.watermark = None
+            for row in rows:
+                self._insert(row)
+            for vehicle_id, row in replay:
+                self._delete(vehicle_id)
+                if row is not None:
+                    self._insert(row)
+            self._changes = {}
+            self.loaded = True
+
+    def upsert(self, row):
+        """Inserts a new vehicle or replaces the existing row with the same id."""
+        with self._lock:
+            if row.get('id') in self._by_id:
+                self._delete(row['id'])
+            self._insert(row)
+            self._record(row.get('id'), row)
+
+    def remove(self, row):
+        """Removes a vehicle. Only the primary key is needed (DELETE events carry just `id`)."""
+        with self._lock:
+            self._delete(row.get('id'))
+            self._record(row.get('id'), None)
+
+    def get(self, plate):
+        """Returns the vehicle registered under `plate` (any spacing/case), or None."""
+        with self._lock:
+            return self._by_plate.get(normalize_plate(plate))
+
+    def canonical_candidates(self, plate):
+        """
+        Returns every vehicle whose plate is OCR-equivalent to `plate` at each
+        position (same confusion-class canonical form), in insertion order.
+        """
+        with self._lock:
+            return list(self._by_canonical.get(canonical_plate(normalize_plate(plate)), ()))
+
+    def fuzzy_match(self, plate):
+        """
+        Returns (vehicle, score) for the registered plate most OCR-similar to
+        `plate` above FUZZY_MATCH_THRESHOLD, or (None, 0).
+        """
+        with self._lock:
+            vehicle_id, score = self._matcher.match(normalize_plate(plate))
+            if vehicle_id is None:
+                return None, 0
+            return self._by_id[vehicle_id], score
+
+    def vehicles(self):
+        """Snapshot of all vehicle rows in insertion order."""
+        with self._lock:
+            return list(self._by_id.values())
+
+    def _record(self, vehicle_id, row):
+        if vehicle_id is None:
+            return
+        self.sequence += 1
+        self._changes[vehicle_id] = (self.sequence, row)
+
+    def _insert(self, row):
+        vehicle_id = row.get('id')
+        if vehicle_id is None:
+            return
+        self._by_id[vehicle_id] = row
+        plate = normalize_plate(row.get('plate_number', ''))
+        self._by_plate[plate] = row
+        self._by_canonical.setdefault(canonical_plate(plate), []).append(row)
+        self._matcher.add(vehicle_id, plate)
+
+        created_at = row.get('created_at')
+        if created_at and (self.watermark is None or created_at > self.watermark):
+            self.watermark = created_at
+
+    def _delete(self, vehicle_id):
+        row = self._by_id.pop(vehicle_id, None)
+        if row is None:
+            return
+        self._matcher.remove(vehicle_id)
+        plate = normalize_plate(row.get('plate_number', ''))
+        if self._by_plate.get(plate) is row:
+            del self._by_plate[plate]
+
+        canonical = canonical_plate(plate)
+        bucket = self._by_canonical.get(canonical, [])
+        self._by_canonical[canonical] = [v for v in bucket if v is not row]
+        if not self._by_canonical[canonical]:
+            del self._by_canonical[canonical]
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from vehicle_index import normalize_plate
+
+logger = logging.getLogger(__name__)
+
+
+class VehicleMirror:
+    """
+    On-disk copy of the `vehicles` table (SQLite, WAL mode).
+
+    Every change applied to the in-memory index is written here first, so
+    a restart can load the fleet from disk without waiting for Supabase and
+    decisions stay correct while it is unreachable. Rows are kept as JSON
+    next to an indexed normalized-plate column for direct lookups.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def load(self):
+        """All mirrored vehicle rows, in the order they were registered."""
+        with self._lock:
+            rows = self._connection().execute("SELECT row FROM vehicles ORDER BY seq").fetchall()
+        return [json.loads(row) for row, in rows]
+
+    def get(self, plate):
+        """The mirrored row registered under `plate` (any spacing/case), or None."""
+        with self._lock:
+            found = self._connection().execute(
+                "SELECT row FROM vehicles WHERE plate = ? ORDER BY seq LIMIT 1", (normalize_plate(plate),)
+            ).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def replace_all(self, rows):
+        """Replaces the mirror with a full snapshot of the table, atomically."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM vehicles")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO vehicles (id, plate, row) VALUES (?, ?, ?)",
+                    [self._params(row) for row in rows if row.get('id') is not None],
+                )
+
+    def upsert(self, row):
+        if row.get('id') is None:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM vehicles WHERE id = ?", (str(row['id']),))
+                conn.execute("INSERT INTO vehicles (id, plate, row) VALUES (?, ?, ?)", self._params(row))
+
+    def remove(self, row):
+        """Removes a vehicle by primary key (DELETE events carry just `id`)."""
+        if row.get('id') is None:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM vehicles WHERE id = ?", (str(row['id']),))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _params(row):
+        # ids are stored as text so any primary key type round-trips
+        return str(row['id']), normalize_plate(row.get('plate_number', '')), json.dumps(row)
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Realtime and catch-up threads write; every use holds self._lock
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vehicles ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, "
+                "plate TEXT NOT NULL, row TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS vehicles_plate ON vehicles (plate)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
@@ -17,3 +17,22 @@ create policy "Enable all access for all users" on public.vehicles
 
 -- Create Realtime publication
 alter publication supabase_realtime add table public.vehicles;
+
+-- Create table for gate access attempts (written in batches by local_system)
+create table if not exists public.access_logs (
+  id serial primary key,
+  timestamp timestamp default now(),
+  plate_number varchar(20),
+  detected_color varchar(50),
+  detected_model varchar(100),
+  plate_matched boolean,
+  color_matched boolean,
+  debug_event_id varchar(32) -- set only when debug capture is enabled
+);
+
+-- Migration for databases created before debug capture: without this column
+-- every access log insert that carries a debug event id is rejected
+alter table public.access_logs add column if not exists debug_event_id varchar(32);
+
+-- Tell PostgREST about the new column without waiting for its schema cache
+notify pgrst, 'reload schema';